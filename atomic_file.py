@@ -0,0 +1,50 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2014 Andrew Leaver-Fay, Tim Jacobs, Hayretin Yumerefendi, Brian Kuhlman.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+#     in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+# Atomic replacement of the files shared between runs (the degenerate-codon table,
+# position cache entries and checkpoints): the contents are written to a temporary
+# file in the same directory, which is then renamed over the destination, so that
+# a reader, or a run killed part way through the write, never sees a partial file.
+
+import os
+import tempfile
+
+def write_atomically( fname, write, binary=False, fsync=False ) :
+    '''
+    Replace fname with the contents written by write( f ), f being a file open for writing (in binary
+    mode if binary is True).  With fsync, the contents are on disk before fname is replaced.  The
+    temporary file is removed if anything goes wrong, and the error is raised.
+    '''
+    dirname = os.path.dirname( os.path.abspath( fname ) )
+    fd, tmpname = tempfile.mkstemp( dir=dirname, prefix="." + os.path.basename( fname ) + "." )
+    try :
+        with os.fdopen( fd, "wb" if binary else "w" ) as f :
+            write( f )
+            if fsync :
+                f.flush()
+                os.fsync( f.fileno() )
+        os.chmod( tmpname, 0o644 )
+        os.replace( tmpname, fname )
+    except :
+        if os.path.exists( tmpname ) :
+            os.remove( tmpname )
+        raise
@@ -0,0 +1,66 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2014 Andrew Leaver-Fay, Tim Jacobs, Hayretin Yumerefendi, Brian Kuhlman.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+#     in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+# Checkpoints of a running AALibrary.compute_smallest_diversity_for_all_errors, so
+# that a long run can be resumed after it is killed.  A checkpoint is a JSON file
+# holding
+#   - run_key: identifies the search (see AALibrary.checkpoint_run_key); a checkpoint
+#     written for a different library or different options is never resumed
+#   - completed: the dc_results (see AALibrary.dc_combinations) of every position
+#     finished so far, keyed by position
+#   - in_progress: null, or the cursor into a position being searched exhaustively:
+#     its position, the engine results for the numbers of DCs already finished, the
+#     number of DCs being searched, the rank (see combination_search.CombinationIterator)
+#     of the next combination to visit and the [ best_diversity, best_rank, best_combo ]
+#     minima over the combinations visited so far
+# Every write replaces the file atomically, so a run killed mid-write leaves the
+# previous checkpoint intact.
+
+import atomic_file
+import json
+
+checkpoint_format_version = 1
+
+class CheckpointMismatch( Exception ) :
+    pass
+
+def read_checkpoint( fname, run_key ) :
+    '''
+    The checkpoint stored in fname, or None if there is none; raises CheckpointMismatch
+    if it was written for a different run
+    '''
+    try :
+        with open( fname ) as f :
+            state = json.load( f )
+    except ( IOError, OSError ) :
+        return None
+    if state.get( "version" ) != checkpoint_format_version or state.get( "run_key" ) != run_key :
+        raise CheckpointMismatch( "checkpoint %s was written for a different library or different options" % fname )
+    state[ "completed" ] = dict( [ ( int( pos ), dc_results ) for pos, dc_results in state[ "completed" ].items() ] )
+    return state
+
+def write_checkpoint( fname, run_key, completed, in_progress=None ) :
+    '''Replace the checkpoint in fname atomically, its contents on disk before it replaces the old one'''
+    state = { "version" : checkpoint_format_version, "run_key" : run_key,
+              "completed" : completed, "in_progress" : in_progress }
+    atomic_file.write_atomically( fname, lambda f : json.dump( state, f ), fsync=True )
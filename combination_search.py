@@ -0,0 +1,766 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2014 Andrew Leaver-Fay, Tim Jacobs, Hayretin Yumerefendi, Brian Kuhlman.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+#     in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+# Engines for finding, at a single position, the smallest-diversity combination of
+# n_dcs useful degenerate codons for every error level.
+#
+# Every engine takes
+#   masks       -- the 21-bit amino-acid mask of each useful codon
+#   diversities -- the (integer) diversity of each useful codon
+#   evaluator   -- the position's PositionErrorEvaluator
+#   n_dcs       -- the number of distinct useful codons to combine
+#   n_errors    -- the number of error levels, i.e. max_per_position_error+1
+#   codon_masks -- optionally, the 64-bit mask of the codons each useful codon expands to; when
+#                  given, the diversity of a combination is the number of distinct codons it
+#                  expands to (the popcount of the union of its codon masks) rather than the
+#                  sum of its codons' diversities, so codons shared between DCs count once
+# and returns two lists indexed by error level: the smallest diversity (0 if no
+# combination produces that error) and the combination that first achieves it,
+# as a tuple of increasing indices into masks.  Among equally diverse combinations
+# the lexicographically first one is kept, so all engines return identical results.
+# Engines in all_level_engines take max_dcs instead of n_dcs and return the pair
+# of lists for every n_dcs up to max_dcs.
+
+import jit_kernels
+import numpy
+import time
+
+# bump whenever a change to an engine can change the combination it reports for some error
+# level, which one of several equally diverse combinations included; part of the position_cache key
+engine_version = 1
+
+def popcount16_table() :
+    popcount16 = [ 0 ]
+    for bit in range( 16 ) :
+        popcount16 += [ x + 1 for x in popcount16 ]
+    return popcount16
+
+# codon masks are popcounted 16 bits at a time
+popcount16 = popcount16_table()
+
+def popcount( codon_mask ) :
+    return popcount16[ codon_mask & 65535 ] + popcount16[ ( codon_mask >> 16 ) & 65535 ] + \
+        popcount16[ ( codon_mask >> 32 ) & 65535 ] + popcount16[ codon_mask >> 48 ]
+
+def n_combinations( n, k ) :
+    '''C( n, k ), the number of ways to choose k of n things'''
+    if k < 0 or k > n :
+        return 0
+    k = min( k, n - k )
+    count = 1
+    for i in range( k ) :
+        count = count * ( n - i ) // ( i + 1 )
+    return count
+
+class CombinationIterator :
+    '''
+    Iterates over the increasing n_chosen-tuples drawn from range( n ) in lexicographical order,
+    the same order as LexicographicalIterator's upper_diagonal_increment, but where index and
+    set_from_index give a combination's rank in that order (in the combinatorial number system)
+    so that the C( n, n_chosen ) combinations can be split into contiguous ranges of ranks.
+    '''
+    def __init__( self, n, n_chosen ) :
+        self.n = n
+        self.size = n_chosen
+        self.search_space_size = n_combinations( n, n_chosen )
+        self.pos = list( range( n_chosen ) )
+        self.at_end = self.search_space_size == 0
+
+    def increment( self ) :
+        i = self.size - 1
+        while i >= 0 and self.pos[ i ] == self.n - self.size + i :
+            i -= 1
+        if i < 0 :
+            self.at_end = True
+            return False
+        self.pos[ i ] += 1
+        for k in range( i+1, self.size ) :
+            self.pos[ k ] = self.pos[ k-1 ] + 1
+        return True
+
+    def reset( self ) :
+        for i in range( self.size ) : self.pos[ i ] = i
+        self.at_end = self.search_space_size == 0
+
+    def index( self ) :
+        ''' return the rank of the current combination'''
+        rank = 0
+        first = 0
+        for i in range( self.size ) :
+            # the combinations that agree up to i but have a smaller value there come first
+            for value in range( first, self.pos[ i ] ) :
+                rank += n_combinations( self.n - 1 - value, self.size - 1 - i )
+            first = self.pos[ i ] + 1
+        return rank
+
+    def set_from_index( self, rank ) :
+        ''' set the current combination from its rank'''
+        value = 0
+        for i in range( self.size ) :
+            count = n_combinations( self.n - 1 - value, self.size - 1 - i )
+            while rank >= count :
+                rank -= count
+                value += 1
+                count = n_combinations( self.n - 1 - value, self.size - 1 - i )
+            self.pos[ i ] = value
+            value += 1
+        self.at_end = False
+
+def rank_ranges( n_ranks, n_ranges ) :
+    '''Split range( n_ranks ) into at most n_ranges contiguous ( begin, end ) ranges of nearly equal size'''
+    n_ranges = max( 1, min( n_ranges, n_ranks ) )
+    return [ ( n_ranks * r // n_ranges, n_ranks * ( r + 1 ) // n_ranges ) for r in range( n_ranges ) ]
+
+def exhaustive_search( masks, diversities, evaluator, n_dcs, n_errors, codon_masks=None ) :
+    '''
+    Visit all C( len(masks), n_dcs ) combinations in lexicographical order.  The union mask and
+    diversity of every prefix of the current combination are cached, so advancing the last index
+    costs one OR and one add, and a prefix is only recomputed from the depth that changed.
+    With codon_masks, the prefix codon union is cached in place of the prefix diversity.
+    '''
+    best_diversity, best_rank, best_combo = exhaustive_search_ranks( masks, diversities, evaluator, n_dcs, n_errors,
+                                                                     0, n_combinations( len( masks ), n_dcs ), codon_masks )
+    return best_diversity, best_combo
+
+def exhaustive_search_ranks( masks, diversities, evaluator, n_dcs, n_errors, begin, end, codon_masks=None ) :
+    '''
+    exhaustive_search over only the combinations whose ranks (see CombinationIterator) lie in
+    [ begin, end ); also returns the rank of each best combination so that the results for
+    several ranges can be combined with merge_ranked_results.
+    '''
+    n = len( masks )
+    best_diversity = [ 0 ] * n_errors
+    best_rank = [ None ] * n_errors
+    best_combo = [ None ] * n_errors
+    if n_dcs == 0 or n < n_dcs or begin >= end :
+        return best_diversity, best_rank, best_combo
+    low_errors = evaluator.low_errors
+    high_errors = evaluator.high_errors
+
+    last = n_dcs - 1
+    lex = CombinationIterator( n, n_dcs )
+    lex.set_from_index( begin )
+    combo = lex.pos
+    rank = begin
+    prefix_masks = [ 0 ] * n_dcs
+    prefix_diversities = [ 0 ] * n_dcs
+    for d in range( last ) :
+        prefix_masks[ d+1 ] = prefix_masks[ d ] | masks[ combo[ d ] ]
+        if codon_masks is None :
+            prefix_diversities[ d+1 ] = prefix_diversities[ d ] + diversities[ combo[ d ] ]
+        else :
+            prefix_diversities[ d+1 ] = prefix_diversities[ d ] | codon_masks[ combo[ d ] ]
+
+    while True :
+        # the combinations that differ only in their last index have consecutive ranks
+        prefix_mask = prefix_masks[ last ]
+        prefix_diversity = prefix_diversities[ last ]
+        first_k = combo[ last ]
+        end_k = min( n, first_k + end - rank )
+        if codon_masks is None :
+            for k in range( first_k, end_k ) :
+                aa_mask = prefix_mask | masks[ k ]
+                error = low_errors[ aa_mask & 2047 ] + high_errors[ aa_mask >> 11 ]
+                if 0 <= error < n_errors :
+                    diversity = prefix_diversity + diversities[ k ]
+                    if best_diversity[ error ] == 0 or diversity < best_diversity[ error ] :
+                        best_diversity[ error ] = diversity
+                        best_rank[ error ] = rank + k - first_k
+                        best_combo[ error ] = tuple( combo[ :last ] ) + ( k, )
+        else :
+            for k in range( first_k, end_k ) :
+                aa_mask = prefix_mask | masks[ k ]
+                error = low_errors[ aa_mask & 2047 ] + high_errors[ aa_mask >> 11 ]
+                if 0 <= error < n_errors :
+                    union = prefix_diversity | codon_masks[ k ]
+                    diversity = popcount16[ union & 65535 ] + popcount16[ ( union >> 16 ) & 65535 ] + \
+                        popcount16[ ( union >> 32 ) & 65535 ] + popcount16[ union >> 48 ]
+                    if best_diversity[ error ] == 0 or diversity < best_diversity[ error ] :
+                        best_diversity[ error ] = diversity
+                        best_rank[ error ] = rank + k - first_k
+                        best_combo[ error ] = tuple( combo[ :last ] ) + ( k, )
+        rank += end_k - first_k
+        if rank >= end :
+            break
+
+        # advance the rightmost index before the last one that has room to move
+        d = last - 1
+        while d >= 0 and combo[ d ] == n - n_dcs + d :
+            d -= 1
+        if d < 0 :
+            break
+        combo[ d ] += 1
+        for t in range( d + 1, n_dcs ) :
+            combo[ t ] = combo[ t-1 ] + 1
+        for t in range( d, last ) :
+            prefix_masks[ t+1 ] = prefix_masks[ t ] | masks[ combo[ t ] ]
+            if codon_masks is None :
+                prefix_diversities[ t+1 ] = prefix_diversities[ t ] + diversities[ combo[ t ] ]
+            else :
+                prefix_diversities[ t+1 ] = prefix_diversities[ t ] | codon_masks[ combo[ t ] ]
+    return best_diversity, best_rank, best_combo
+
+def merge_ranked_results_keeping_ranks( ranked_results, n_errors ) :
+    '''
+    Combine the ( best_diversity, best_rank, best_combo ) triples from exhaustive_search_ranks over
+    disjoint ranges: the smallest diversity wins and ties go to the smaller rank, i.e. to the
+    lexicographically first combination, as they would in a single exhaustive_search
+    '''
+    best_diversity = [ 0 ] * n_errors
+    best_rank = [ None ] * n_errors
+    best_combo = [ None ] * n_errors
+    for diversities, ranks, combos in ranked_results :
+        for error in range( n_errors ) :
+            if diversities[ error ] == 0 : continue
+            if best_diversity[ error ] == 0 or diversities[ error ] < best_diversity[ error ] or \
+                    ( diversities[ error ] == best_diversity[ error ] and ranks[ error ] < best_rank[ error ] ) :
+                best_diversity[ error ] = diversities[ error ]
+                best_rank[ error ] = ranks[ error ]
+                best_combo[ error ] = combos[ error ]
+    return best_diversity, best_rank, best_combo
+
+def merge_ranked_results( ranked_results, n_errors ) :
+    '''merge_ranked_results_keeping_ranks without the ranks, i.e. in the form exhaustive_search returns'''
+    best_diversity, best_rank, best_combo = merge_ranked_results_keeping_ranks( ranked_results, n_errors )
+    return best_diversity, best_combo
+
+def smallest_sums_of_suffixes( diversities, n_dcs ) :
+    '''
+    smallest_sums[ r ][ s ] is the smallest total diversity of r codons chosen from
+    those at indices s and above, or None if there are fewer than r of them
+    '''
+    n = len( diversities )
+    smallest_sums = [ [ 0 ] * ( n + 1 ) ] + [ [ None ] * ( n + 1 ) for r in range( n_dcs ) ]
+    smallest = []
+    for s in range( n - 1, -1, -1 ) :
+        smallest.append( diversities[ s ] )
+        smallest.sort()
+        del smallest[ n_dcs: ]
+        total = 0
+        for r in range( len( smallest ) ) :
+            total += smallest[ r ]
+            smallest_sums[ r + 1 ][ s ] = total
+    return smallest_sums
+
+def reachable_errors( evaluator, aa_mask, available ) :
+    '''
+    A superset of the errors produced by adding any subset of the amino acids in available
+    to aa_mask, as a pair ( smallest error, bitset of offsets from it ), or None if no such
+    set is feasible.  Required amino acids in available must be added and forbidden ones
+    can't be; each remaining amino acid independently adds or removes its count.
+    '''
+    if evaluator.required_mask & ~( aa_mask | available ) :
+        return None
+    forced = aa_mask | ( available & evaluator.required_mask )
+    smallest = evaluator.low_errors[ forced & 2047 ] + evaluator.high_errors[ forced >> 11 ]
+    if smallest >= evaluator.infeasible :
+        return None
+    free = available & ~forced & ~evaluator.forbidden_mask
+    offsets = 1
+    while free :
+        bit = ( free & -free ).bit_length() - 1
+        free &= free - 1
+        delta = evaluator.present_errors[ bit ] - evaluator.absent_errors[ bit ]
+        if delta < 0 :
+            smallest += delta
+            delta = -delta
+        if delta :
+            offsets |= offsets << delta
+    return smallest, offsets
+
+def cannot_improve( lower_bound, smallest, offsets, best_diversity ) :
+    '''True if every error in the reachable set already has a combination no more diverse than lower_bound'''
+    n_errors = len( best_diversity )
+    while offsets :
+        shift = ( offsets & -offsets ).bit_length() - 1
+        smallest += shift
+        offsets >>= shift
+        if smallest >= n_errors :
+            return True
+        if smallest >= 0 and ( best_diversity[ smallest ] == 0 or best_diversity[ smallest ] > lower_bound ) :
+            return False
+        offsets >>= 1
+        smallest += 1
+    return True
+
+# only try to prune subtrees that hold at least this many combinations
+min_combinations_to_bound = 64
+
+def branch_and_bound_search( masks, diversities, evaluator, n_dcs, n_errors, codon_masks=None ) :
+    '''
+    Depth-first walk over the combinations in lexicographical order that skips every subtree
+    whose diversity lower bound is no better than the current best diversity at each error
+    level the subtree could reach.  Since ties never replace an earlier combination, the
+    result is identical to exhaustive_search.  With codon_masks, the bound is the larger of
+    the size of the prefix's codon union and the smallest diversity of a remaining codon.
+    '''
+    n = len( masks )
+    best_diversity = [ 0 ] * n_errors
+    best_combo = [ None ] * n_errors
+    if n < n_dcs :
+        return best_diversity, best_combo
+
+    low_errors = evaluator.low_errors
+    high_errors = evaluator.high_errors
+    smallest_sums = smallest_sums_of_suffixes( diversities, n_dcs )
+    available_from = [ 0 ] * ( n + 1 )
+    for s in range( n - 1, -1, -1 ) :
+        available_from[ s ] = available_from[ s + 1 ] | masks[ s ]
+    n_combos = [ [ 0 ] * ( n + 1 ) for r in range( n_dcs + 1 ) ]
+    for s in range( n + 1 ) :
+        n_combos[ 0 ][ s ] = 1
+    for r in range( 1, n_dcs + 1 ) :
+        for s in range( n - 1, -1, -1 ) :
+            n_combos[ r ][ s ] = n_combos[ r ][ s + 1 ] + n_combos[ r - 1 ][ s + 1 ]
+
+    combo = [ 0 ] * n_dcs
+
+    # diversity is the prefix's total diversity, or its codon union when codon_masks is given
+    def extend( depth, start, aa_mask, diversity ) :
+        remaining = n_dcs - depth
+        if n_combos[ remaining ][ start ] >= min_combinations_to_bound :
+            reachable = reachable_errors( evaluator, aa_mask, available_from[ start ] )
+            if reachable is None :
+                return
+            if codon_masks is None :
+                lower_bound = diversity + smallest_sums[ remaining ][ start ]
+            else :
+                lower_bound = max( popcount( diversity ), smallest_sums[ 1 ][ start ] )
+            if cannot_improve( lower_bound, reachable[ 0 ], reachable[ 1 ], best_diversity ) :
+                return
+        if remaining == 1 :
+            for k in range( start, n ) :
+                kmask = aa_mask | masks[ k ]
+                error = low_errors[ kmask & 2047 ] + high_errors[ kmask >> 11 ]
+                if 0 <= error < n_errors :
+                    if codon_masks is None :
+                        kdiversity = diversity + diversities[ k ]
+                    else :
+                        kdiversity = popcount( diversity | codon_masks[ k ] )
+                    if best_diversity[ error ] == 0 or kdiversity < best_diversity[ error ] :
+                        best_diversity[ error ] = kdiversity
+                        combo[ depth ] = k
+                        best_combo[ error ] = tuple( combo )
+            return
+        for k in range( start, n - remaining + 1 ) :
+            combo[ depth ] = k
+            if codon_masks is None :
+                extend( depth + 1, k + 1, aa_mask | masks[ k ], diversity + diversities[ k ] )
+            else :
+                extend( depth + 1, k + 1, aa_mask | masks[ k ], diversity | codon_masks[ k ] )
+
+    extend( 0, 0, 0, 0 )
+    return best_diversity, best_combo
+
+def relevant_aa_mask( evaluator ) :
+    '''The amino acids whose presence or absence changes the error'''
+    relevant = 0
+    for bit in range(21) :
+        if evaluator.present_errors[ bit ] != 0 or evaluator.absent_errors[ bit ] != 0 :
+            relevant |= 1 << bit
+    return relevant
+
+def mask_dp_search_all_levels( masks, diversities, evaluator, max_dcs, n_errors, codon_masks=None ) :
+    '''
+    Dynamic program over union masks that produces the results for every n_dcs from 1 to max_dcs
+    at once.  Codons are added one at a time, 0/1-knapsack style: level j is extended from level
+    j-1 (visiting levels from the top down so no codon is used twice), keeping for each union mask
+    the smallest diversity and, among equally diverse combinations, the lexicographically first.
+    Only amino acids that affect the error are kept in the masks, so the number of states per level
+    is the number of distinct unions of the useful-aa signatures, and each level costs
+    ( distinct unions ) x ( useful codons ).  Returns a list indexed by n_dcs of
+    ( best_diversity, best_combo ) pairs; entry 0 is None.
+    The size of a codon union is not determined by the amino acids it encodes, so with
+    codon_masks each level is instead searched with branch_and_bound_search.
+    '''
+    if codon_masks is not None :
+        return [ None ] + [ branch_and_bound_search( masks, diversities, evaluator, j, n_errors, codon_masks )
+                            for j in range( 1, max_dcs + 1 ) ]
+    relevant = relevant_aa_mask( evaluator )
+    states = [ { 0 : ( 0, () ) } ] + [ {} for j in range( max_dcs ) ]
+    for k in range( len( masks ) ) :
+        kmask = masks[ k ] & relevant
+        kdiversity = diversities[ k ]
+        for j in range( min( k + 1, max_dcs ), 0, -1 ) :
+            level = states[ j ]
+            for aa_mask, ( diversity, combo ) in states[ j - 1 ].items() :
+                new_mask = aa_mask | kmask
+                new_diversity = diversity + kdiversity
+                old = level.get( new_mask )
+                if old is None or new_diversity < old[ 0 ] :
+                    level[ new_mask ] = ( new_diversity, combo + ( k, ) )
+                elif new_diversity == old[ 0 ] :
+                    new_combo = combo + ( k, )
+                    if new_combo < old[ 1 ] :
+                        level[ new_mask ] = ( new_diversity, new_combo )
+
+    results = [ None ]
+    for j in range( 1, max_dcs + 1 ) :
+        best_diversity = [ 0 ] * n_errors
+        best_combo = [ None ] * n_errors
+        for aa_mask, ( diversity, combo ) in states[ j ].items() :
+            error = evaluator.low_errors[ aa_mask & 2047 ] + evaluator.high_errors[ aa_mask >> 11 ]
+            if 0 <= error < n_errors :
+                if best_diversity[ error ] == 0 or diversity < best_diversity[ error ] or \
+                        ( diversity == best_diversity[ error ] and combo < best_combo[ error ] ) :
+                    best_diversity[ error ] = diversity
+                    best_combo[ error ] = combo
+        results.append( ( best_diversity, best_combo ) )
+    return results
+
+def mask_dp_search( masks, diversities, evaluator, n_dcs, n_errors, codon_masks=None ) :
+    '''The results for a single n_dcs from mask_dp_search_all_levels'''
+    if codon_masks is not None :
+        return branch_and_bound_search( masks, diversities, evaluator, n_dcs, n_errors, codon_masks )
+    return mask_dp_search_all_levels( masks, diversities, evaluator, n_dcs, n_errors )[ n_dcs ]
+
+def popcount_array( codon_masks ) :
+    '''popcount of every element of a uint64 array, as int64'''
+    table = numpy.array( popcount16, dtype=numpy.int64 )
+    low = numpy.uint64( 65535 )
+    counts = table[ codon_masks & low ]
+    for shift in ( 16, 32, 48 ) :
+        counts += table[ ( codon_masks >> numpy.uint64( shift ) ) & low ]
+    return counts
+
+# the largest number of ( prefix, codon ) pairs batched_search scores at once
+batch_size = 1 << 18
+
+def batched_search( masks, diversities, evaluator, n_dcs, n_errors, codon_masks=None ) :
+    '''
+    NumPy engine for one, two or three DCs.  Prefixes of n_dcs-1 codons are generated in
+    lexicographical order in batches, OR-ed against every codon with a larger index by
+    broadcasting and scored with the evaluator's tables; each batch is reduced to its
+    smallest diversity per error level by sorting, and a batch only replaces an earlier
+    one's result if it is strictly less diverse.  Memory is bounded by batch_size.
+    With codon_masks, prefixes carry their uint64 codon unions in place of their diversities.
+    Other values of n_dcs are handed to exhaustive_search.
+    '''
+    if n_dcs > 3 :
+        return exhaustive_search( masks, diversities, evaluator, n_dcs, n_errors, codon_masks )
+    n = len( masks )
+    best_diversity = numpy.zeros( n_errors, dtype=numpy.int64 )
+    best_combo = numpy.zeros( ( n_errors, n_dcs ), dtype=numpy.int64 )
+    if n_dcs == 0 or n < n_dcs :
+        return best_diversity.tolist(), [ None ] * n_errors
+
+    masks = numpy.array( masks, dtype=numpy.int64 )
+    if codon_masks is None :
+        # what a prefix carries for each codon, and how two of them combine
+        diversities = numpy.array( diversities, dtype=numpy.int64 )
+        combine = numpy.add
+    else :
+        diversities = numpy.array( codon_masks, dtype=numpy.uint64 )
+        combine = numpy.bitwise_or
+    low_errors = numpy.array( evaluator.low_errors, dtype=numpy.int64 )
+    high_errors = numpy.array( evaluator.high_errors, dtype=numpy.int64 )
+    codon_inds = numpy.arange( n )
+    rows_per_batch = max( 1, batch_size // n )
+
+    def prefix_batches() :
+        # ( prefix codon indices, prefix union masks, prefix diversities ) in lexicographical order
+        if n_dcs == 1 :
+            yield numpy.zeros( ( 1, 0 ), dtype=numpy.int64 ), numpy.zeros( 1, dtype=numpy.int64 ), numpy.zeros( 1, dtype=diversities.dtype )
+        elif n_dcs == 2 :
+            for start in range( 0, n - 1, rows_per_batch ) :
+                rows = codon_inds[ start : min( n - 1, start + rows_per_batch ) ]
+                yield rows[ :, None ], masks[ rows ], diversities[ rows ]
+        else :
+            # pairs ( i, j ) with i < j < n-1, grouping whole rows of i into a batch when they fit
+            i = 0
+            while i < n - 2 :
+                if n - 2 - i >= rows_per_batch :
+                    for start in range( i + 1, n - 1, rows_per_batch ) :
+                        rows = codon_inds[ start : min( n - 1, start + rows_per_batch ) ]
+                        prefixes = numpy.empty( ( len( rows ), 2 ), dtype=numpy.int64 )
+                        prefixes[ :, 0 ] = i
+                        prefixes[ :, 1 ] = rows
+                        yield prefixes, masks[ i ] | masks[ rows ], combine( diversities[ i ], diversities[ rows ] )
+                    i += 1
+                    continue
+                end = i + 1
+                count = n - 2 - i
+                while end < n - 2 and count + n - 2 - end <= rows_per_batch :
+                    count += n - 2 - end
+                    end += 1
+                firsts, seconds = numpy.nonzero( codon_inds[ None, :n-1 ] > codon_inds[ i:end, None ] )
+                firsts += i
+                yield numpy.column_stack( ( firsts, seconds ) ), masks[ firsts ] | masks[ seconds ], \
+                    combine( diversities[ firsts ], diversities[ seconds ] )
+                i = end
+
+    for prefixes, prefix_masks, prefix_diversities in prefix_batches() :
+        last = prefixes[ :, -1 ] if n_dcs > 1 else numpy.array( [ -1 ] )
+        union = prefix_masks[ :, None ] | masks[ None, : ]
+        errors = low_errors[ union & 2047 ] + high_errors[ union >> 11 ]
+        keep = ( codon_inds[ None, : ] > last[ :, None ] ) & ( errors >= 0 ) & ( errors < n_errors )
+        rows, ks = numpy.nonzero( keep )
+        errors = errors[ rows, ks ]
+        batch_diversities = combine( prefix_diversities[ rows ], diversities[ ks ] )
+        if codon_masks is not None :
+            batch_diversities = popcount_array( batch_diversities )
+
+        # only combinations strictly less diverse than the earlier batches' can matter
+        incumbent = best_diversity[ errors ]
+        better = ( incumbent == 0 ) | ( batch_diversities < incumbent )
+        rows = rows[ better ]
+        ks = ks[ better ]
+        errors = errors[ better ]
+        batch_diversities = batch_diversities[ better ]
+        if len( rows ) == 0 : continue
+
+        # group-min per error; nonzero returns the combinations in lexicographical order
+        order = numpy.lexsort( ( numpy.arange( len( rows ) ), batch_diversities, errors ) )
+        errors = errors[ order ]
+        first = numpy.ones( len( order ), dtype=bool )
+        first[ 1: ] = errors[ 1: ] != errors[ :-1 ]
+        order = order[ first ]
+        errors = errors[ first ]
+        best_diversity[ errors ] = batch_diversities[ order ]
+        best_combo[ errors, :-1 ] = prefixes[ rows[ order ] ]
+        best_combo[ errors, -1 ] = ks[ order ]
+
+    return best_diversity.tolist(), [ tuple( best_combo[ e ].tolist() ) if best_diversity[ e ] else None for e in range( n_errors ) ]
+
+def jit_search( masks, diversities, evaluator, n_dcs, n_errors, codon_masks=None ) :
+    '''
+    exhaustive_search run by the numba-compiled jit_kernels.exhaustive_search_kernel; when numba is
+    not available or jit_kernels.enabled has been turned off, exhaustive_search itself is run.
+    '''
+    n = len( masks )
+    if not jit_kernels.enabled or n_dcs == 0 or n < n_dcs :
+        return exhaustive_search( masks, diversities, evaluator, n_dcs, n_errors, codon_masks )
+    union = codon_masks is not None
+    if union :
+        codon_masks = numpy.array( codon_masks, dtype=numpy.uint64 ).view( numpy.int64 )
+    else :
+        codon_masks = numpy.zeros( n, dtype=numpy.int64 )
+    best_diversity = numpy.zeros( n_errors, dtype=numpy.int64 )
+    best_combo = numpy.zeros( ( n_errors, n_dcs ), dtype=numpy.int64 )
+    jit_kernels.exhaustive_search_kernel( numpy.array( masks, dtype=numpy.int64 ), numpy.array( diversities, dtype=numpy.int64 ),
+                                          codon_masks, union,
+                                          numpy.array( evaluator.low_errors, dtype=numpy.int64 ),
+                                          numpy.array( evaluator.high_errors, dtype=numpy.int64 ),
+                                          numpy.array( popcount16, dtype=numpy.int64 ), n_dcs, best_diversity, best_combo )
+    return best_diversity.tolist(), [ tuple( best_combo[ e ].tolist() ) if best_diversity[ e ] else None for e in range( n_errors ) ]
+
+# the number of partial sets beam_search keeps for each error level
+default_beam_width = 16
+
+def beam_search( masks, diversities, evaluator, max_dcs, n_errors, codon_masks=None,
+                 beam_width=default_beam_width, max_evaluations=None, time_limit=None ) :
+    '''
+    Heuristic for positions where no exact engine can finish: grows sets of useful codons one codon
+    at a time, keeping only the beam_width least diverse sets for each error level.  Level 1 looks at
+    every codon, so its results are exact; level j+1 extends each set kept at level j (lowest error
+    first) by every other useful codon and again keeps the beam_width least diverse sets at each
+    error level.  Sets are ranked by diversity alone, not by error reduction per unit of diversity,
+    since the tables hold the smallest diversity for each error.  A set is dropped when a less
+    diverse one at its error level covers the same relevant amino acids (and, with codon_masks, the
+    same codons).  The search stops
+    extending once max_evaluations sets have been scored or time_limit seconds have passed; the
+    levels not reached are left empty.  Returns the results in the form of the all_level_engines,
+    the number of sets scored, and whether the search ran to completion.
+    '''
+    start = time.time()
+    low_errors = evaluator.low_errors
+    high_errors = evaluator.high_errors
+    relevant = relevant_aa_mask( evaluator )
+    n = len( masks )
+    n_evaluations = 0
+    complete = True
+    results = [ None ]
+    # a set is ( diversity, combo, aa_mask, codon_union )
+    parents = [ ( 0, (), 0, 0 ) ]
+    for j in range( 1, max_dcs + 1 ) :
+        candidates = {}
+        seen = set()
+        for diversity, combo, aa_mask, union in parents :
+            if j > 1 and ( ( max_evaluations is not None and n_evaluations >= max_evaluations ) or
+                           ( time_limit is not None and time.time() - start >= time_limit ) ) :
+                complete = False
+                break
+            for k in range( n ) :
+                if k in combo : continue
+                new_combo = tuple( sorted( combo + ( k, ) ) )
+                if new_combo in seen : continue
+                seen.add( new_combo )
+                n_evaluations += 1
+                new_mask = aa_mask | masks[ k ]
+                error = low_errors[ new_mask & 2047 ] + high_errors[ new_mask >> 11 ]
+                if not 0 <= error < n_errors : continue
+                if codon_masks is None :
+                    new_union = 0
+                    new_diversity = diversity + diversities[ k ]
+                else :
+                    new_union = union | codon_masks[ k ]
+                    new_diversity = popcount( new_union )
+                candidates.setdefault( error, [] ).append( ( new_diversity, new_combo, new_mask, new_union ) )
+
+        best_diversity = [ 0 ] * n_errors
+        best_combo = [ None ] * n_errors
+        parents = []
+        for error in sorted( candidates ) :
+            sets = candidates[ error ]
+            sets.sort()
+            signatures = set()
+            kept = 0
+            for diversity, combo, aa_mask, union in sets :
+                signature = ( aa_mask & relevant, union )
+                if signature in signatures : continue
+                signatures.add( signature )
+                if kept == 0 :
+                    best_diversity[ error ] = diversity
+                    best_combo[ error ] = combo
+                parents.append( ( diversity, combo, aa_mask, union ) )
+                kept += 1
+                if kept == beam_width : break
+        results.append( ( best_diversity, best_combo ) )
+    return results, n_evaluations, complete
+
+def diversity_lower_bounds( diversities, max_dcs, codon_masks=None ) :
+    '''
+    A lower bound, for each n_dcs up to max_dcs, on the diversity of any combination of n_dcs useful
+    codons: the sum of the n_dcs smallest diversities, or with codon_masks, where the diversity is the
+    size of the union, the n_dcs-th smallest (the largest of n_dcs distinct codons is at least that).
+    Entry 0 is None, as is any n_dcs larger than the number of useful codons.
+    '''
+    ordered = sorted( diversities )
+    bounds = [ None ]
+    for j in range( 1, max_dcs + 1 ) :
+        if j > len( ordered ) :
+            bounds.append( None )
+        elif codon_masks is None :
+            bounds.append( sum( ordered[ :j ] ) )
+        else :
+            bounds.append( ordered[ j - 1 ] )
+    return bounds
+
+# Rough cost of a unit of each engine's work relative to one combination visited by
+# exhaustive_search, plus batched_search's fixed cost per call; only meant for choosing
+# between engines and for catching searches that would take hours.  A unit is a
+# combination for the enumerating engines, an extension of one state by one codon for
+# mask_dp, and a scored set for beam.  The exhaustive, batched and mask_dp figures
+# come from timing those engines on a few test libraries.  The others are estimates,
+# not measurements: a scored beam set costs a combination visit plus its share of the
+# per-level sort, and jit assumes the compiled walk is about 50 times faster than the
+# Python one, numba not having been available to time it.
+relative_costs = {
+    "exhaustive" : 1.0,
+    "branch_and_bound" : 1.0,
+    "batched" : 0.4,
+    "mask_dp" : 0.15,
+    "jit" : 0.02,
+    "beam" : 2.0,
+    }
+batched_call_cost = 5000
+
+def predicted_combinations( n_useful, max_dcs ) :
+    '''The number of combinations exhaustive_search visits for every n_dcs from 1 to max_dcs'''
+    return sum( [ n_combinations( n_useful, j ) for j in range( 1, max_dcs + 1 ) ] )
+
+def predicted_mask_dp_extensions( masks, evaluator, max_dcs ) :
+    '''
+    An upper bound on the ( state, codon ) pairs mask_dp_search_all_levels visits: level j holds at
+    most the unions of up to j distinct relevant-aa signatures, and no more than the number of masks
+    over the relevant amino acids those signatures cover
+    '''
+    relevant = relevant_aa_mask( evaluator )
+    signatures = set( [ mask & relevant for mask in masks ] )
+    covered = 0
+    for signature in signatures :
+        covered |= signature
+    max_states = 1 << bin( covered ).count( "1" )
+    n_states = 1
+    total = 1
+    for j in range( 1, max_dcs ) :
+        n_states += n_combinations( len( signatures ), j )
+        total += min( n_states, max_states )
+    return len( masks ) * total
+
+def predicted_beam_evaluations( n_useful, max_dcs, n_errors, beam_width=default_beam_width, max_evaluations=None ) :
+    '''An upper bound on the number of sets beam_search scores'''
+    total = n_useful
+    for j in range( 2, max_dcs + 1 ) :
+        total += min( beam_width * n_errors, n_combinations( n_useful, j - 1 ) ) * n_useful
+    if max_evaluations is not None :
+        # the budget is checked before each set is extended, so it is overshot by at most n_useful
+        total = min( total, max_evaluations + n_useful )
+    return total
+
+def predicted_work( engine, masks, evaluator, max_dcs, codon_masks=None, n_ranges=None ) :
+    '''
+    The predicted cost of running engine for every n_dcs from 1 to max_dcs, in combinations
+    visited by exhaustive_search; branch_and_bound is charged for its worst case.  n_ranges[ j ],
+    if given, is the number of rank ranges exhaustive's combinations of j DCs are split into and
+    searched side by side, and exhaustive is charged for the longest range of each j.
+    '''
+    n = len( masks )
+    if engine == "exhaustive" and n_ranges is not None :
+        return sum( [ n_combinations( n, j ) / n_ranges[ j ] for j in range( 1, max_dcs + 1 ) ] ) * relative_costs[ engine ]
+    if engine == "mask_dp" and codon_masks is None :
+        return predicted_mask_dp_extensions( masks, evaluator, max_dcs ) * relative_costs[ "mask_dp" ]
+    if engine == "mask_dp" :
+        engine = "branch_and_bound"
+    if engine == "batched" :
+        work = 0
+        for j in range( 1, max_dcs + 1 ) :
+            if j <= 3 :
+                work += n_combinations( n, j ) * relative_costs[ "batched" ] + batched_call_cost
+            else :
+                work += n_combinations( n, j ) * relative_costs[ "exhaustive" ]
+        return work
+    if engine == "jit" and not jit_kernels.enabled :
+        engine = "exhaustive"
+    return predicted_combinations( n, max_dcs ) * relative_costs[ engine ]
+
+def cheapest_engine( masks, evaluator, max_dcs, codon_masks=None, resumable=False, n_ranges=None ) :
+    '''
+    The exact engine with the smallest predicted work, and that work.  branch_and_bound is not
+    considered since its work can't be predicted, nor mask_dp for codon unions (where it runs
+    branch_and_bound), nor jit unless numba is available.  With resumable, only exhaustive is,
+    since only its walk over combination ranks (exhaustive_search_ranks) can stop part way
+    through a position and be resumed.  n_ranges is passed on to predicted_work.
+    '''
+    candidates = [ "exhaustive" ]
+    if not resumable :
+        candidates.append( "batched" )
+        if codon_masks is None :
+            candidates.append( "mask_dp" )
+        if jit_kernels.enabled :
+            candidates.append( "jit" )
+    works = [ ( predicted_work( engine, masks, evaluator, max_dcs, codon_masks, n_ranges ), engine ) for engine in candidates ]
+    work, engine = min( works )
+    return engine, work
+
+engines = {
+    "exhaustive" : exhaustive_search,
+    "branch_and_bound" : branch_and_bound_search,
+    "mask_dp" : mask_dp_search,
+    "batched" : batched_search,
+    "jit" : jit_search,
+    }
+
+# engines that compute every n_dcs in one pass
+all_level_engines = {
+    "mask_dp" : mask_dp_search_all_levels,
+    }
@@ -21,6 +21,7 @@
 # THE SOFTWARE.
 
 import blargs
+import combination_search
 import math
 import optimize_codons
 
@@ -72,16 +73,16 @@ class InequalityAuxVar :
 def define_variables_for_library( library ) :
    vars = {}
 
-   print "Define variables for library, max_dcs_per_pos", library.max_dcs_per_pos
+   print( "Define variables for library, max_dcs_per_pos", library.max_dcs_per_pos )
    if ( library.max_dcs_per_pos == 1 ) : return vars
 
    ndcs_per_pos = []
    count_stretch = -1
-   for i in xrange( library.n_positions ) :
+   for i in range( library.n_positions ) :
       if library.stretch_reps[i] == i :
          count_stretch += 1
       posi_ndc_vars = []
-      for j in xrange( 1, library.max_dcs_for_pos[i]+1 ) :
+      for j in range( 1, library.max_dcs_for_pos[i]+1 ) :
          jvar = NDCCountVar()
          jvar.name = "NDCS_POS%d_IS_%d" % ( i, j )
          jvar.stretch = count_stretch
@@ -94,7 +95,7 @@ def define_variables_for_library( library ) :
    stretch_members = []
    curr_stretch_pos = []
    count_stretch = -1
-   for i in xrange( library.n_positions ) :
+   for i in range( library.n_positions ) :
       if library.stretch_reps[i] == i :
          count_stretch += 1
          if count_stretch != 0 :
@@ -106,11 +107,11 @@ def define_variables_for_library( library ) :
    stretch_combos = []
    all_gt_aux_vars = []
    all_lt_aux_vars = []
-   for i in xrange( count_stretch+1 ) :
+   for i in range( count_stretch+1 ) :
       curr_combos = []
       imembs = len( stretch_members[i] )
       dims = imembs * [ 0 ]
-      for j in xrange( imembs ) :
+      for j in range( imembs ) :
          jpos = stretch_members[i][j]
          dims[j] = library.max_dcs_for_pos[ jpos ]
       lex = optimize_codons.LexicographicalIterator( dims )
@@ -118,7 +119,7 @@ def define_variables_for_library( library ) :
          nprimers_var = StretchNPrimersVar()
          varname = "S%d_COMBO" % i
          size = 1
-         for j in xrange( imembs ) :
+         for j in range( imembs ) :
             jsize = lex.pos[j] + 1
             varname += "_%d" % ( jsize )
             size *= jsize
@@ -131,7 +132,7 @@ def define_variables_for_library( library ) :
          gt_auxvars = [ gt_auxvar ]
          lt_auxvars = []
          nprimers_var.aux_vars.append( gt_auxvars[0].name )
-         for j in xrange( imembs ) :
+         for j in range( imembs ) :
             jpos = stretch_members[i][j]
             lt_auxvar = InequalityAuxVar()
             lt_auxvar.name = ( "AND_LT_%d_" % jpos ) + varname
@@ -159,11 +160,11 @@ def create_dcs_for_ilp_for_pos( library, pos, stretch ) :
    dclist = []
    ncodons_by_ndc = []
    count = 0
-   for i in xrange( 1, library.max_dcs_for_pos[ pos ]+1 ) :
+   for i in range( 1, library.max_dcs_for_pos[ pos ]+1 ) :
       count_by_ndcs = 0
       posi_divmin = library.divmin_for_error_for_n_dcs[pos][i]
-      print i, library.max_dcs_for_pos[ pos ], len( posi_divmin ), library.max_per_position_error
-      for j in xrange( library.max_per_position_error + 1 ) :
+      print( i, library.max_dcs_for_pos[ pos ], len( posi_divmin ), library.max_per_position_error )
+      for j in range( library.max_per_position_error + 1 ) :
          if posi_divmin[ j ] != library.infinity :
             count += 1
             count_by_ndcs += 1
@@ -181,15 +182,14 @@ def create_dcs_for_ilp_for_pos( library, pos, stretch ) :
             jcodons = []
             aas_present = 21 * [ False ]
             for k in codon_inds :
-               library.dclex.set_from_index( k )
-               degcodon.set_from_lex( library.dclex )
+               degcodon.set_from_index( k )
                jcodons.append( degcodon.codon_string() )
                kaas = library.aas_for_dc[ k ]
-               for l in xrange(21) :
+               for l in range(21) :
                   aas_present[ l ] |= kaas[ l ]
             dc.codons = "+".join( jcodons )
             present_aas = []
-            for k in xrange(21) :
+            for k in range(21) :
                if aas_present[k] :
                   present_aas.append( optimize_codons.aastr_for_integer( k ))
             dc.aas = "".join( present_aas )
@@ -216,7 +216,7 @@ def dc_column( dc, mdcs ) :
 def ndc_count_var_column( ndc_var, ndcs  ) :
    #print "ndc_count_var_column", ndc_var.name, " ", ndcs, ( "%d\n" % (-1*ndcs) )
    lines = [ " " + ndc_var.name + ( " ndc_%d_%d_or_everything -1\n" % ( ndc_var.pos, ndc_var.n_dcs ) ) ]
-   for i in xrange(1,ndcs+1) :
+   for i in range(1,ndcs+1) :
       lines.append( " " + ndc_var.name + ( " ndc_%d_%d_or_%d" % ( ndc_var.pos, ndc_var.n_dcs, i ) ) + " -1\n" )
    # these aux vars represent the boolean AND logic when trying to compute
    # the product of the number of DCs used at all positions in a single stretch
@@ -261,18 +261,43 @@ if __name__ == "__main__" :
        p.float( "diversity_cap" ).required()
        p.int( "nprimer_limit" ).default(-1)
        p.str( "ilp_input_prefix" ).required()
-
-   print "Loading library"
+       p.flag( "keep_dominated_codons" )
+       p.flag( "exact_union_diversity" )
+       p.enum( "combination_engine", [ "auto" ] + sorted( combination_search.engines ) + [ "beam" ] ).default( "auto" )
+       p.float( "search_budget" )
+       p.enum( "over_budget", [ "refuse", "reduce_dcs", "heuristic" ] ).default( "refuse" )
+       p.int( "beam_width" ).default( combination_search.default_beam_width )
+       p.int( "heuristic_max_evaluations" )
+       p.float( "heuristic_time_limit" )
+       p.int( "n_processes" ).default( 1 )
+       p.flag( "no_position_cache" )
+       p.float( "checkpoint_interval" ).default( 60 )
+       p.flag( "resume" ).requires( p.str( "checkpoint_file" ) )
+
+   print( "Loading library" )
    library = optimize_codons.AALibrary()
+   library.prune_dominated = not keep_dominated_codons
+   library.combination_engine = combination_engine
+   library.search_budget = search_budget
+   library.over_budget = over_budget
+   library.beam_width = beam_width
+   library.heuristic_max_evaluations = heuristic_max_evaluations
+   library.heuristic_time_limit = heuristic_time_limit
+   library.exact_union_diversity = exact_union_diversity
+   library.n_processes = n_processes
+   library.use_position_cache = not no_position_cache
+   library.checkpoint_file = checkpoint_file
+   library.checkpoint_interval = checkpoint_interval
+   library.resume = resume
    library.load_library( input_csv )
 
-   print "Finding minimum diversity codons"
+   print( "Finding minimum diversity codons" )
    library.compute_smallest_diversity_for_all_errors()
 
    count_stretch = -1
    dcs = []
    ncodons_by_ndcs = []
-   for i in xrange( library.n_positions ) :
+   for i in range( library.n_positions ) :
       if library.stretch_reps[i] == i :
          count_stretch += 1
       idcs, ncodons_by_ndc = create_dcs_for_ilp_for_pos( library, i, count_stretch )
@@ -285,14 +310,14 @@ if __name__ == "__main__" :
 
    vars = define_variables_for_library( library )
 
-   print "beginning to write ILP problem"
+   print( "beginning to write ILP problem" )
    fmps_lines = []
    fmps_lines.append( "NAME MULTIPLE_DEGENERATE_CODON_OPTIMIZATION\n" )
    fmps_lines.append( "ROWS\n" )
    fmps_lines.append( " N error\n" )
    fmps_lines.append( " L libsize\n" )
 
-   for i in xrange( library.n_positions ) :
+   for i in range( library.n_positions ) :
       fmps_lines.append( " E onlyone_" + str(i) + "\n" )
 
    if ( library.max_dcs_per_pos != 1 ) :
@@ -301,24 +326,24 @@ if __name__ == "__main__" :
           fmps_lines.append( " L " + aux.name + "\n" )
        for aux in vars[ "lt_aux_vars" ] :
           fmps_lines.append( " G " + aux.name + "\n" )
-       for i in xrange( library.n_positions ) :
-          for j in xrange( 1, library.max_dcs_for_pos[i] + 1 ) :
+       for i in range( library.n_positions ) :
+          for j in range( 1, library.max_dcs_for_pos[i] + 1 ) :
              fmps_lines.append( " G ndc_" + str(i) + "_" + str(j) + "_or_everything\n" )
-       for i in xrange( library.n_positions ) :
-          for j in xrange( 1, library.max_dcs_for_pos[i] + 1 ) :
-             for k in xrange( 1, ncodons_by_ndcs[ i ][ j-1 ] + 1 ) :
+       for i in range( library.n_positions ) :
+          for j in range( 1, library.max_dcs_for_pos[i] + 1 ) :
+             for k in range( 1, ncodons_by_ndcs[ i ][ j-1 ] + 1 ) :
                 fmps_lines.append( " L ndc_%d_%d_or_%d\n" % ( i, j, k ))
 
 
    fmps_lines.append( "COLUMNS\n" )
-   for i in xrange( library.n_positions ) :
+   for i in range( library.n_positions ) :
       for dc in dcs[ i ] :
          fmps_lines.extend( dc_column( dc, library.max_dcs_per_pos != 1 ) )
 
    if ( library.max_dcs_per_pos != 1 ) :
        ndc_vars = vars[ "ndcs" ]
-       for i in xrange( library.n_positions ) :
-          for j in xrange( library.max_dcs_for_pos[ i ] ) :
+       for i in range( library.n_positions ) :
+          for j in range( library.max_dcs_for_pos[ i ] ) :
              #print "WHAT?!", ncodons_by_ndcs, ncodons_by_ndcs[i], ncodons_by_ndcs[i][j]
              fmps_lines.extend( ndc_count_var_column( ndc_vars[i][j], ncodons_by_ndcs[i][j] ))
     
@@ -332,7 +357,7 @@ if __name__ == "__main__" :
 
    if ( library.max_dcs_per_pos != 1 ) :
       fmps_lines.append( " RHS1 total_num_primers " + str(nprimer_limit) + "\n" )
-   for i in xrange( library.n_positions ) :
+   for i in range( library.n_positions ) :
       fmps_lines.append( " RHS1 onlyone_%d 1\n" % i )
 
    if ( library.max_dcs_per_pos != 1 ) :
@@ -340,21 +365,21 @@ if __name__ == "__main__" :
           fmps_lines.append( " RHS1 " + aux.name + " " + str( aux.c0 ) + "\n" )
        for aux in vars[ "lt_aux_vars" ] :
           fmps_lines.append( " RHS1 " + aux.name + " " + str( aux.c0 ) + "\n" )
-       for i in xrange( library.n_positions ) :
-          for j in xrange( 1, library.max_dcs_for_pos[i] + 1 ) :
+       for i in range( library.n_positions ) :
+          for j in range( 1, library.max_dcs_for_pos[i] + 1 ) :
              fmps_lines.append( " RHS1 ndc_" + str(i) + "_" + str(j) + "_or_everything 0\n" )
-       for i in xrange( library.n_positions ) :
-          for j in xrange( 1, library.max_dcs_for_pos[i] + 1 ) :
-             for k in xrange( 1, ncodons_by_ndcs[ i ][ j-1 ] + 1 ) :
+       for i in range( library.n_positions ) :
+          for j in range( 1, library.max_dcs_for_pos[i] + 1 ) :
+             for k in range( 1, ncodons_by_ndcs[ i ][ j-1 ] + 1 ) :
                 fmps_lines.append( " RHS1 ndc_%d_%d_or_%d 0 \n" % ( i, j, k ))
 
    fmps_lines.append( "BOUNDS\n" )
-   for i in xrange( library.n_positions ) :
+   for i in range( library.n_positions ) :
       for dc in dcs[i] :
          fmps_lines.append( " BV BV1 " + dc.name + "\n" )
 
    if ( library.max_dcs_per_pos != 1 ) :
-       for i in xrange( library.n_positions ) :
+       for i in range( library.n_positions ) :
           for ndc_var in ndc_vars[ i ] :
              fmps_lines.append( " BV BV1 " + ndc_var.name + "\n" )
        for sclist in stretch_combos :
@@ -397,7 +422,7 @@ if __name__ == "__main__" :
    # 
    open( ilp_input_prefix + ".fmps", "w" ).writelines( fmps_lines )
    varlines = []
-   for i in xrange( library.n_positions ) :
+   for i in range( library.n_positions ) :
       for dc in dcs[ i ] :
          varlines.append( dc.name + " " + dc.codons + " " + dc.aas + "\n" )
    open( ilp_input_prefix + ".dcs", "w" ).writelines( varlines )
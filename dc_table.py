@@ -0,0 +1,130 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2014 Andrew Leaver-Fay, Tim Jacobs, Hayretin Yumerefendi, Brian Kuhlman.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+#     in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+# Binary on-disk table describing all 3375 degenerate codons for a given genetic code.
+# For each degenerate codon (in the order of a LexicographicalIterator over [ 15, 15, 15 ])
+# the table holds
+#   - a 21-bit mask of the amino acids it encodes (bit i = amino acid i; bit 20 = STOP)
+#   - a 64-bit mask of the codons it expands to (bit c = GeneticCodeMapper.codon_index)
+#   - its diversity, i.e. the number of codons it expands to
+# The file is written once per genetic code and is read back, in one read, on every
+# later run in place of rebuilding the table.
+#
+# layout: header | aa masks (uint32 x 3375) | codon masks (uint64 x 3375) | diversities (uint32 x 3375)
+
+import atomic_file
+import genetic_code
+import hashlib
+import os
+import struct
+
+n_degenerate_codons = 3375
+table_format_version = 1
+
+header_format = "<4sII20s"
+header_size = struct.calcsize( header_format )
+table_magic = b"SWDC"
+aa_masks_format = "<%dI" % n_degenerate_codons
+codon_masks_format = "<%dQ" % n_degenerate_codons
+diversities_format = "<%dI" % n_degenerate_codons
+
+class DegenerateCodonTable :
+    def __init__( self, aa_masks, codon_masks, diversities ) :
+        self.aa_masks = aa_masks
+        self.codon_masks = codon_masks
+        self.diversities = diversities
+
+def default_cache_dir() :
+    '''The directory where generated tables are stored; override with $SWIFTLIB_CACHE_DIR'''
+    if "SWIFTLIB_CACHE_DIR" in os.environ :
+        return os.environ[ "SWIFTLIB_CACHE_DIR" ]
+    return os.path.join( os.path.expanduser( "~" ), ".cache", "swiftlib" )
+
+def genetic_code_digest( aa_index_for_codon ) :
+    '''
+    SHA1 of the genetic code; the amino-acid index assigned to each codon is hashed along
+    with genetic_code.genetic_code_codons since it determines the meaning of the aa masks
+    '''
+    sha = hashlib.sha1()
+    for codon in sorted( genetic_code.genetic_code_codons ) :
+        sha.update( ( "%s:%s;" % ( codon, genetic_code.genetic_code_codons[ codon ] ) ).encode( "ascii" ) )
+    sha.update( ( ",".join( [ str(x) for x in aa_index_for_codon ] ) ).encode( "ascii" ) )
+    return sha.digest()
+
+def table_path( digest, cache_dir ) :
+    return os.path.join( cache_dir, "dc_table_v%d_%s.bin" % ( table_format_version, hashlib.sha1( digest ).hexdigest()[:16] ) )
+
+def read_table( fname, digest ) :
+    '''Read the table file; return None if it is missing or was written for a different genetic code'''
+    expected_size = header_size + struct.calcsize( aa_masks_format ) + \
+        struct.calcsize( codon_masks_format ) + struct.calcsize( diversities_format )
+    try :
+        with open( fname, "rb" ) as f :
+            buf = f.read( expected_size + 1 )
+    except ( IOError, OSError ) :
+        return None
+    if len( buf ) != expected_size :
+        return None
+    magic, version, n_dcs, file_digest = struct.unpack_from( header_format, buf, 0 )
+    if magic != table_magic or version != table_format_version or \
+            n_dcs != n_degenerate_codons or file_digest != digest :
+        return None
+    offset = header_size
+    aa_masks = struct.unpack_from( aa_masks_format, buf, offset )
+    offset += struct.calcsize( aa_masks_format )
+    codon_masks = struct.unpack_from( codon_masks_format, buf, offset )
+    offset += struct.calcsize( codon_masks_format )
+    diversities = struct.unpack_from( diversities_format, buf, offset )
+    return DegenerateCodonTable( aa_masks, codon_masks, diversities )
+
+def write_table( fname, digest, table ) :
+    '''Write the table atomically so that concurrent jobs never see a partial file'''
+    dirname = os.path.dirname( fname )
+    if not os.path.isdir( dirname ) :
+        os.makedirs( dirname )
+    def write( f ) :
+        f.write( struct.pack( header_format, table_magic, table_format_version, n_degenerate_codons, digest ) )
+        f.write( struct.pack( aa_masks_format, *table.aa_masks ) )
+        f.write( struct.pack( codon_masks_format, *table.codon_masks ) )
+        f.write( struct.pack( diversities_format, *table.diversities ) )
+    atomic_file.write_atomically( fname, write, binary=True )
+
+def load_or_create_table( aa_index_for_codon, build_table, cache_dir=None ) :
+    '''
+    Return the DegenerateCodonTable for the genetic code described by aa_index_for_codon,
+    reading it from the cache directory if it has already been generated and otherwise
+    calling build_table() and saving its result.  A cache directory that cannot be written
+    just means the table is rebuilt next time.
+    '''
+    if cache_dir is None :
+        cache_dir = default_cache_dir()
+    digest = genetic_code_digest( aa_index_for_codon )
+    fname = table_path( digest, cache_dir )
+    table = read_table( fname, digest )
+    if table is not None :
+        return table
+    table = build_table()
+    try :
+        write_table( fname, digest, table )
+    except ( IOError, OSError ) :
+        pass
+    return table
@@ -0,0 +1,119 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2014 Andrew Leaver-Fay, Tim Jacobs, Hayretin Yumerefendi, Brian Kuhlman.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+#     in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+# Numba-compiled versions of the two hottest loops: the exhaustive walk over
+# combinations of useful codons at one position, and one layer of the dynamic
+# program in AALibrary.optimize_library.  The kernels work on int64 / float64
+# numpy arrays (the DP kernel also on float32 / int32 rows) and only use the
+# subset of Python that numba compiles in nopython mode.  numba is optional: if
+# it can't be imported, or SWIFTLIB_DISABLE_JIT is set in the environment,
+# enabled is False and the callers run their pure Python loops instead.  enabled
+# may also be changed at runtime.
+
+import numpy
+import os
+
+try :
+    import numba
+except ImportError :
+    numba = None
+
+enabled = numba is not None and not os.environ.get( "SWIFTLIB_DISABLE_JIT" )
+
+def jit( function ) :
+    if numba is None :
+        return function
+    return numba.njit( cache=True )( function )
+
+@jit
+def exhaustive_search_kernel( masks, diversities, codon_masks, union, low_errors, high_errors, popcount16,
+                              n_dcs, best_diversity, best_combo ) :
+    '''
+    combination_search.exhaustive_search over arrays.  codon_masks holds the 64-bit codon masks
+    viewed as int64 and is only read if union is True.  Fills best_diversity ( n_errors, 0 where no
+    combination gives that error ) and best_combo ( n_errors x n_dcs ) in place.
+    '''
+    n = masks.shape[ 0 ]
+    n_errors = best_diversity.shape[ 0 ]
+    last = n_dcs - 1
+    combo = numpy.arange( n_dcs )
+    prefix_masks = numpy.zeros( n_dcs, numpy.int64 )
+    prefix_diversities = numpy.zeros( n_dcs, numpy.int64 )
+    for d in range( last ) :
+        prefix_masks[ d+1 ] = prefix_masks[ d ] | masks[ combo[ d ] ]
+        if union :
+            prefix_diversities[ d+1 ] = prefix_diversities[ d ] | codon_masks[ combo[ d ] ]
+        else :
+            prefix_diversities[ d+1 ] = prefix_diversities[ d ] + diversities[ combo[ d ] ]
+
+    while True :
+        prefix_mask = prefix_masks[ last ]
+        prefix_diversity = prefix_diversities[ last ]
+        for k in range( combo[ last ], n ) :
+            aa_mask = prefix_mask | masks[ k ]
+            error = low_errors[ aa_mask & 2047 ] + high_errors[ aa_mask >> 11 ]
+            if error >= 0 and error < n_errors :
+                if union :
+                    codons = prefix_diversity | codon_masks[ k ]
+                    diversity = popcount16[ codons & 65535 ] + popcount16[ ( codons >> 16 ) & 65535 ] + \
+                        popcount16[ ( codons >> 32 ) & 65535 ] + popcount16[ ( codons >> 48 ) & 65535 ]
+                else :
+                    diversity = prefix_diversity + diversities[ k ]
+                if best_diversity[ error ] == 0 or diversity < best_diversity[ error ] :
+                    best_diversity[ error ] = diversity
+                    for d in range( last ) :
+                        best_combo[ error, d ] = combo[ d ]
+                    best_combo[ error, last ] = k
+
+        d = last - 1
+        while d >= 0 and combo[ d ] == n - n_dcs + d :
+            d -= 1
+        if d < 0 :
+            break
+        combo[ d ] += 1
+        for t in range( d + 1, n_dcs ) :
+            combo[ t ] = combo[ t-1 ] + 1
+        for t in range( d, last ) :
+            prefix_masks[ t+1 ] = prefix_masks[ t ] | masks[ combo[ t ] ]
+            if union :
+                prefix_diversities[ t+1 ] = prefix_diversities[ t ] | codon_masks[ combo[ t ] ]
+            else :
+                prefix_diversities[ t+1 ] = prefix_diversities[ t ] + diversities[ combo[ t ] ]
+
+@jit
+def dp_layer_kernel( previous, position, current, traceback_k ) :
+    '''
+    One position of the dynamic program in optimize_library: for every total error j, the smallest
+    position[ k ] + previous[ j-k ] over k <= j, with numpy.inf for unreachable errors; ties go to the
+    smallest k.  current and traceback_k ( the k chosen, or -1 ) are filled in place.
+    '''
+    for j in range( current.shape[ 0 ] ) :
+        j_divmin = numpy.inf
+        j_k = -1
+        for k in range( min( j + 1, position.shape[ 0 ] ) ) :
+            if position[ k ] == numpy.inf or previous[ j-k ] == numpy.inf : continue
+            divsum = position[ k ] + previous[ j-k ]
+            if divsum < j_divmin :
+                j_divmin = divsum
+                j_k = k
+        current[ j ] = j_divmin
+        traceback_k[ j ] = j_k
@@ -4,7 +4,7 @@ class LexicographicalIterator :
         self.size = len(dimsizes)
         self.dimsizes = list( dimsizes )
         self.dimprods = [1] * self.size
-        for i in xrange( self.size - 1, 0, -1 ) :
+        for i in range( self.size - 1, 0, -1 ) :
             self.dimprods[ i-1 ] = self.dimprods[ i ] * self.dimsizes[ i ]
         self.search_space_size = self.dimprods[ 0 ] * self.dimsizes[ 0 ]
         self.pos = [0] * self.size
@@ -23,19 +23,19 @@ class LexicographicalIterator :
         return False
 
     def upper_diagonal_increment( self ) :
-        for i in xrange( self.size - 1, -1, -1 ) :
+        for i in range( self.size - 1, -1, -1 ) :
             self.pos[ i ] += 1
             if ( self.pos[ i ] == self.dimsizes[ i ]  ) :
                 self.pos[ i ] = 0
             else :
                 beyond_end = False
-                for k in xrange(i+1,self.size) :
+                for k in range(i+1,self.size) :
                     self.pos[ k ] = self.pos[ i ] + k - i
                     if self.pos[k] >= self.dimsizes[k] :
                         beyond_end = True
                         break
                 if beyond_end and i == 0 :
-                    for k in xrange( self.size ) :
+                    for k in range( self.size ) :
                         self.pos[ k ] = 0
                     self.at_end = True
                     return False
@@ -46,17 +46,17 @@ class LexicographicalIterator :
 
 
     def reset( self ) :
-        for i in xrange( self.size ) : self.pos[ i ] = 0
+        for i in range( self.size ) : self.pos[ i ] = 0
         self.at_end = False
 
     def upper_diagonal_reset( self ) :
         beyond_end = False
-        for i in xrange( self.size ) :
+        for i in range( self.size ) :
             self.pos[ i ] = i
             if i >= self.dimsizes[i] :
                 beyond_end = True
         if beyond_end :
-            for i in xrange( self.size ) :
+            for i in range( self.size ) :
                 self.pos[ i ] = 0
             self.at_end = True
         else :
@@ -65,11 +65,11 @@ class LexicographicalIterator :
     def index( self ) :
         ''' return the integer index representing the state of the lex'''
         ind = 0
-        for i in xrange( self.size ) :
+        for i in range( self.size ) :
             ind += self.pos[ i ] * self.dimprods[ i ]
         return ind
     def set_from_index( self, ind ) :
         ''' set the state of the lex given a previously computed index'''
-        for i in xrange( self.size ):
-            self.pos[ i ] = ind / self.dimprods[i]
+        for i in range( self.size ):
+            self.pos[ i ] = ind // self.dimprods[i]
             ind = ind % self.dimprods[ i ]
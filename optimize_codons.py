@@ -21,10 +21,17 @@
 # THE SOFTWARE.
 
 import blargs
+import checkpoint
+import combination_search
+import dc_table
 import genetic_code
+import jit_kernels
 import amino_acids as aa
 import math
-import sys
+import multiprocessing
+import numpy
+import position_cache
+import time
 
 def aastr_for_integer( aaindex ) :
     assert( aaindex >= 0 and aaindex < 21 )
@@ -36,7 +43,7 @@ class GeneticCodeMapper :
     def __init__( self ) :
         self.base_to_index = { "A" : 0, "C" : 1, "G" : 2, "T" : 3 }
         self.mapper = [0]*64
-        for codon, aastr in genetic_code.genetic_code_codons.iteritems() :
+        for codon, aastr in genetic_code.genetic_code_codons.items() :
             ci = self.codon_index( codon )
             aaind = 20
             if aastr != "STOP" :
@@ -47,7 +54,7 @@ class GeneticCodeMapper :
 
     def codon_index( self, codon ) :
         index = 0
-        for i in xrange( 3 ) :
+        for i in range( 3 ) :
             index = index*4 + self.base_to_index[ codon[i] ]
         return index
 
@@ -56,7 +63,7 @@ class LexicographicalIterator :
         self.size = len(dimsizes)
         self.dimsizes = list( dimsizes )
         self.dimprods = [1] * self.size
-        for i in xrange( self.size - 1, 0, -1 ) :
+        for i in range( self.size - 1, 0, -1 ) :
             self.dimprods[ i-1 ] = self.dimprods[ i ] * self.dimsizes[ i ]
         self.search_space_size = self.dimprods[ 0 ] * self.dimsizes[ 0 ]
         self.pos = [0] * self.size
@@ -75,19 +82,19 @@ class LexicographicalIterator :
         return False
 
     def upper_diagonal_increment( self ) :
-        for i in xrange( self.size - 1, -1, -1 ) :
+        for i in range( self.size - 1, -1, -1 ) :
             self.pos[ i ] += 1
             if ( self.pos[ i ] == self.dimsizes[ i ]  ) :
                 self.pos[ i ] = 0
             else :
                 beyond_end = False
-                for k in xrange(i+1,self.size) :
+                for k in range(i+1,self.size) :
                     self.pos[ k ] = self.pos[ i ] + k - i
                     if self.pos[k] >= self.dimsizes[k] :
                         beyond_end = True
                         break
                 if beyond_end and i == 0 :
-                    for k in xrange( self.size ) :
+                    for k in range( self.size ) :
                         self.pos[ k ] = 0
                     self.at_end = True
                     return False
@@ -98,17 +105,17 @@ class LexicographicalIterator :
 
 
     def reset( self ) :
-        for i in xrange( self.size ) : self.pos[ i ] = 0
+        for i in range( self.size ) : self.pos[ i ] = 0
         self.at_end = False
 
     def upper_diagonal_reset( self ) :
         beyond_end = False
-        for i in xrange( self.size ) :
+        for i in range( self.size ) :
             self.pos[ i ] = i
             if i >= self.dimsizes[i] :
                 beyond_end = True
         if beyond_end :
-            for i in xrange( self.size ) :
+            for i in range( self.size ) :
                 self.pos[ i ] = 0
             self.at_end = True
         else :
@@ -117,96 +124,185 @@ class LexicographicalIterator :
     def index( self ) :
         ''' return the integer index representing the state of the lex'''
         ind = 0
-        for i in xrange( self.size ) :
+        for i in range( self.size ) :
             ind += self.pos[ i ] * self.dimprods[ i ]
         return ind
     def set_from_index( self, ind ) :
         ''' set the state of the lex given a previously computed index'''
-        for i in xrange( self.size ):
-            self.pos[ i ] = ind / self.dimprods[i]
+        for i in range( self.size ):
+            self.pos[ i ] = ind // self.dimprods[i]
             ind = ind % self.dimprods[ i ]
 
-class DegenerateCodon :
+# IUPAC names for the 15 non-empty sets of bases; a set of bases is a 4-bit
+# nibble with bit b set if base b (A = 0, C = 1, G = 2, T = 3) is present
+degenerate_base_names = {
+    (True, False,False,False) : "A",
+    (False,True, False,False) : "C",
+    (False,False,True, False) : "G",
+    (False,False,False,True ) : "T",
+    (True, False,False,True ) : "W",
+    (False,True, True, False) : "S",
+    (True, True, False,False) : "M",
+    (False,False,True, True ) : "K",
+    (True, False,True, False) : "R",
+    (False,True, False,True ) : "Y",
+    (False,True, True, True ) : "B",
+    (True, False,True, True ) : "D",
+    (True, True, False,True ) : "H",
+    (True, True, True, False) : "V",
+    (True, True, True, True ) : "N" }
+
+nibble_names = [ None ] * 16
+nibble_bases = [ () ] * 16
+for _bases in degenerate_base_names :
+    _nibble = sum( [ 1 << _i for _i in range(4) if _bases[_i] ] )
+    nibble_names[ _nibble ] = degenerate_base_names[ _bases ]
+    nibble_bases[ _nibble ] = tuple( [ _i for _i in range(4) if _bases[_i] ] )
+del _bases, _nibble
+
+# Lookup tables indexed by the 12-bit representation of a degenerate codon: three
+# nibbles, the first codon position in the highest four bits.  Codons with an empty
+# position have no name, a diversity of -1 and no log diversity.
+dc_codon_strings = [ None ] * 4096
+dc_diversities = [ -1 ] * 4096
+dc_log_diversities = [ None ] * 4096
+nibble_counts = [ len( bases ) for bases in nibble_bases ]
+nibble_logs = [ math.log( count ) if count else None for count in nibble_counts ]
+for _n0 in range( 1, 16 ) :
+    for _n1 in range( 1, 16 ) :
+        _name01 = nibble_names[ _n0 ] + nibble_names[ _n1 ]
+        _count01 = nibble_counts[ _n0 ] * nibble_counts[ _n1 ]
+        _log01 = 0.0 + nibble_logs[ _n0 ] + nibble_logs[ _n1 ]
+        _bits01 = ( _n0 << 8 ) | ( _n1 << 4 )
+        for _n2 in range( 1, 16 ) :
+            dc_codon_strings[ _bits01 | _n2 ] = _name01 + nibble_names[ _n2 ]
+            dc_diversities[ _bits01 | _n2 ] = _count01 * nibble_counts[ _n2 ]
+            dc_log_diversities[ _bits01 | _n2 ] = _log01 + nibble_logs[ _n2 ]
+del _n0, _n1, _n2, _name01, _count01, _log01, _bits01
+
+# the codons each degenerate codon expands to, filled in on first use
+dc_codons = [ None ] * 4096
+
+def dc_bits_for_index( dc_index ) :
+    """The 12-bit representation of the degenerate codon with a given index from a lex over [ 15, 15, 15 ]"""
+    return ( ( dc_index // 225 + 1 ) << 8 ) | ( ( dc_index // 15 % 15 + 1 ) << 4 ) | ( dc_index % 15 + 1 )
+
+class DegenerateCodon( object ) :
+    """
+    A degenerate codon stored as a 12-bit integer: one nibble per codon position
+    with bit b of the nibble set if base b (A = 0, C = 1, G = 2, T = 3) is allowed.
+    """
+    __slots__ = ( "bits", )
+
+    infinity = -1
+    degenerate_base_names = degenerate_base_names
+    names_to_bases = dict( [ ( name, bases ) for bases, name in degenerate_base_names.items() ] )
+
     def __init__( self ) :
-        self.pos = [ [] ] * 3
-        for i in xrange(3) : self.pos[i] = [ False ] * 4
-        self.which = [ [] ] * 3
-        for i in xrange(3) : self.which[i] = []
-        self.count_pos = [ 0 ] * 3
-        self.degenerate_base_names = {
-            (True, False,False,False) : "A",
-            (False,True, False,False) : "C",
-            (False,False,True, False) : "G",
-            (False,False,False,True ) : "T",
-            (True, False,False,True ) : "W",
-            (False,True, True, False) : "S",
-            (True, True, False,False) : "M",
-            (False,False,True, True ) : "K",
-            (True, False,True, False) : "R",
-            (False,True, False,True ) : "Y",
-            (False,True, True, True ) : "B",
-            (True, False,True, True ) : "D",
-            (True, True, False,True ) : "H",
-            (True, True, True, False) : "V",
-            (True, True, True, True ) : "N" }
-        self.names_to_bases = {}
-        self.infinity = -1
-        for bases in self.degenerate_base_names :
-            self.names_to_bases[ self.degenerate_base_names[ bases] ] = bases;
+        self.bits = 0
+
+    @property
+    def pos( self ) :
+        return [ [ ( self.bits >> ( 4 * ( 2 - i ) + j ) ) & 1 == 1 for j in range(4) ] for i in range(3) ]
+
+    @property
+    def which( self ) :
+        return [ list( nibble_bases[ ( self.bits >> ( 4 * ( 2 - i ) ) ) & 15 ] ) for i in range(3) ]
+
+    @property
+    def count_pos( self ) :
+        return [ len( nibble_bases[ ( self.bits >> ( 4 * ( 2 - i ) ) ) & 15 ] ) for i in range(3) ]
 
     def codon_string( self ) :
-        output_codon_string = ""
-        for i in xrange(3) :
-            output_codon_string += self.degenerate_base_names[ ( self.pos[i][0], self.pos[i][1], self.pos[i][2], self.pos[i][3] ) ]
-        return output_codon_string
+        return dc_codon_strings[ self.bits ]
 
     def set_pos( self, codon_pos, base ) :
         assert( codon_pos < 3 and codon_pos >= 0 )
         assert( base < 4 and base >= 0 )
-        if not self.pos[ codon_pos ][ base ] :
-            self.which[ codon_pos ].append( base )
-            self.pos[ codon_pos ][ base ] = True
-            self.count_pos[ codon_pos ] += 1
+        self.bits |= 1 << ( 4 * ( 2 - codon_pos ) + base )
     def reset( self ) :
-        for i in xrange(3) :
-            self.which[i][:] = []
-            self.count_pos[i] = 0
-            for j in xrange(4) : self.pos[i][j] = False
+        self.bits = 0
     def diversity( self ) :
-        for i in xrange(3) :
-            if self.count_pos[i] == 0 :
-                return self.infinity
-        div =  1
-        for i in xrange(3) :
-            div *= self.count_pos[i]
-        return div
+        return dc_diversities[ self.bits ]
     def log_diversity( self ) :
-        for i in xrange(3) : assert( self.count_pos[i] != 0 )
-        ld = 0.0
-        for i in xrange(3) : ld += math.log( self.count_pos[i] )
+        ld = dc_log_diversities[ self.bits ]
+        assert( ld is not None )
         return ld
+    def codons( self ) :
+        """The indices of the codons this degenerate codon expands to"""
+        codons = dc_codons[ self.bits ]
+        if codons is None :
+            codons = tuple( [ ( b0 << 4 ) | ( b1 << 2 ) | b2
+                for b0 in nibble_bases[ self.bits >> 8 ]
+                for b1 in nibble_bases[ ( self.bits >> 4 ) & 15 ]
+                for b2 in nibble_bases[ self.bits & 15 ] ] )
+            dc_codons[ self.bits ] = codons
+        return codons
     def index_from_lex( self, lex ) :
         """Get the index for a particular codon using a lex that's dimensioned from self.count_pos"""
         codon_index = 0
-        for i in xrange(3) :
-            codon_index = codon_index * 4 + self.which[i][lex.pos[i]]
+        for i in range(3) :
+            codon_index = codon_index * 4 + nibble_bases[ ( self.bits >> ( 4 * ( 2 - i ) ) ) & 15 ][ lex.pos[i] ]
         return codon_index
     def set_from_lex( self, lex ) :
         """
         Set the state for this degenerate codon using a lex that's iterating over all (2**4-1)**3 = 3375 codon options.
         Returns False if this is not a reasonable assignment; i.e. not all codon positions contain at least one base.
         """
-        self.reset()
-        for i in xrange(3) :
-            posi = lex.pos[i]+1 # take "14" to mean "all degererate nucleotides" and "0" to mean "only A"
-            sigdig = 8
-            for j in xrange(4) :
-                if posi / sigdig != 0 :
-                    self.set_pos( i, 3-j ) # so A = 0 and T = 3
-                posi = posi % sigdig
-                sigdig /= 2
+        # take "14" to mean "all degererate nucleotides" and "0" to mean "only A"
+        self.bits = ( ( lex.pos[0] + 1 ) << 8 ) | ( ( lex.pos[1] + 1 ) << 4 ) | ( lex.pos[2] + 1 )
         return True
-
+    def set_from_index( self, dc_index ) :
+        """Set the state from the index of a lex over all 3375 codon options, as stored in aas_for_dc"""
+        self.bits = dc_bits_for_index( dc_index )
+    def index( self ) :
+        """The index of this degenerate codon in a lex over all 3375 codon options"""
+        return ( ( self.bits >> 8 ) - 1 ) * 225 + ( ( ( self.bits >> 4 ) & 15 ) - 1 ) * 15 + ( self.bits & 15 ) - 1
+
+
+class PositionErrorEvaluator :
+    """
+    Computes the error at one position for a 21-bit amino-acid mask (bit i set if amino acid i
+    is present) with two table lookups: one over the low 11 bits and one over the high 10 bits.
+    Each table entry holds the partial error for its bits, plus "violation" for every required
+    amino acid that is absent or forbidden amino acid that is present.  Real errors are far
+    smaller than "violation", so a sum of at least "infeasible" means the mask is infeasible.
+    Matches AALibrary.error_given_aas_for_pos.
+    """
+    violation = 1 << 40
+    infeasible = 1 << 39
+
+    def __init__( self, aa_counts, required, forbidden ) :
+        present = [ 0 ] * 21
+        absent = [ 0 ] * 21
+        self.required_mask = 0
+        self.forbidden_mask = 0
+        for i in range(21) :
+            absent[i] = self.violation if required[i] else max( aa_counts[i], 0 )
+            present[i] = self.violation if forbidden[i] else ( -1 * aa_counts[i] if aa_counts[i] < 0 else 0 )
+            if required[i] : self.required_mask |= 1 << i
+            if forbidden[i] : self.forbidden_mask |= 1 << i
+        self.present_errors = present
+        self.absent_errors = absent
+        self.low_errors = self.partial_error_table( present[:11], absent[:11] )
+        self.high_errors = self.partial_error_table( present[11:], absent[11:] )
+
+    def partial_error_table( self, present, absent ) :
+        nbits = len( present )
+        table = [ 0 ] * ( 1 << nbits )
+        table[0] = sum( absent )
+        for mask in range( 1, 1 << nbits ) :
+            lowbit = mask & -mask
+            bit = lowbit.bit_length() - 1
+            table[ mask ] = table[ mask ^ lowbit ] + present[ bit ] - absent[ bit ]
+        return table
+
+    def error( self, aa_mask, infinity=-1 ) :
+        error = self.low_errors[ aa_mask & 2047 ] + self.high_errors[ aa_mask >> 11 ]
+        return infinity if error >= self.infeasible else error
+
+class SearchBudgetExceeded( Exception ) :
+    pass
 
 class AALibrary :
     def __init__( self ) :
@@ -216,30 +312,65 @@ class AALibrary :
         self.max_oligos_per_stretch = 0
         self.max_oligos_total = 0
         self.n_stretches = 0
+        self.prune_dominated = True
+        self.combination_engine = "auto" # or one of combination_search.engines, or "beam"
+        self.search_budget = None # the largest predicted work, in combinations, that will be searched
+        self.over_budget = "refuse" # or "reduce_dcs" or "heuristic"
+        self.beam_width = combination_search.default_beam_width
+        self.heuristic_max_evaluations = None # per position searched with the beam engine
+        self.heuristic_time_limit = None # seconds per position searched with the beam engine
+        self.exact_union_diversity = False
+        self.n_processes = 1
+        self.parallel_dp = False # run optimize_library as a tree reduction over n_processes workers
+        self.low_memory_dp = False # keep only every sqrt( n_positions )'th row of optimize_library, in float32
+        self.approximation_epsilon = None # if set, optimize_library may return an error up to ( 1 + epsilon ) times the smallest
+        self.use_position_cache = True
+        self.position_cache_dir = None # position_cache.default_cache_dir() if None
+        self.position_cache_max_bytes = position_cache.default_max_bytes
+        self.checkpoint_file = None
+        self.checkpoint_interval = 60.0 # seconds between the checkpoints written while a position is searched
+        self.resume = False
 
     def aas_for_degenerate_codon( self, degenerate_codon ) :
         aas = [ False ] * 21 # 21 because the stop codon counts as a codon.
-        lex = LexicographicalIterator( degenerate_codon.count_pos )
-        while not lex.at_end :
-            codon_index = degenerate_codon.index_from_lex( lex )
+        for codon_index in degenerate_codon.codons() :
             aas[ self.gcmapper.mapper[ codon_index ] ] = True
-            lex.increment()
         return aas
 
+    def build_degenerate_codon_table( self ) :
+        """Enumerate all 3375 degenerate codons, recording their amino-acid masks, codon masks and diversities"""
+        aa_masks = []
+        codon_masks = []
+        diversities = []
+        dc = DegenerateCodon()
+        for i in range( dc_table.n_degenerate_codons ) :
+            dc.set_from_index( i )
+            aa_mask = 0
+            codon_mask = 0
+            for codon_index in dc.codons() :
+                codon_mask |= 1 << codon_index
+                aa_mask |= 1 << self.gcmapper.mapper[ codon_index ]
+            aa_masks.append( aa_mask )
+            codon_masks.append( codon_mask )
+            diversities.append( dc.diversity() )
+        return dc_table.DegenerateCodonTable( aa_masks, codon_masks, diversities )
+
     def enumerate_aas_for_all_degenerate_codons( self ) :
-        if ( hasattr( self, "aas_for_dc") ) :
+        if ( hasattr( self, "dc_table" ) ) :
             return;
-        dims = [ 15, 15, 15 ];
-        self.aas_for_dc = [];
-        self.diversities_for_dc = []
-        self.dclex = LexicographicalIterator( dims )
-        dc = DegenerateCodon();
-        self.dclex.reset()
-        while not self.dclex.at_end :
-            dc.set_from_lex( self.dclex );
-            self.aas_for_dc.append( self.aas_for_degenerate_codon( dc ) )
-            self.diversities_for_dc.append( dc.diversity() )
-            self.dclex.increment()
+        self.dclex = LexicographicalIterator( [ 15, 15, 15 ] )
+        self.dc_table = dc_table.load_or_create_table( self.gcmapper.mapper, self.build_degenerate_codon_table )
+        self.aa_masks_for_dc = self.dc_table.aa_masks
+        self.codon_masks_for_dc = self.dc_table.codon_masks
+        self.diversities_for_dc = self.dc_table.diversities
+
+        # degenerate codons that encode the same amino acids share a single (read-only) list
+        aas_for_mask = {}
+        self.aas_for_dc = []
+        for mask in self.aa_masks_for_dc :
+            if mask not in aas_for_mask :
+                aas_for_mask[ mask ] = [ ( mask >> i ) & 1 == 1 for i in range(21) ]
+            self.aas_for_dc.append( aas_for_mask[ mask ] )
 
 
     #format should be a table with N columns and 23 rows
@@ -259,7 +390,7 @@ class AALibrary :
         self.forbidden = [ [] ] * self.n_positions
         self.stretch_reps = self.n_positions * [ 0 ]
         self.max_dcs_for_pos = self.n_positions * [ 1 ]
-        for i in xrange(self.n_positions) :
+        for i in range(self.n_positions) :
             self.aa_counts[ i ] = [ 0     ] * 21
             self.required[ i ]  = [ False ] * 21
             self.forbidden[ i ] = [ False ] * 21
@@ -275,7 +406,7 @@ class AALibrary :
         # the first position is always considered to be the start of a stretch
         self.n_stretches = 1
         self.stretch_reps[0] = 0
-        for i in xrange(1,self.n_positions) :
+        for i in range(1,self.n_positions) :
             if row2cols[i] == "|" :
                 last_rep = i
                 self.n_stretches += 1
@@ -292,7 +423,7 @@ class AALibrary :
         row3 = lines[2]
         row3cols = row3.split(",")[1:]
         self.max_dcs_per_pos = 1
-        for i in xrange( self.n_positions ) :
+        for i in range( self.n_positions ) :
             self.max_dcs_for_pos[ i ] = int( row3cols[i] )
             if self.max_dcs_for_pos[i] > self.max_dcs_per_pos :
                 self.max_dcs_per_pos = self.max_dcs_for_pos[i]
@@ -315,28 +446,51 @@ class AALibrary :
 
         self.max_per_position_error = 0
         obs = [ 0 ] * self.n_positions
-        for i in xrange(21) :
+        for i in range(21) :
             line = lines[ i + 3 ]
             vals = line.split(",")[1:]
-            for j in xrange(len(vals)):
+            for j in range(len(vals)):
                 if vals[j] == "!" :
                     self.forbidden[j][i] = True
                 elif vals[j] == "*" :
                     self.required[j][i] = True
                 else :
                     self.aa_counts[j][i] = int(vals[j])
-                obs[ j ] += self.aa_counts[j][i]
-        for i in xrange( self.n_positions ) :
+                # absent aas cost their positive counts and present aas their negative ones
+                obs[ j ] += abs( self.aa_counts[j][i] )
+        for i in range( self.n_positions ) :
             if obs[i] > self.max_per_position_error :
                 self.max_per_position_error = obs[i]
+        self.group_identical_positions()
+
+    def group_identical_positions( self ) :
+        """
+        Positions with the same counts, required and forbidden amino acids and number of DCs have the
+        same useful codons and tables, so they are grouped by that signature and only the first
+        position of each group (listed in distinct_positions) is searched; position_group[ i ] is the
+        index into distinct_positions of position i's group, and the other positions share their
+        representative's lists by reference.
+        """
+        group_for_signature = {}
+        self.distinct_positions = []
+        self.position_group = [ 0 ] * self.n_positions
+        for i in range( self.n_positions ) :
+            signature = ( tuple( self.aa_counts[i] ), tuple( self.required[i] ), tuple( self.forbidden[i] ), self.max_dcs_for_pos[i] )
+            if signature not in group_for_signature :
+                group_for_signature[ signature ] = len( self.distinct_positions )
+                self.distinct_positions.append( i )
+            self.position_group[i] = group_for_signature[ signature ]
+
+    def representative_for_position( self, pos ) :
+        return self.distinct_positions[ self.position_group[ pos ] ]
     def error_given_aas_for_pos( self, pos, aas ) :
         error = 0
-        for i in xrange(21) :
+        for i in range(21) :
             icount = self.aa_counts[ pos ][ i ]
             if not aas[ i ] :
                 if self.required[ pos ][ i ] :
                     return self.infinity
-                else :
+                elif icount > 0 :
                     error += icount
             else :
                 if self.forbidden[ pos ][ i ] :
@@ -347,7 +501,7 @@ class AALibrary :
 
     def error_given_aas_for_pos_ignore_req( self, pos, aas ) :
         error = 0
-        for i in xrange(21) :
+        for i in range(21) :
             icount = self.aa_counts[ pos ][ i ]
             if not aas[ i ] :
                 if icount > 0 :
@@ -361,114 +515,663 @@ class AALibrary :
 
     def useful_aaind_for_pos( self, aas, pos ) :
         aaind = 0
-        for i in xrange(21) :
+        for i in range(21) :
             iuseful = self.aa_counts[pos][i] != 0 or self.required[pos][i];
             aaind = 2*aaind + ( 1 if aas[i] and iuseful else 0 )
         return aaind
 
-    def find_useful_codons( self ) :
-        self.useful_codons = []
-
-        # the diversities for the degenerate codons; this is a three-dimensional array
-        # index 0: which position
-        # index 1: what error
-        # index 2: either 0 (for the codon's diveristy) or 1 (for the codon's index)
-
-        div_for_codons = []
-        temp_lex = LexicographicalIterator( [ 15, 15, 15 ] )
-        temp_dc = DegenerateCodon()
-        for i in xrange( self.n_positions ) :
-            self.useful_codons.append( [] )
-            div_for_codons.append( {} )
-        for i in xrange( 3375 ) :
-            iaas = self.aas_for_dc[ i ]
-            idiv = self.diversities_for_dc[ i ]
-            # TEMP!
-            temp_lex.set_from_index( i );
-            temp_dc.set_from_lex( temp_lex );
-            for j in xrange( self.n_positions ) :
-                ijerror = self.error_given_aas_for_pos_ignore_req( j, iaas )
-
-                print "error for codon: ", temp_dc.codon_string(), "position", j, "error:", ijerror
-                if ( ijerror == self.infinity ) : continue;
-
-                ij_aaind = self.useful_aaind_for_pos( iaas, j )
-
-                # keep this codon if it's the first codon producing ijerror
-                # OR it's the first codon with the given aa index producing ijerror
-                # OR the diversity for this codon is smaller than the smallest-seen
-                # diversity of any codon producing ijerror with the given aa index.
-                if ( ijerror not in div_for_codons[j] or
-                     ij_aaind not in div_for_codons[j][ ijerror ] or
-                     div_for_codons[j][ ijerror][ ij_aaind ][ 0 ] > idiv ) :
-                    if ( ijerror not in div_for_codons[j] )  :
-                        div_for_codons[j][ ijerror ] = {}
-                    div_for_codons[j][ ijerror ][ ij_aaind ] = [ idiv, i ]; # JS->Py note: could be a tuple?
-        for i in xrange( self.n_positions ) :
-            for j in div_for_codons[ i ] :
-                if ( j not in div_for_codons[i] ) : continue # JS->PY note: maybe unnecessary?
-                jaainds = div_for_codons[i][j]
-                for k in jaainds :
-                    self.useful_codons[i].append( jaainds[k][1] )
+    def build_error_evaluators( self ) :
+        evaluators = [ PositionErrorEvaluator( self.aa_counts[i], self.required[i], self.forbidden[i] )
+                       for i in self.distinct_positions ]
+        self.error_evaluators = [ evaluators[ self.position_group[i] ] for i in range( self.n_positions ) ]
 
+    def error_given_aa_mask_for_pos( self, pos, aa_mask ) :
+        """error_given_aas_for_pos for a 21-bit amino-acid mask"""
+        if not hasattr( self, "error_evaluators" ) :
+            self.build_error_evaluators()
+        return self.error_evaluators[ pos ].error( aa_mask, self.infinity )
+
+    def group_degenerate_codons_by_aa_mask( self ) :
+        """
+        Group the 3375 degenerate codons by the set of amino acids they encode.  For every distinct
+        aa mask, record the smallest diversity of any codon encoding it and its representative: the
+        lowest-index codon with that diversity.  This does not depend on the library, so it is
+        computed once; per-position work can then visit a few hundred masks instead of 3375 codons.
+        """
+        if hasattr( self, "distinct_aa_masks" ) :
+            return
+        masks = numpy.array( self.aa_masks_for_dc, dtype=numpy.int64 )
+        diversities = numpy.array( self.diversities_for_dc, dtype=numpy.int64 )
+        order = numpy.lexsort( ( numpy.arange( len( masks ) ), diversities, masks ) )
+        sorted_masks = masks[ order ]
+        starts = numpy.flatnonzero( numpy.concatenate( ( [ True ], sorted_masks[ 1: ] != sorted_masks[ :-1 ] ) ) )
+
+        self.distinct_aa_masks = sorted_masks[ starts ]
+        self.min_diversity_for_aa_mask_class = diversities[ order[ starts ] ]
+        self.representative_dc_for_aa_mask_class = order[ starts ]
+
+        # codons sorted by ( mask, diversity, index ); each class is a contiguous run starting with its ties
+        self.dcs_sorted_by_aa_mask = order
+        self.aa_mask_class_bounds = numpy.append( starts, len( masks ) )
+        self.aa_mask_class_for_dc = numpy.empty( len( masks ), dtype=numpy.int64 )
+        self.aa_mask_class_for_dc[ order ] = numpy.repeat( numpy.arange( len( starts ) ), numpy.diff( self.aa_mask_class_bounds ) )
+
+    def tied_codons_for_dc( self, dc_index ) :
+        """
+        All degenerate codons encoding the same amino acids as dc_index with the smallest diversity
+        for that set of amino acids, in increasing index order; e.g. to choose among them by vendor
+        """
+        self.group_degenerate_codons_by_aa_mask()
+        aa_class = self.aa_mask_class_for_dc[ dc_index ]
+        min_div = self.min_diversity_for_aa_mask_class[ aa_class ]
+        ties = []
+        for i in range( self.aa_mask_class_bounds[ aa_class ], self.aa_mask_class_bounds[ aa_class+1 ] ) :
+            dc = self.dcs_sorted_by_aa_mask[ i ]
+            if self.diversities_for_dc[ dc ] != min_div : break
+            ties.append( int( dc ) )
+        return ties
+
+    def find_useful_codons( self ) :
+        """
+        For each position, keep, for every (error, useful-aa signature) pair, the lowest-diversity
+        degenerate codon that produces it (the earliest one if there is a tie); the codons that
+        encode a forbidden amino acid are discarded.  Only the representative of each distinct
+        aa mask is considered, since the others encode the same amino acids with no smaller
+        diversity.  The errors for every mask at every position are computed at once from the
+        aa incidence matrix, and the per-group minimum is found by sorting.
+        useful_codons[ pos ] lists degenerate-codon indices in increasing order; identical positions
+        share one list.
+
+        With exact_union_diversity, a more diverse codon can still be the better partner for
+        another codon whose codons it overlaps, so every codon that encodes no forbidden amino
+        acid is kept and prune_dominated_codons is left to thin them out.
+        """
+        self.group_degenerate_codons_by_aa_mask()
+
+        # one column per group of identical positions: 21 x n_distinct
+        n_distinct = len( self.distinct_positions )
+        counts = numpy.array( [ self.aa_counts[i] for i in self.distinct_positions ], dtype=numpy.int64 ).T
+        forbidden = numpy.array( [ self.forbidden[i] for i in self.distinct_positions ], dtype=numpy.int64 ).T
+        required = numpy.array( [ self.required[i] for i in self.distinct_positions ], dtype=bool ).T
+        pos_counts = numpy.where( counts > 0, counts, 0 )
+        neg_counts = numpy.where( counts < 0, -counts, 0 )
+        aa_bits = numpy.left_shift( 1, numpy.arange( 21, dtype=numpy.int64 ) )
+        useful_masks = ( ( ( counts != 0 ) | required ) * aa_bits[ :, None ] ).sum( axis=0 )
+
+        # error_given_aas_for_pos_ignore_req for every aa mask at every position:
+        # absent aas contribute their positive counts and present aas their negated negative counts
+        aa_masks = self.distinct_aa_masks
+        incidence = ( aa_masks[ :, None ] >> numpy.arange( 21 ) ) & 1
+        errors = pos_counts.sum( axis=0 )[ None, : ] + incidence.dot( neg_counts - pos_counts )
+        allowed = incidence.dot( forbidden ) == 0
+        signatures = aa_masks[ :, None ] & useful_masks[ None, : ]
+
+        if self.exact_union_diversity :
+            allowed_dcs = allowed[ self.aa_mask_class_for_dc ]
+            useful_for_group = [ numpy.flatnonzero( allowed_dcs[ :, g ] ).tolist() for g in range( n_distinct ) ]
+            self.useful_codons = [ useful_for_group[ self.position_group[i] ] for i in range( self.n_positions ) ]
+            return
+
+        mask_inds, positions = numpy.nonzero( allowed )
+        errors = errors[ mask_inds, positions ]
+        signatures = signatures[ mask_inds, positions ]
+        diversities = self.min_diversity_for_aa_mask_class[ mask_inds ]
+        dc_inds = self.representative_dc_for_aa_mask_class[ mask_inds ]
+
+        # group-min: sort by ( position, error, signature, diversity, dc index ) and keep the first of each group
+        order = numpy.lexsort( ( dc_inds, diversities, signatures, errors, positions ) )
+        positions = positions[ order ]
+        errors = errors[ order ]
+        signatures = signatures[ order ]
+        first = numpy.ones( len( order ), dtype=bool )
+        first[ 1: ] = ( ( positions[ 1: ] != positions[ :-1 ] ) | ( errors[ 1: ] != errors[ :-1 ] ) |
+                        ( signatures[ 1: ] != signatures[ :-1 ] ) )
+        kept_dcs = dc_inds[ order ][ first ]
+        kept_positions = positions[ first ]
+        order = numpy.lexsort( ( kept_dcs, kept_positions ) )
+        kept_dcs = kept_dcs[ order ]
+        bounds = numpy.searchsorted( kept_positions[ order ], numpy.arange( n_distinct + 1 ) )
+        useful_for_group = [ kept_dcs[ bounds[ g ]:bounds[ g+1 ] ].tolist() for g in range( n_distinct ) ]
+        self.useful_codons = [ useful_for_group[ self.position_group[i] ] for i in range( self.n_positions ) ]
+
+
+    def prune_dominated_codons( self ) :
+        """
+        Remove from useful_codons[ pos ] every codon b that is dominated by another useful codon a:
+        a encodes every amino acid of b that is required or has a positive count, b encodes every
+        amino acid of a that has a negative count, and a's diversity is no larger than b's.  Swapping
+        b for a in any combination then gives no more error and no more diversity (and possibly one
+        fewer degenerate codon), so b never appears in an optimal design.  Candidate dominators are
+        visited before the codons they could dominate, so only undominated codons need be compared.
+
+        With exact_union_diversity, diversities no longer add, and a dominates b only if a's codons
+        are a subset of b's and both encode the same required and positive-count amino acids: the
+        union of a with any other codons is then no larger than b's, encodes the same wanted amino
+        acids and no more negative-count ones.
+        """
+        self.n_dominated_codons = [ 0 ] * self.n_positions
+        for i in self.distinct_positions :
+            want_present = 0
+            want_absent = 0
+            for k in range(21) :
+                if self.required[i][k] or self.aa_counts[i][k] > 0 :
+                    want_present |= 1 << k
+                elif self.aa_counts[i][k] < 0 :
+                    want_absent |= 1 << k
+
+            if self.exact_union_diversity :
+                kept = self.codon_subset_minimal_codons( self.useful_codons[i], want_present )
+                self.n_dominated_codons[i] = len( self.useful_codons[i] ) - len( kept )
+                self.useful_codons[i] = kept
+                continue
+
+            candidates = []
+            for dc in self.useful_codons[i] :
+                present = self.aa_masks_for_dc[ dc ] & want_present
+                absent = self.aa_masks_for_dc[ dc ] & want_absent
+                candidates.append( ( self.diversities_for_dc[ dc ], -1 * bin( present ).count( "1" ), bin( absent ).count( "1" ), dc ) )
+            candidates.sort()
+
+            undominated = []
+            kept = []
+            for candidate in candidates :
+                dc = candidate[ 3 ]
+                present = self.aa_masks_for_dc[ dc ] & want_present
+                absent = self.aa_masks_for_dc[ dc ] & want_absent
+                dominated = False
+                for other_present, other_absent in undominated :
+                    if present & ~other_present == 0 and other_absent & ~absent == 0 :
+                        dominated = True
+                        break
+                if not dominated :
+                    undominated.append( ( present, absent ) )
+                    kept.append( dc )
+            self.n_dominated_codons[i] = len( candidates ) - len( kept )
+            self.useful_codons[i] = sorted( kept )
+        for i in range( self.n_positions ) :
+            rep = self.representative_for_position( i )
+            self.n_dominated_codons[i] = self.n_dominated_codons[ rep ]
+            self.useful_codons[i] = self.useful_codons[ rep ]
+        print( "Dominance pruning removed", sum( self.n_dominated_codons ), "of", \
+            sum( self.n_dominated_codons ) + sum( [ len( x ) for x in self.useful_codons ] ), "useful codons" )
+
+    def codon_subset_minimal_codons( self, dcs, want_present ) :
+        """
+        The codons in dcs, in increasing order, whose codon masks are not a superset of another
+        codon's in dcs that encodes the same amino acids out of want_present
+        """
+        groups = {}
+        for dc in dcs :
+            groups.setdefault( self.aa_masks_for_dc[ dc ] & want_present, [] ).append( dc )
+        kept = []
+        for group in groups.values() :
+            # a proper subset has a smaller diversity, so dominators are visited first
+            group.sort( key=lambda dc : ( self.diversities_for_dc[ dc ], dc ) )
+            undominated = []
+            for dc in group :
+                codon_mask = self.codon_masks_for_dc[ dc ]
+                dominated = False
+                for other_mask in undominated :
+                    if other_mask & ~codon_mask == 0 :
+                        dominated = True
+                        break
+                if not dominated :
+                    undominated.append( codon_mask )
+                    kept.append( dc )
+        return sorted( kept )
 
     def codon_inds_from_useful_codon_lex( self, position, useful_codon_lex ) :
         inds = []
-        for i in xrange( len( useful_codon_lex.pos ) ) :
+        for i in range( len( useful_codon_lex.pos ) ) :
             inds.append( self.useful_codons[ position ][ useful_codon_lex.pos[i] ] )
         return inds
 
+    def dc_combinations( self, pos, results ) :
+        """
+        Convert the output of a combination_search engine for every n_dcs at pos, whose combinations
+        are indices into useful_codons[ pos ], into a list indexed by n_dcs of ( best_diversity, best_dcs )
+        pairs where best_dcs[ error ] lists degenerate-codon indices (or is None)
+        """
+        dc_results = [ None ]
+        for j in range( 1, len( results ) ) :
+            best_diversity, best_combo = results[j]
+            best_dcs = [ None if combo is None else [ self.useful_codons[pos][k] for k in combo ] for combo in best_combo ]
+            dc_results.append( ( best_diversity, best_dcs ) )
+        return dc_results
+
+    def record_smallest_diversity_combinations( self, pos, dc_results ) :
+        """Store the output of dc_combinations (or of the position cache) in the per-position tables"""
+        for j in range( 1, len( dc_results ) ) :
+            best_diversity, best_dcs = dc_results[j]
+            for error in range( len( best_diversity ) ) :
+                if best_diversity[ error ] == 0 : continue
+                self.divmin_for_error_for_n_dcs[pos][j][error] = math.log( best_diversity[ error ] )
+                self.codons_for_error_for_n_dcs[pos][j][error] = list( best_dcs[ error ] )
+                self.errors_for_n_dcs_for_position[pos][j].append( error )
+
+    def error_ceiling_for_position( self, pos ) :
+        """The largest error any codons can give at pos: every count, positive or negative, counted against it"""
+        return sum( [ abs( count ) for count in self.aa_counts[pos] ] )
+
+    def position_cache_key( self, pos ) :
+        """
+        The position_cache key for the results at pos: everything they depend on, including the engine
+        chosen for it.  The results stop at the position's own error ceiling, so the key does not change
+        with the other positions of the library.
+        """
+        return position_cache.position_key( self.aa_counts[pos], self.required[pos], self.forbidden[pos],
+                                            self.max_dcs_for_pos[pos], self.error_ceiling_for_position( pos ),
+                                            self.prune_dominated, self.exact_union_diversity,
+                                            dc_table.genetic_code_digest( self.gcmapper.mapper ).hex(),
+                                            self.engine_for_position[ self.representative_for_position( pos ) ],
+                                            combination_search.engine_version )
+
+    def results_for_position_cache( self, pos, dc_results ) :
+        """dc_results cut off after the position's error ceiling, beyond which no error level is reachable"""
+        n_errors = self.error_ceiling_for_position( pos ) + 1
+        return [ None ] + [ [ list( best_diversity[ :n_errors ] ), list( best_dcs[ :n_errors ] ) ]
+                            for best_diversity, best_dcs in dc_results[1:] ]
+
+    def read_position_cache( self, pos, key, cache_dir ) :
+        """The dc_results stored under key, padded out to max_per_position_error+1 error levels, or None"""
+        dc_results = position_cache.read_results( key, cache_dir )
+        if dc_results is None :
+            return None
+        n_errors = self.max_per_position_error + 1
+        return [ None ] + [ [ best_diversity + [ 0 ] * ( n_errors - len( best_diversity ) ),
+                              best_dcs + [ None ] * ( n_errors - len( best_dcs ) ) ]
+                            for best_diversity, best_dcs in dc_results[1:] ]
+
+    def useful_codon_tables( self, pos ) :
+        """The aa masks, diversities and (with exact_union_diversity, else None) codon masks of the useful codons at pos"""
+        useful_masks = [ self.aa_masks_for_dc[ x ] for x in self.useful_codons[pos] ]
+        useful_diversities = [ self.diversities_for_dc[ x ] for x in self.useful_codons[pos] ]
+        useful_codon_masks = None
+        if self.exact_union_diversity :
+            useful_codon_masks = [ self.codon_masks_for_dc[ x ] for x in self.useful_codons[pos] ]
+        return useful_masks, useful_diversities, useful_codon_masks
+
+    def smallest_diversity_combinations_for_position( self, pos ) :
+        """
+        Run the combination engine at one position for every number of DCs it allows; returns a list
+        indexed by n_dcs of ( best_diversity, best_combo ) pairs, with entry 0 None
+        """
+        useful_masks, useful_diversities, useful_codon_masks = self.useful_codon_tables( pos )
+        engine_name = self.engine_for_position[ self.representative_for_position( pos ) ]
+        if engine_name == "beam" :
+            results, n_evaluations, complete = combination_search.beam_search(
+                useful_masks, useful_diversities, self.error_evaluators[pos], self.max_dcs_for_pos[pos],
+                self.max_per_position_error+1, useful_codon_masks, self.beam_width,
+                self.heuristic_max_evaluations, self.heuristic_time_limit )
+            self.report_heuristic_bounds( pos, results, n_evaluations, complete )
+            return results
+        if engine_name in combination_search.all_level_engines :
+            return combination_search.all_level_engines[ engine_name ](
+                useful_masks, useful_diversities, self.error_evaluators[pos], self.max_dcs_for_pos[pos],
+                self.max_per_position_error+1, useful_codon_masks )
+        engine = combination_search.engines[ engine_name ]
+        results = [ None ]
+        for j in range( 1, self.max_dcs_for_pos[pos]+1 ) :
+            results.append( engine( useful_masks, useful_diversities, self.error_evaluators[pos],
+                                    j, self.max_per_position_error+1, useful_codon_masks ) )
+        return results
+
+    def report_heuristic_bounds( self, pos, results, n_evaluations, complete ) :
+        """
+        Print how far the beam search's tables at pos could be from the exact ones.  The single-DC
+        results are exact.  For more DCs, each error level found is printed with the ratio of its
+        diversity to combination_search.diversity_lower_bounds, which bounds every combination of that
+        many DCs and so the exact smallest at that level, and the error levels with no set found are
+        listed, since the exact engines might reach some of them.
+        """
+        useful_masks, useful_diversities, useful_codon_masks = self.useful_codon_tables( pos )
+        bounds = combination_search.diversity_lower_bounds( useful_diversities, self.max_dcs_for_pos[pos], useful_codon_masks )
+        print( "beam search at position", pos, "scored", n_evaluations, "sets" + ( "" if complete else ", stopped by its budget" ) )
+        for j in range( 1, len( results ) ) :
+            best_diversity = results[j][0]
+            if j == 1 or bounds[j] is None :
+                print( "   ", j, "DCs: exact" )
+                continue
+            missing = []
+            for error in range( len( best_diversity ) ) :
+                if best_diversity[ error ] == 0 :
+                    missing.append( error )
+                    continue
+                print( "   ", j, "DCs, error", error, ": diversity", best_diversity[ error ],
+                       "within a factor of %.3g of the exact smallest" % ( best_diversity[ error ] / float( bounds[j] ) ) )
+            if missing :
+                print( "   ", j, "DCs: no set found for errors", ranges_string( missing ) + "; the exact engines may reach some of them" )
+
+    def smallest_diversity_combinations_for_ranks( self, pos, n_dcs, begin, end ) :
+        """exhaustive_search_ranks over the combinations of n_dcs useful codons at pos with ranks in [ begin, end )"""
+        useful_masks, useful_diversities, useful_codon_masks = self.useful_codon_tables( pos )
+        return combination_search.exhaustive_search_ranks( useful_masks, useful_diversities, self.error_evaluators[pos],
+                                                           n_dcs, self.max_per_position_error+1, begin, end, useful_codon_masks )
+
+    def smallest_diversity_combinations_with_checkpoints( self, pos, in_progress=None ) :
+        """
+        smallest_diversity_combinations_for_position for the exhaustive engine, walking the combinations
+        of each number of DCs combinations_per_shard ranks at a time and writing the cursor into the
+        checkpoint every checkpoint_interval seconds.  in_progress is the cursor read back from a
+        checkpoint at pos, or None to start from the first combination.
+        """
+        n_errors = self.max_per_position_error+1
+        n_useful = len( self.useful_codons[pos] )
+        if in_progress is None :
+            results, n_dcs, begin, partial = [ None ], 1, 0, None
+        else :
+            results, n_dcs, begin, partial = in_progress[ "results" ], in_progress[ "n_dcs" ], in_progress[ "next_rank" ], in_progress[ "partial" ]
+        while n_dcs <= self.max_dcs_for_pos[pos] :
+            n_ranks = combination_search.n_combinations( n_useful, n_dcs )
+            while begin < n_ranks :
+                end = min( n_ranks, begin + combinations_per_shard )
+                ranked_results = [ self.smallest_diversity_combinations_for_ranks( pos, n_dcs, begin, end ) ]
+                if partial is not None :
+                    ranked_results.insert( 0, partial )
+                partial = combination_search.merge_ranked_results_keeping_ranks( ranked_results, n_errors )
+                begin = end
+                if time.time() - self.last_checkpoint_time >= self.checkpoint_interval :
+                    self.write_checkpoint( { "position" : pos, "results" : results, "n_dcs" : n_dcs,
+                                             "next_rank" : begin, "partial" : partial } )
+            results.append( combination_search.merge_ranked_results( [] if partial is None else [ partial ], n_errors ) )
+            n_dcs, begin, partial = n_dcs + 1, 0, None
+        return results
+
+    def smallest_diversity_combinations_in_order( self, positions, in_progress=None ) :
+        """
+        Yield ( position, results ) for each of positions in turn.  When checkpointing, positions searched
+        by the exhaustive engine are walked with a cursor that is saved in the checkpoint, and in_progress
+        is the cursor to resume from (or None)
+        """
+        for i in positions :
+            if self.checkpoint_file is not None and self.engine_for_position[i] == "exhaustive" :
+                cursor = in_progress if in_progress is not None and in_progress[ "position" ] == i else None
+                yield i, self.smallest_diversity_combinations_with_checkpoints( i, cursor )
+            else :
+                yield i, self.smallest_diversity_combinations_for_position( i )
+
+    def pool_tasks_for_position( self, pos ) :
+        """
+        The pool tasks for one position as ( size, task ) pairs.  A task is ( pos, None, None, None ) for
+        the whole position or ( pos, n_dcs, begin, end ) for a range of combination ranks: when the
+        exhaustive engine would visit more than combinations_per_shard combinations of some number of
+        DCs, each n_dcs is split into up to n_processes ranges so that one long position can use the
+        whole pool.
+        """
+        n_useful = len( self.useful_codons[pos] )
+        n_ranks = [ combination_search.n_combinations( n_useful, j ) for j in range( self.max_dcs_for_pos[pos]+1 ) ]
+        n_ranges = self.exhaustive_rank_ranges( n_useful, self.max_dcs_for_pos[pos] )
+        if self.engine_for_position[ pos ] != "exhaustive" or n_ranges is None :
+            return [ ( sum( n_ranks ), ( pos, None, None, None ) ) ]
+        tasks = []
+        for j in range( 1, self.max_dcs_for_pos[pos]+1 ) :
+            for begin, end in combination_search.rank_ranges( n_ranks[j], n_ranges[j] ) :
+                tasks.append( ( end - begin, ( pos, j, begin, end ) ) )
+        return tasks
+
+    def exhaustive_rank_ranges( self, n_useful, max_dcs ) :
+        """
+        The number of rank ranges pool_tasks_for_position splits the combinations of each n_dcs into
+        (entry 0 unused) for an exhaustive search of n_useful codons, or None if it is not split
+        """
+        n_ranks = [ combination_search.n_combinations( n_useful, j ) for j in range( max_dcs+1 ) ]
+        if self.n_processes <= 1 or max( n_ranks ) <= combinations_per_shard :
+            return None
+        return [ max( 1, min( self.n_processes, ( n + combinations_per_shard - 1 ) // combinations_per_shard ) ) for n in n_ranks ]
+
+    def smallest_diversity_combinations_in_pool( self, positions ) :
+        """
+        Spread positions over n_processes worker processes, yielding ( position, results ) pairs
+        as they finish.  The workers get this library from library_pool, so only task descriptions
+        and results cross between processes once they have started.
+        Positions split into ranges of combinations are yielded once all of their ranges are done.
+        Tasks are handed out largest first so that the longest one does not start last.
+        """
+        tasks = []
+        for i in positions :
+            tasks.extend( self.pool_tasks_for_position( i ) )
+        tasks.sort( key=lambda task : ( -1 * task[0], task[1] ) )
+        tasks = [ task for size, task in tasks ]
+        n_ranges_left = [ 0 ] * self.n_positions
+        for task in tasks :
+            n_ranges_left[ task[0] ] += 1
+        ranked_results = [ {} for i in range( self.n_positions ) ]
+
+        pool = library_pool( self, min( self.n_processes, len( tasks ) ) )
+        try :
+            for task, result in pool.imap_unordered( smallest_diversity_combinations_in_pool_worker, tasks ) :
+                pos, n_dcs = task[0], task[1]
+                if n_dcs is None :
+                    yield pos, result
+                    continue
+                ranked_results[pos].setdefault( n_dcs, [] ).append( result )
+                n_ranges_left[pos] -= 1
+                if n_ranges_left[pos] == 0 :
+                    yield pos, [ None ] + [ combination_search.merge_ranked_results( ranked_results[pos][j], self.max_per_position_error+1 )
+                                            for j in range( 1, self.max_dcs_for_pos[pos]+1 ) ]
+                    ranked_results[pos] = None
+            pool.close()
+        except :
+            pool.terminate()
+            raise
+        finally :
+            pool.join()
+            set_pool_library( None )
+
+    def plan_position( self, pos, engine=None ) :
+        """Choose the engine for pos, unless it is given, and record its predicted work"""
+        if engine is None :
+            engine = self.combination_engine
+        useful_masks, useful_diversities, useful_codon_masks = self.useful_codon_tables( pos )
+        if engine == "beam" :
+            work = combination_search.predicted_beam_evaluations( len( useful_masks ), self.max_dcs_for_pos[pos],
+                                                                  self.max_per_position_error+1, self.beam_width,
+                                                                  self.heuristic_max_evaluations ) * combination_search.relative_costs[ "beam" ]
+        elif engine == "auto" :
+            # a position searched in this process is checkpointed part way through only by the exhaustive walk,
+            # which is only worth forcing on a position longer than the shard it saves its cursor after
+            resumable = self.checkpoint_file is not None and self.n_processes <= 1 and \
+                combination_search.predicted_combinations( len( useful_masks ), self.max_dcs_for_pos[pos] ) > combinations_per_shard
+            engine, work = combination_search.cheapest_engine( useful_masks, self.error_evaluators[pos],
+                                                               self.max_dcs_for_pos[pos], useful_codon_masks, resumable,
+                                                               self.exhaustive_rank_ranges( len( useful_masks ), self.max_dcs_for_pos[pos] ) )
+        else :
+            work = combination_search.predicted_work( engine, useful_masks, self.error_evaluators[pos],
+                                                      self.max_dcs_for_pos[pos], useful_codon_masks,
+                                                      self.exhaustive_rank_ranges( len( useful_masks ), self.max_dcs_for_pos[pos] ) )
+        self.engine_for_position[ pos ] = engine
+        self.predicted_work_for_position[ pos ] = work
+
+    def choose_engines( self ) :
+        """
+        Choose the engine for each distinct position (the cheapest exact one if combination_engine is
+        "auto") and predict how much work it will be; the engine is part of the position cache key
+        """
+        self.engine_for_position = {}
+        self.predicted_work_for_position = {}
+        for i in self.distinct_positions :
+            self.plan_position( i )
+
+    def plan_combination_search( self, positions ) :
+        """
+        Before the combination search starts, report the engine and predicted work at each of positions,
+        the distinct positions that the position cache did not hold.  If their total predicted work is
+        over search_budget, either raise SearchBudgetExceeded or, if over_budget is "reduce_dcs",
+        repeatedly take one DC away from the most expensive position that allows more than one until
+        the search fits, or if it is "heuristic", repeatedly switch the most expensive position still
+        searched exactly over to the beam engine, and if the beam engine at every position is still
+        over, limit its evaluations with fit_beam_search_to_budget.
+        """
+        total_work = sum( [ self.predicted_work_for_position[i] for i in positions ] )
+        if self.search_budget is not None and total_work > self.search_budget :
+            if self.over_budget not in ( "reduce_dcs", "heuristic" ) :
+                raise SearchBudgetExceeded( "predicted work of %.3g combinations is over the search budget of %.3g" % ( total_work, self.search_budget ) )
+            while self.over_budget == "heuristic" and total_work > self.search_budget :
+                exact = [ i for i in positions if self.engine_for_position[i] != "beam" ]
+                if not exact :
+                    self.fit_beam_search_to_budget( positions )
+                    total_work = sum( [ self.predicted_work_for_position[i] for i in positions ] )
+                    break
+                worst = max( exact, key=lambda i : ( self.predicted_work_for_position[i], -1 * i ) )
+                print( "over the search budget: using the beam engine at position", worst, "and the positions identical to it" )
+                self.plan_position( worst, "beam" )
+                total_work = sum( [ self.predicted_work_for_position[i] for i in positions ] )
+            while total_work > self.search_budget :
+                reducible = [ i for i in positions if self.max_dcs_for_pos[i] > 1 ]
+                if not reducible :
+                    raise SearchBudgetExceeded( "predicted work of %.3g combinations is over the search budget of %.3g with a single DC at every position" % ( total_work, self.search_budget ) )
+                worst = max( reducible, key=lambda i : ( self.predicted_work_for_position[i], -1 * i ) )
+                for i in range( self.n_positions ) :
+                    if self.position_group[i] == self.position_group[ worst ] :
+                        self.max_dcs_for_pos[i] -= 1
+                print( "over the search budget: allowing at most", self.max_dcs_for_pos[ worst ], "DCs at position", worst,
+                       "and the positions identical to it" )
+                self.plan_position( worst )
+                total_work = sum( [ self.predicted_work_for_position[i] for i in positions ] )
+            self.max_dcs_per_pos = max( self.max_dcs_for_pos )
+
+        for i in positions :
+            print( "position", i, ":", len( self.useful_codons[i] ), "useful codons, up to", self.max_dcs_for_pos[i], "DCs,",
+                   combination_search.predicted_combinations( len( self.useful_codons[i] ), self.max_dcs_for_pos[i] ), "combinations;",
+                   self.engine_for_position[i], "engine, predicted work %.3g" % self.predicted_work_for_position[i] )
+        print( "total predicted work %.3g" % total_work )
+
+    def fit_beam_search_to_budget( self, positions ) :
+        """
+        Lower heuristic_max_evaluations so that the beam search at every one of positions fits in an
+        equal share of search_budget.  Each position scores all of its single-DC sets whatever the limit,
+        and overshoots it by at most that many, so SearchBudgetExceeded is raised only if those alone
+        are over the budget.
+        """
+        n_useful = max( [ len( self.useful_codons[i] ) for i in positions ] )
+        share = self.search_budget / ( len( positions ) * combination_search.relative_costs[ "beam" ] )
+        max_evaluations = int( share ) - n_useful
+        if max_evaluations < 0 :
+            raise SearchBudgetExceeded( "the beam engine's single-DC sets at every position are over the search budget of %.3g" % self.search_budget )
+        if self.heuristic_max_evaluations is None or max_evaluations < self.heuristic_max_evaluations :
+            self.heuristic_max_evaluations = max_evaluations
+        print( "over the search budget: scoring at most", self.heuristic_max_evaluations, "sets per position with the beam engine" )
+        for i in positions :
+            self.plan_position( i, "beam" )
+
+    def checkpoint_run_key( self ) :
+        """Identifies the search for the checkpoint: the distinct positions and everything their results depend on"""
+        heuristic = [ i for i in self.distinct_positions if self.engine_for_position[i] == "beam" ]
+        return position_cache.position_key( self.distinct_positions, [ self.position_cache_key( i ) for i in self.distinct_positions ],
+                                            heuristic, self.beam_width, self.heuristic_max_evaluations, self.heuristic_time_limit )
+
+    def write_checkpoint( self, in_progress=None ) :
+        """Save the positions completed so far and, optionally, the cursor into the position being searched"""
+        checkpoint.write_checkpoint( self.checkpoint_file, self.checkpoint_key, self.checkpoint_completed, in_progress )
+        self.last_checkpoint_time = time.time()
+
+    def resume_from_checkpoint( self, positions ) :
+        """
+        Record the results of the positions the checkpoint says are complete; returns the positions
+        that are left and the cursor into the position that was being searched (or None)
+        """
+        state = checkpoint.read_checkpoint( self.checkpoint_file, self.checkpoint_key )
+        if state is None :
+            print( "no checkpoint in", self.checkpoint_file, "to resume from; starting from the first position" )
+            return positions, None
+        remaining = []
+        for i in positions :
+            if i not in state[ "completed" ] :
+                remaining.append( i )
+                continue
+            self.checkpoint_completed[i] = state[ "completed" ][i]
+            self.record_smallest_diversity_combinations( i, state[ "completed" ][i] )
+        print( "resuming from", self.checkpoint_file, "with", len( positions ) - len( remaining ), "positions complete" )
+        return remaining, state[ "in_progress" ]
+
     def compute_smallest_diversity_for_all_errors( self ) :
 
         self.enumerate_aas_for_all_degenerate_codons();
         self.find_useful_codons();
+        if self.prune_dominated :
+            self.prune_dominated_codons()
+        self.build_error_evaluators()
+        self.choose_engines()
+
+        # positions whose results were stored by an earlier run are read back rather than recomputed,
+        # and only the others are planned against the search budget
+        positions = list( self.distinct_positions )
+        cached_results = {}
+        if self.use_position_cache :
+            cache_dir = self.position_cache_dir if self.position_cache_dir is not None else position_cache.default_cache_dir()
+            positions = []
+            for i in self.distinct_positions :
+                dc_results = None
+                if self.engine_for_position[i] != "beam" :
+                    dc_results = self.read_position_cache( i, self.position_cache_key( i ), cache_dir )
+                if dc_results is None :
+                    positions.append( i )
+                else :
+                    cached_results[i] = dc_results
+        self.plan_combination_search( positions )
+        if self.use_position_cache :
+            # the plan may have reduced the number of DCs at a position, and so changed its key;
+            # heuristic results are not stored, since they depend on the search budget
+            cache_keys = {}
+            for i in list( positions ) :
+                if self.engine_for_position[i] == "beam" : continue
+                cache_keys[i] = self.position_cache_key( i )
+                dc_results = self.read_position_cache( i, cache_keys[i], cache_dir )
+                if dc_results is not None :
+                    positions.remove( i )
+                    cached_results[i] = dc_results
 
         self.divmin_for_error_for_n_dcs = [ [] ] * self.n_positions
         self.codons_for_error_for_n_dcs = [ [] ] * self.n_positions
         self.errors_for_n_dcs_for_position = [ [] ] * self.n_positions
-        for i in xrange(self.n_positions) :
+        for i in self.distinct_positions :
             #print "compute_smallest_diversity_for_all_errors", i, len( self.divmin_for_error_for_n_dcs ), len( self.max_dcs_for_pos )
             self.divmin_for_error_for_n_dcs[i] =    ( self.max_dcs_for_pos[i]+1 ) * [ [] ]
             self.codons_for_error_for_n_dcs[i] =    ( self.max_dcs_for_pos[i]+1 ) * [ [] ]
             self.errors_for_n_dcs_for_position[i] = ( self.max_dcs_for_pos[i]+1 ) * [ [] ]
-            for j in xrange(1, self.max_dcs_for_pos[i]+1) :
+            for j in range(1, self.max_dcs_for_pos[i]+1) :
                 self.divmin_for_error_for_n_dcs[i][j] = ( self.max_per_position_error+1 ) * [ self.infinity ]
                 self.codons_for_error_for_n_dcs[i][j] = ( self.max_per_position_error+1 ) * [ self.infinity ]
                 self.errors_for_n_dcs_for_position[i][j] = []
-        aas_for_combo = 21 * [ False ]
-        for i in xrange( self.n_positions ) :
-            for j in xrange(1,self.max_dcs_for_pos[i]+1) :
-                dims = j*[ 0 ]
-                print "finding smallest diversity codons for errors", i, j, ":"
-                for k in xrange(j) :
-                    dims[k] = len( self.useful_codons[i] )
-                    print dims[k],
-                print
-                jlex = LexicographicalIterator( dims )
-                jlex.upper_diagonal_reset()
-
-                while not jlex.at_end :
-                    for k in xrange(21) : aas_for_combo[k] = False
-                    diversity = 0
-                    for k in xrange(j) :
-                        kcodon = self.useful_codons[i][ jlex.pos[k] ]
-                        diversity += self.diversities_for_dc[kcodon]
-                        kaas = self.aas_for_dc[ kcodon ]
-                        for l in xrange(21) :
-                            aas_for_combo[l] = aas_for_combo[l] or kaas[l]
-                    log_diversity = math.log( diversity )
-                    error = self.error_given_aas_for_pos( i, aas_for_combo )
-                    if ( error != self.infinity ) :
-                        #print i, j, error, self.max_per_position_error
-                        sys.stdout.flush()
-                        prev_diversity = self.divmin_for_error_for_n_dcs[i][j][error]
-                        if ( prev_diversity == self.infinity ) :
-                            self.errors_for_n_dcs_for_position[i][j].append( error )
-                        if ( prev_diversity == self.infinity or prev_diversity > log_diversity ) :
-                            self.divmin_for_error_for_n_dcs[i][j][error] = log_diversity
-                            self.codons_for_error_for_n_dcs[i][j][error] = self.codon_inds_from_useful_codon_lex( i, jlex )
-                    jlex.upper_diagonal_increment();
-                self.errors_for_n_dcs_for_position[i][j].sort()
+        # identical positions share their representative's tables
+        for i in range( self.n_positions ) :
+            rep = self.representative_for_position( i )
+            self.divmin_for_error_for_n_dcs[i] = self.divmin_for_error_for_n_dcs[ rep ]
+            self.codons_for_error_for_n_dcs[i] = self.codons_for_error_for_n_dcs[ rep ]
+            self.errors_for_n_dcs_for_position[i] = self.errors_for_n_dcs_for_position[ rep ]
+        if len( self.distinct_positions ) < self.n_positions :
+            print( "searching", len( self.distinct_positions ), "distinct positions out of", self.n_positions )
+        for i in sorted( cached_results ) :
+            print( "read smallest diversity codons for errors", i, "from the position cache" )
+            self.record_smallest_diversity_combinations( i, cached_results[i] )
+
+        # the checkpoint holds the results of every completed position, wherever they came from,
+        # so that resuming does not depend on the position cache still holding them
+        in_progress = None
+        if self.checkpoint_file is not None :
+            self.checkpoint_key = self.checkpoint_run_key()
+            self.checkpoint_completed = dict( cached_results )
+            if self.resume :
+                positions, in_progress = self.resume_from_checkpoint( positions )
+            self.write_checkpoint( in_progress )
+
+        # a single position is searched in the pool too if it is split into ranges of combinations
+        if self.n_processes > 1 and sum( [ len( self.pool_tasks_for_position( i ) ) for i in positions ] ) > 1 :
+            results = self.smallest_diversity_combinations_in_pool( positions )
+        else :
+            results = self.smallest_diversity_combinations_in_order( positions, in_progress )
+        for i, position_results in results :
+            print( "found smallest diversity codons for errors", i, "up to", self.max_dcs_for_pos[i], "DCs from", len( self.useful_codons[i] ), "useful codons" )
+            dc_results = self.dc_combinations( i, position_results )
+            if self.use_position_cache and i in cache_keys :
+                position_cache.write_results( cache_keys[i], self.results_for_position_cache( i, dc_results ), cache_dir )
+            self.record_smallest_diversity_combinations( i, dc_results )
+            if self.checkpoint_file is not None :
+                self.checkpoint_completed[i] = dc_results
+                self.write_checkpoint()
+        if self.use_position_cache and positions :
+            position_cache.evict( cache_dir, self.position_cache_max_bytes )
+        self.build_divmin_for_error()
 
         # self.divmin_for_error = [ [] ] * self.n_positions
         # for i in xrange( self.n_positions ) : self.divmin_for_error[i] = [ ( self.infinity, 0 ) ] * self.max_per_position_error
@@ -490,6 +1193,31 @@ class AALibrary :
         #         self.dclex.increment()
 
 
+    def build_divmin_for_error( self ) :
+        """
+        Collapse divmin_for_error_for_n_dcs over the number of DCs: divmin_for_error[i][error] is the
+        ( log diversity, n_dcs ) of the least diverse way to reach error at position i, fewer DCs
+        winning ties, or ( infinity, 0 ) if no combination of DCs reaches it
+        """
+        self.divmin_for_error = [ None ] * self.n_positions
+        for i in range( self.n_positions ) :
+            rep = self.representative_for_position( i )
+            if rep != i :
+                self.divmin_for_error[i] = self.divmin_for_error[ rep ]
+                continue
+            divmin = [ ( self.infinity, 0 ) ] * ( self.max_per_position_error+1 )
+            for j in range( 1, self.max_dcs_for_pos[i]+1 ) :
+                for error in self.errors_for_n_dcs_for_position[i][j] :
+                    log_diversity = self.divmin_for_error_for_n_dcs[i][j][error]
+                    if divmin[ error ][0] == self.infinity or log_diversity < divmin[ error ][0] :
+                        divmin[ error ] = ( log_diversity, j )
+            self.divmin_for_error[i] = divmin
+
+    def position_divmin_array( self, i ) :
+        """The log diversities in divmin_for_error[i] as an array indexed by error, with numpy.inf for unreachable errors"""
+        return numpy.array( [ numpy.inf if log_diversity == self.infinity else log_diversity
+                              for log_diversity, n_dcs in self.divmin_for_error[i] ], dtype=numpy.float64 )
+
     def optimize_library( self, diversity_cap ) :
         '''
         Run a dynamic programming algorithm to determine the minimum diversity for
@@ -500,164 +1228,642 @@ class AALibrary :
         '''
 
         assert( hasattr( self, 'divmin_for_error' ) )
-        self.dp_divmin_for_error = [[]] * self.n_positions
-
-        # dp_traceback is an array of tuples:
-        #  pos0 = which error level ( from self.divmin_for_error ) for this position
-        #  pos1 = which error total ( from self.dp_divmin_for_error ) for the previous position
-        self.dp_traceback = [[]] * self.n_positions
-        self.error_span = self.max_per_position_error * self.n_positions
-        for i in xrange( self.n_positions ) :
-            self.dp_divmin_for_error[i] = [ self.infinity ] * self.error_span
-            self.dp_traceback[i] = [ ( self.infinity, self.infinity ) ] * self.error_span
-
-        # take care of position 0: copy self.divmin_for_error[0] into self.dp_divmin_for_eror
-        for i in xrange( self.max_per_position_error ) :
-            self.dp_divmin_for_error[0][i] = self.divmin_for_error[0][i][0]
-            self.dp_traceback[0][i] = ( i, 0 ) # traceback doesn't proceed beyond position 0
-
-        for i in xrange( 1, self.n_positions )  :
+        if self.approximation_epsilon is not None :
+            return self.optimize_library_approximately( diversity_cap )
+        return self.optimize_library_exactly( diversity_cap )
+
+    def optimize_library_exactly( self, diversity_cap ) :
+        """optimize_library with the mode chosen by parallel_dp and low_memory_dp"""
+        if self.parallel_dp and self.n_processes > 1 and self.n_positions > 1 :
+            return self.optimize_library_in_tree( diversity_cap )
+        if self.low_memory_dp :
+            return self.optimize_library_low_memory( diversity_cap )
+
+        # dp_divmin_for_error[i][j] is the smallest log diversity of positions 0..i with a total error of j
+        # (numpy.inf if no choice of codons gives that error), and dp_traceback[i][j] is the error chosen
+        # at position i to get there, so the total for positions 0..i-1 is j - dp_traceback[i][j]
+        self.error_span = self.max_per_position_error * self.n_positions + 1
+        self.dp_divmin_for_error = numpy.full( ( self.n_positions, self.error_span ), numpy.inf )
+        self.dp_traceback = numpy.full( ( self.n_positions, self.error_span ), -1, dtype=numpy.int32 )
+
+        # take care of position 0: its errors are the totals; traceback doesn't proceed beyond it
+        self.start_dp( self.dp_divmin_for_error[0], self.dp_traceback[0] )
+
+        for i in range( 1, self.n_positions )  :
             # solve the dynamic programming problem for residues 0..i
-            for j in xrange( self.error_span ) :
-                j_divmin = self.infinity
-                j_traceback = None
-                for k in xrange( min( j, self.max_per_position_error ) ) :
-                    if self.dp_divmin_for_error[i-1][j-k] == self.infinity : continue
-                    if self.divmin_for_error[i][k][0] == self.infinity : continue
-                    divsum = self.divmin_for_error[i][k][0] + self.dp_divmin_for_error[i-1][j-k]
-                    if j_divmin == self.infinity or divsum < j_divmin :
-                        j_divmin = divsum
-                        j_traceback = ( k, j-k )
-                if j_divmin != self.infinity :
-                    self.dp_divmin_for_error[i][j] = j_divmin
-                    self.dp_traceback[i][j] = j_traceback
-        return self.traceback()
-
-    def traceback( self ) :
-        # now the traceback
-        optimal_error_traceback = [ 0 ] * self.n_positions
-        log_diversity_cap =  math.log( diversity_cap )
+            self.dp_layer( i, self.dp_divmin_for_error[i-1], self.dp_divmin_for_error[i], self.dp_traceback[i] )
+        return self.traceback( diversity_cap )
+
+    def start_dp( self, row, traceback_row ) :
+        """Fill in the row for position 0 alone: its errors are the totals; traceback doesn't proceed beyond it"""
+        position = self.position_divmin_array( 0 )
+        row[ :len( position ) ] = position
+        traceback_row[ :len( position ) ] = numpy.arange( len( position ) )
 
-        #for i in xrange( self.error_span ) :
-        #    if self.dp_divmin_for_error[-1][i] != self.infinity :
-        #        print "Error of",i,"requires diversity of %5.3f" % self.dp_divmin_for_error[-1][i]
+    def dp_layer( self, i, previous, current, traceback_row ) :
+        """
+        Position i of optimize_library: the min-plus convolution of the previous position's row with
+        the errors reachable at position i, one vectorized pass over the error totals per reachable
+        error, or jit_kernels.dp_layer_kernel if it is enabled.  Smaller errors at position i are visited
+        first and only strictly better sums replace them, so ties go to the smallest error at position i.
+        The sums are computed in the precision of the rows.
+        """
+        position = self.position_divmin_array( i ).astype( current.dtype )
+        if jit_kernels.enabled :
+            jit_kernels.dp_layer_kernel( previous, position, current, traceback_row )
+        else :
+            min_plus_convolve( previous, position, current, traceback_row )
 
-        for i in xrange( self.error_span ) :
-            if self.dp_divmin_for_error[-1][i] != self.infinity and self.dp_divmin_for_error[-1][i] < log_diversity_cap :
-                best = i
-                print "Minimum error of", i, "with log(diversity) of",self.dp_divmin_for_error[-1][i]
+    def optimize_library_low_memory( self, diversity_cap ) :
+        """
+        optimize_library without the n_positions x error_span tables, for libraries whose error span
+        is too large for them.  The forward pass keeps float32 rows and saves only the row ending each
+        segment of about sqrt( n_positions ) positions; the traceback then walks the segments from the
+        last to the first, recomputing each segment's rows and traceback rows from the saved row before
+        it, in the style of Hirschberg.  Peak memory grows as sqrt( n_positions ) x error_span, at the
+        cost of a second forward pass.  The float32 sums may break near-ties differently than
+        optimize_library's float64 ones, and the library chosen is checked against the cap in float64.
+        """
+        self.error_span = self.max_per_position_error * self.n_positions + 1
+        self.dp_segment_length = int( math.ceil( math.sqrt( self.n_positions ) ) )
+        # dp_checkpoint_rows[i] is the row for positions 0..i, for each i that ends a segment
+        self.dp_checkpoint_rows = {}
+        previous = numpy.full( self.error_span, numpy.inf, dtype=numpy.float32 )
+        current = numpy.empty( self.error_span, dtype=numpy.float32 )
+        traceback_row = numpy.full( self.error_span, -1, dtype=numpy.int32 )
+        self.start_dp( previous, traceback_row )
+        for i in range( 1, self.n_positions ) :
+            if i % self.dp_segment_length == 0 :
+                self.dp_checkpoint_rows[ i-1 ] = previous.copy()
+            current.fill( numpy.inf )
+            self.dp_layer( i, previous, current, traceback_row )
+            previous, current = current, previous
+
+        # a float32 sum can round under the cap when the library's float64 log diversity is not, so each
+        # total is only accepted once the library traced back from it is checked in float64
+        log_cap = math.log( diversity_cap )
+        for best in numpy.flatnonzero( previous < log_cap ) :
+            best = int( best )
+            error_traceback = [ 0 ] * self.n_positions
+            self.checkpointed_traceback( best, error_traceback )
+            log_diversity = sum( [ self.divmin_for_error[i][ error_traceback[i] ][0] for i in range( self.n_positions ) ] )
+            if log_diversity >= log_cap :
+                print( "Total error", best, "is under the cap in float32, but its library's log(diversity) of", log_diversity, "is not" )
+                continue
+            print( "Minimum error of", best, "with log(diversity) of", log_diversity )
+            for i in range( self.n_positions ) :
+                print( "Traceback position", i, "minimum error=", error_traceback[i] )
+            return error_traceback
+        print( "No library has a diversity under the cap of", diversity_cap )
+        return None
+
+    def checkpointed_traceback( self, error_level, error_traceback ) :
+        """traceback_from_error_level for optimize_library_low_memory, recomputing one segment at a time"""
+        for begin in range( ( ( self.n_positions - 1 ) // self.dp_segment_length ) * self.dp_segment_length, -1, -1 * self.dp_segment_length ) :
+            end = min( begin + self.dp_segment_length, self.n_positions )
+            traceback_rows = numpy.full( ( end - begin, self.error_span ), -1, dtype=numpy.int32 )
+            if begin == 0 :
+                previous = numpy.full( self.error_span, numpy.inf, dtype=numpy.float32 )
+                self.start_dp( previous, traceback_rows[0] )
+            else :
+                previous = self.dp_checkpoint_rows[ begin-1 ].copy()
+            current = numpy.empty( self.error_span, dtype=numpy.float32 )
+            for i in range( max( begin, 1 ), end ) :
+                current.fill( numpy.inf )
+                self.dp_layer( i, previous, current, traceback_rows[ i - begin ] )
+                previous, current = current, previous
+            for i in range( end - 1, begin - 1, -1 ) :
+                k = int( traceback_rows[ i - begin ][ error_level ] )
+                error_traceback[ i ] = k
+                error_level -= k
+
+    def optimize_library_approximately( self, diversity_cap ) :
+        """
+        optimize_library on a reduced error span, for errors in the tens of thousands.  Each position's
+        errors are rounded up to buckets of bucket_width, keeping the least diverse error per bucket, and
+        the dynamic program runs over the bucket totals, whose span is about error_span / bucket_width.
+        Rounding costs each position less than one bucket, so the library found has an error of at most
+        the smallest error plus n_positions x bucket_width.  With bucket_width = epsilon x L / n_positions
+        for a lower bound L on the smallest error, that is at most ( 1 + epsilon ) times the smallest.
+        L starts as the sum of the positions' smallest errors, and each pass over buckets certifies a
+        better one: the best library's bucket total R is at most the optimal library's, so the optimal
+        error is at least bucket_width x ( R - n_positions ).  The first pass uses a bucket width
+        derived from the least diverse library's error; if its bound is not proven, a second (and last)
+        pass with the improved L is, and buckets narrower than one error fall back to
+        optimize_library_exactly.  The factor proven is left in approximation_bound.
+        """
+        epsilon = self.approximation_epsilon
+        positions = [ self.position_divmin_array( i ) for i in range( self.n_positions ) ]
+
+        # if any library is under the cap, the least diverse one is, and its error bounds the smallest from above
+        least_diverse = [ int( numpy.argmin( position ) ) for position in positions ]
+        if sum( [ positions[i][ least_diverse[i] ] for i in range( self.n_positions ) ] ) >= math.log( diversity_cap ) :
+            print( "No library has a diversity under the cap of", diversity_cap )
+            return None
+        lower_bound = sum( [ int( numpy.flatnonzero( numpy.isfinite( position ) )[0] ) for position in positions ] )
+        bucket_width = epsilon * sum( least_diverse ) / self.n_positions
+        for n_passes in range( 1, 3 ) :
+            if bucket_width <= 1 :
+                print( "Buckets would be narrower than one error; running the exact dynamic program" )
+                self.approximation_bound = 1.0
+                return self.optimize_library_exactly( diversity_cap )
+            error_traceback, bucket_total = self.bucketed_dp( positions, bucket_width, diversity_cap )
+            lower_bound = max( lower_bound, bucket_width * ( bucket_total - self.n_positions ) )
+            # the second pass's width was derived from a lower bound that can only have grown since, so
+            # its bound holds without testing it (the test could fail by a rounding error)
+            if n_passes == 2 or self.n_positions * bucket_width <= epsilon * lower_bound :
                 break
+            bucket_width = epsilon * lower_bound / self.n_positions
+
+        self.approximation_bound = 1 + self.n_positions * bucket_width / lower_bound
+        log_diversity = sum( [ positions[i][ error_traceback[i] ] for i in range( self.n_positions ) ] )
+        print( "Error buckets of width %.4g reduce the error span from %d to %d" % ( bucket_width,
+               self.max_per_position_error * self.n_positions + 1, self.approximate_error_span ) )
+        print( "Approximate minimum error of", sum( error_traceback ), "with log(diversity) of", log_diversity,
+               "within a factor of %.6g of the smallest" % self.approximation_bound )
+        for i in range( self.n_positions ) :
+            print( "Traceback position", i, "minimum error=", error_traceback[i] )
+        return error_traceback
+
+    def bucketed_dp( self, positions, bucket_width, diversity_cap ) :
+        """
+        The dynamic program of optimize_library over the errors of each position in positions (arrays of
+        log diversities from position_divmin_array) rounded up to multiples of bucket_width.  Returns the
+        error at each position of the library with the smallest bucket total under the cap, and that total.
+        """
+        rows = []
+        errors_for_bucket = []
+        for position in positions :
+            errors = numpy.flatnonzero( numpy.isfinite( position ) )
+            buckets = numpy.ceil( errors / bucket_width ).astype( numpy.int64 )
+            # the least diverse error in each bucket, the smaller error winning ties
+            order = numpy.lexsort( ( errors, position[ errors ], buckets ) )
+            first = order[ numpy.concatenate( ( [ True ], buckets[ order ][ 1: ] != buckets[ order ][ :-1 ] ) ) ]
+            row = numpy.full( buckets[-1] + 1, numpy.inf )
+            row[ buckets[ first ] ] = position[ errors[ first ] ]
+            bucket_errors = numpy.full( len( row ), -1, dtype=numpy.int64 )
+            bucket_errors[ buckets[ first ] ] = errors[ first ]
+            rows.append( row )
+            errors_for_bucket.append( bucket_errors )
+
+        self.approximate_error_span = sum( [ len( row ) - 1 for row in rows ] ) + 1
+        dp_rows = numpy.full( ( self.n_positions, self.approximate_error_span ), numpy.inf )
+        traceback_rows = numpy.full( ( self.n_positions, self.approximate_error_span ), -1, dtype=numpy.int32 )
+        dp_rows[0][ :len( rows[0] ) ] = rows[0]
+        traceback_rows[0][ :len( rows[0] ) ] = numpy.arange( len( rows[0] ) )
+        for i in range( 1, self.n_positions ) :
+            min_plus_convolve( dp_rows[i-1], rows[i], dp_rows[i], traceback_rows[i] )
+
+        bucket_total = int( numpy.flatnonzero( dp_rows[-1] < math.log( diversity_cap ) )[0] )
+        error_traceback = [ 0 ] * self.n_positions
+        total = bucket_total
+        for i in range( self.n_positions - 1, -1, -1 ) :
+            k = int( traceback_rows[i][ total ] )
+            error_traceback[i] = int( errors_for_bucket[i][k] )
+            total -= k
+        return error_traceback, bucket_total
+
+    def optimize_library_frontier( self ) :
+        """
+        The dynamic program of optimize_library, keeping for positions 0..i only the totals that are
+        Pareto optimal: those with a smaller log diversity than every smaller total error.  Any library
+        built from a dominated choice at some position can be matched or beaten by swapping in the choice
+        that dominates it, so the frontier of positions 0..i is found from the frontier of 0..i-1 and the
+        frontier of position i alone.  Afterwards frontier_errors and frontier_log_diversities hold the
+        whole error-vs-diversity curve for the library, in order of increasing error, and
+        frontier_traceback gives the error at each position for any point on it; ties are broken as
+        they are in optimize_library, so the points are the libraries it would return.
+        """
+        assert( hasattr( self, 'divmin_for_error' ) )
+
+        # frontier_position_error[i][p] is the error chosen at position i for the p'th point of the frontier
+        # of positions 0..i, and frontier_previous[i][p] the point of the frontier of 0..i-1 it extends
+        self.frontier_position_error = [ None ] * self.n_positions
+        self.frontier_previous = [ None ] * self.n_positions
+        errors, log_diversities = self.position_frontier( 0 )
+        self.frontier_position_error[0] = errors
+        self.frontier_previous[0] = numpy.zeros( len( errors ), dtype=numpy.int64 )
+        for i in range( 1, self.n_positions ) :
+            position_errors, position_log_diversities = self.position_frontier( i )
+            totals = numpy.add.outer( errors, position_errors ).ravel()
+            sums = numpy.add.outer( log_diversities, position_log_diversities ).ravel()
+            chosen = numpy.tile( position_errors, len( errors ) )
+            previous = numpy.repeat( numpy.arange( len( errors ) ), len( position_errors ) )
+            keep = pareto_optimal_points( totals, sums, chosen )
+            errors, log_diversities = totals[ keep ], sums[ keep ]
+            self.frontier_position_error[i] = chosen[ keep ]
+            self.frontier_previous[i] = previous[ keep ]
+        self.frontier_errors = errors
+        self.frontier_log_diversities = log_diversities
+        return errors, log_diversities
+
+    def position_frontier( self, i ) :
+        """The Pareto-optimal ( errors, log diversities ) at position i alone, in order of increasing error"""
+        position = self.position_divmin_array( i )
+        errors = numpy.flatnonzero( numpy.isfinite( position ) )
+        keep = pareto_optimal_points( errors, position[ errors ], errors )
+        return errors[ keep ], position[ errors ][ keep ]
+
+    def frontier_traceback( self, point ) :
+        """The error at each position for the point'th library on the frontier"""
+        error_traceback = [ 0 ] * self.n_positions
+        for i in range( self.n_positions - 1, -1, -1 ) :
+            error_traceback[ i ] = int( self.frontier_position_error[ i ][ point ] )
+            point = self.frontier_previous[ i ][ point ]
+        return error_traceback
+
+    def frontier_traceback_under_cap( self, diversity_cap ) :
+        """frontier_traceback for the library with the smallest error whose diversity is under diversity_cap, or None"""
+        under_cap = numpy.flatnonzero( self.frontier_log_diversities < math.log( diversity_cap ) )
+        if len( under_cap ) == 0 :
+            print( "No library has a diversity under the cap of", diversity_cap )
+            return None
+        point = int( under_cap[0] )
+        print( "Minimum error of", self.frontier_errors[ point ], "with log(diversity) of", self.frontier_log_diversities[ point ] )
+        return self.frontier_traceback( point )
+
+    def dp_block( self, begin, end ) :
+        """
+        The dynamic program of optimize_library over positions begin..end-1 alone: the row for their
+        total errors and their traceback rows (whose first row just repeats each error at begin)
+        """
+        span = self.max_per_position_error * ( end - begin ) + 1
+        rows = numpy.full( ( 2, span ), numpy.inf )
+        traceback_rows = numpy.full( ( end - begin, span ), -1, dtype=numpy.int32 )
+        position = self.position_divmin_array( begin )
+        rows[0][ :len( position ) ] = position
+        traceback_rows[0][ :len( position ) ] = numpy.arange( len( position ) )
+        for i in range( begin + 1, end ) :
+            current = rows[ ( i - begin ) % 2 ]
+            current.fill( numpy.inf )
+            self.dp_layer( i, rows[ ( i - begin - 1 ) % 2 ], current, traceback_rows[ i - begin ] )
+        return rows[ ( end - begin - 1 ) % 2 ].copy(), traceback_rows
+
+    def optimize_library_in_tree( self, diversity_cap ) :
+        """
+        optimize_library as a divide-and-conquer over n_processes worker processes.  Min-plus convolution
+        is associative, so the positions are split into one contiguous block per worker, each worker runs
+        the dynamic program over its block, and the block rows are then convolved pairwise, in parallel,
+        up a reduction tree.  dp_tree[ level ][ node ] holds a node's row and, for each total, the part
+        of it taken from its right child (None for a node with a single child); the traceback descends
+        the tree splitting the total, then follows each block's own traceback rows.  Near the root, where there
+        are fewer pairs than workers, each pair's totals are split into ranges convolved by different workers.  The smallest
+        diversity for every total is the same as optimize_library's up to rounding, but among equally
+        diverse libraries a different one may be chosen.
+        """
+        n_blocks = min( self.n_processes, self.n_positions )
+        bounds = [ ( self.n_positions * b ) // n_blocks for b in range( n_blocks + 1 ) ]
+        self.dp_blocks = [ ( bounds[b], bounds[b+1] ) for b in range( n_blocks ) ]
+        pool = library_pool( self, n_blocks )
+        try :
+            block_results = pool.map( dp_block_in_pool_worker, self.dp_blocks )
+            self.dp_block_tracebacks = [ traceback_rows for row, traceback_rows in block_results ]
+            self.dp_tree = [ [ ( row, None ) for row, traceback_rows in block_results ] ]
+            while len( self.dp_tree[-1] ) > 1 :
+                # near the root there are fewer pairs than workers, so each pair's totals are split into ranges
+                level = self.dp_tree[-1]
+                n_pairs = len( level ) // 2
+                n_ranges = max( 1, n_blocks // n_pairs )
+                tasks = []
+                first_task = []
+                for n in range( 0, 2 * n_pairs, 2 ) :
+                    left, right = level[ n ][0], level[ n+1 ][0]
+                    first_task.append( len( tasks ) )
+                    for begin, end in combination_search.rank_ranges( len( left ) + len( right ) - 1, n_ranges ) :
+                        tasks.append( ( left, right, begin, end ) )
+                first_task.append( len( tasks ) )
+                pieces = pool.map( min_plus_convolve_in_pool_worker, tasks )
+                next_level = []
+                for p in range( n_pairs ) :
+                    pair_pieces = pieces[ first_task[p] : first_task[p+1] ]
+                    next_level.append( ( numpy.concatenate( [ row for row, split in pair_pieces ] ),
+                                         numpy.concatenate( [ split for row, split in pair_pieces ] ) ) )
+                if len( level ) % 2 == 1 :
+                    next_level.append( ( level[-1][0], None ) )
+                self.dp_tree.append( next_level )
+            pool.close()
+        except :
+            pool.terminate()
+            raise
+        finally :
+            pool.join()
+            set_pool_library( None )
+
+        self.error_span = self.max_per_position_error * self.n_positions + 1
+        best = self.best_error_under_cap( self.dp_tree[-1][0][0], diversity_cap )
+        if best is None :
+            return None
+        error_traceback = [ 0 ] * self.n_positions
+        self.tree_traceback( len( self.dp_tree ) - 1, 0, best, error_traceback )
+        for i in range( self.n_positions ) :
+            print( "Traceback position", i, "minimum error=", error_traceback[i] )
+        return error_traceback
+
+    def tree_traceback( self, level, node, total, error_traceback ) :
+        """Fill in error_traceback for the positions under dp_tree[ level ][ node ] given their total error"""
+        if level == 0 :
+            begin, end = self.dp_blocks[ node ]
+            traceback_rows = self.dp_block_tracebacks[ node ]
+            for i in range( end - 1, begin - 1, -1 ) :
+                k = int( traceback_rows[ i - begin ][ total ] )
+                error_traceback[ i ] = k
+                total -= k
+            return
+        split = self.dp_tree[ level ][ node ][1]
+        if split is None :
+            self.tree_traceback( level - 1, 2 * node, total, error_traceback )
+            return
+        right_total = int( split[ total ] )
+        self.tree_traceback( level - 1, 2 * node, total - right_total, error_traceback )
+        self.tree_traceback( level - 1, 2 * node + 1, right_total, error_traceback )
+
+    def best_error_under_cap( self, final_row, diversity_cap ) :
+        """The smallest total error in final_row whose log diversity is under the cap, or None"""
+        under_cap = numpy.flatnonzero( final_row < math.log( diversity_cap ) )
+        if len( under_cap ) == 0 :
+            print( "No library has a diversity under the cap of", diversity_cap )
+            return None
+        best = int( under_cap[0] )
+        print( "Minimum error of", best, "with log(diversity) of", final_row[ best ] )
+        return best
+
+    def traceback( self, diversity_cap ) :
+        """
+        The error at each position of the library with the smallest total error whose diversity is
+        under diversity_cap, or None if no library is
+        """
+        optimal_error_traceback = [ 0 ] * self.n_positions
+        best = self.best_error_under_cap( self.dp_divmin_for_error[-1], diversity_cap )
+        if best is None :
+            return None
         return self.traceback_from_error_level( best, optimal_error_traceback )
 
     def traceback_from_error_level( self, error_level, error_traceback ) :
         position_error = [0] * self.n_positions
-        for i in xrange( self.n_positions - 1, -1, -1 ) :
-            tb = self.dp_traceback[ i ][ error_level ];
-            error_traceback[ i ] = tb[0]
-            error_level = tb[1]
-            position_error[i] = tb[0]
-        for i in xrange( self.n_positions ) :
-            print "Traceback position", i, "minimum error=", position_error[i]
+        for i in range( self.n_positions - 1, -1, -1 ) :
+            k = int( self.dp_traceback[ i ][ error_level ] )
+            error_traceback[ i ] = k
+            error_level -= k
+            position_error[i] = k
+        for i in range( self.n_positions ) :
+            print( "Traceback position", i, "minimum error=", position_error[i] )
 
         return error_traceback
 
-def final_codon_string( position, degenerate_codon, library ) :
+def min_plus_convolve( previous, position, current, traceback_k, begin=0 ) :
+    """
+    current[ j-begin ] = min over k of position[ k ] + previous[ j-k ] for the totals j from begin on,
+    with numpy.inf for unreachable totals, recording the k chosen in traceback_k wherever it improves on
+    what current already holds.  One vectorized pass over the totals per finite entry of position,
+    smallest k first, so ties go to the smallest k.
+    """
+    end = begin + len( current )
+    for k in numpy.flatnonzero( numpy.isfinite( position ) ) :
+        first = max( begin, k )
+        last = min( end, k + len( previous ) )
+        if first >= last : continue
+        divsum = previous[ first-k:last-k ] + position[ k ]
+        better = divsum < current[ first-begin:last-begin ]
+        current[ first-begin:last-begin ][ better ] = divsum[ better ]
+        traceback_k[ first-begin:last-begin ][ better ] = k
+
+def dp_block_in_pool_worker( block ) :
+    begin, end = block
+    return pool_library.dp_block( begin, end )
+
+def min_plus_convolve_in_pool_worker( task ) :
+    """
+    Convolve the rows of two neighbouring nodes of the reduction tree for the totals in [ begin, end );
+    the split is the right node's share of each total
+    """
+    left, right, begin, end = task
+    row = numpy.full( end - begin, numpy.inf )
+    split = numpy.full( end - begin, -1, dtype=numpy.int32 )
+    min_plus_convolve( left, right, row, split, begin )
+    return row, split
+
+def pareto_optimal_points( errors, log_diversities, tiebreak ) :
+    """
+    The indices of the points no other point beats on both error and log diversity, in order of
+    increasing error; of points with the same error and diversity the one with the smallest tiebreak is kept
+    """
+    if len( errors ) == 0 :
+        return numpy.zeros( 0, dtype=numpy.int64 )
+    order = numpy.lexsort( ( tiebreak, log_diversities, errors ) )
+    ordered = log_diversities[ order ]
+    smallest_before = numpy.concatenate( ( [ numpy.inf ], numpy.minimum.accumulate( ordered )[ :-1 ] ) )
+    return order[ ordered < smallest_before ]
+
+# the library whose positions are being searched by a process pool, in the workers (and, where
+# they are forked, in the parent while the pool is open)
+pool_library = None
+
+def set_pool_library( library ) :
+    global pool_library
+    pool_library = library
+
+def library_pool( library, n_processes ) :
+    """
+    A process pool whose workers see library as pool_library.  Where the default start method is
+    fork, the workers are forked after pool_library is set, so they read the library's tables
+    copy-on-write; under any other start method (fork is not safe on macOS, for one) the library
+    is pickled to each worker by the pool's initializer.  Call set_pool_library( None ) once the
+    pool is joined.
+    """
+    if multiprocessing.get_start_method() == "fork" :
+        set_pool_library( library )
+        return multiprocessing.Pool( n_processes )
+    return multiprocessing.Pool( n_processes, set_pool_library, ( library, ) )
+
+# a single number of DCs at a position is split across the pool once it has more combinations than this
+combinations_per_shard = 1 << 20
+
+def smallest_diversity_combinations_in_pool_worker( task ) :
+    pos, n_dcs, begin, end = task
+    if n_dcs is None :
+        return task, pool_library.smallest_diversity_combinations_for_position( pos )
+    return task, pool_library.smallest_diversity_combinations_for_ranks( pos, n_dcs, begin, end )
+
+def final_codon_string( position, degenerate_codons, library, log_diversity ) :
     # three things we need:
-    # 1: the codon
+    # 1: the codons
     # 2: the amino acids that are represented
     # 2b: the counts from the original set of observations for each of the represented aas
     # 3: the amino acids and their counts in the original set of observations that are not represented
-    aas_present  = library.aas_for_degenerate_codon( degenerate_codon )
+    aas_present = [ False ] * 21
+    for degenerate_codon in degenerate_codons :
+        aas_present = [ x or y for x, y in zip( aas_present, library.aas_for_degenerate_codon( degenerate_codon ) ) ]
     orig_obs = library.aa_counts[ position ]
 
     orig_pos_string = "Position %4s" % library.orig_pos[ position ]
 
-    codon_string = ""
-    for i in xrange(3) :
-        idcpos = degenerate_codon.pos[i]
-        base_tuple = ( idcpos[0], idcpos[1], idcpos[2], idcpos[3] )
-        codon_string += degenerate_codon.degenerate_base_names[ base_tuple ]
+    codon_string = "+".join( [ degenerate_codon.codon_string() for degenerate_codon in degenerate_codons ] )
 
     present_string = ""
-    for i in xrange(len(aas_present)) :
+    for i in range(len(aas_present)) :
         if aas_present[i] :
             present_string += " " + aastr_for_integer( i )
             if i != 20 : present_string += "(" + str(orig_obs[i]) + ")"
     absent_string = "Absent"
-    for i in xrange(len(orig_obs)) :
+    for i in range(len(orig_obs)) :
         if orig_obs[i] != 0 and not aas_present[i]:
             absent_string += " " + aastr_for_integer( i ) + "(" + str(orig_obs[i]) + ")"
-    log_diversity_string = "log(diversity)= %5.3f" % ( degenerate_codon.log_diversity() )
+    log_diversity_string = "log(diversity)= %5.3f" % ( log_diversity )
 
     return orig_pos_string + " : " + codon_string + " : " + log_diversity_string + " : " + present_string + " : " + absent_string
 
-def print_output_codons( library, error_sequence ) :
+def codon_strings_for_position( library, position, error ) :
+    """The DCs chosen for error at position, joined by plus signs"""
+    n_dcs = library.divmin_for_error[ position ][ error ][ 1 ]
     dc = DegenerateCodon()
+    codon_strings = []
+    for dc_index in library.codons_for_error_for_n_dcs[ position ][ n_dcs ][ error ] :
+        dc.set_from_index( dc_index )
+        codon_strings.append( dc.codon_string() )
+    return "+".join( codon_strings )
+
+def ranges_string( values ) :
+    """The sorted integers in values as comma-separated runs, e.g. 0-3,7,9-12"""
+    runs = []
+    for value in values :
+        if runs and runs[-1][1] == value - 1 :
+            runs[-1][1] = value
+        else :
+            runs.append( [ value, value ] )
+    return ",".join( [ str( first ) if first == last else "%d-%d" % ( first, last ) for first, last in runs ] )
+
+def print_library_frontier( library ) :
+    for point in range( len( library.frontier_errors ) ) :
+        print( "Error %6d log(diversity)= %7.3f diversity= %10.4g" % ( library.frontier_errors[ point ],
+            library.frontier_log_diversities[ point ], math.exp( library.frontier_log_diversities[ point ] ) ) )
+
+def write_frontier( library, fname ) :
+    """
+    Write the error-vs-diversity curve as tab-separated columns: the total error, the log diversity,
+    the diversity and then the DCs at each position of the library at that point
+    """
+    lines = [ "\t".join( [ "error", "log_diversity", "diversity" ] + [ "position_%s" % pos for pos in library.orig_pos ] ) + "\n" ]
+    for point in range( len( library.frontier_errors ) ) :
+        error_sequence = library.frontier_traceback( point )
+        columns = [ str( library.frontier_errors[ point ] ), "%.6f" % library.frontier_log_diversities[ point ],
+                    "%.6g" % math.exp( library.frontier_log_diversities[ point ] ) ]
+        columns.extend( [ codon_strings_for_position( library, i, error_sequence[ i ] ) for i in range( library.n_positions ) ] )
+        lines.append( "\t".join( columns ) + "\n" )
+    with open( fname, "w" ) as f :
+        f.writelines( lines )
+
+def print_output_codons( library, error_sequence, diversity_cap ) :
     diversity_sum = 0
-    for i in xrange(library.n_positions) :
-        lexind = library.divmin_for_error[ i ][ error_sequence[ i ] ][ 1 ]
-        library.dclex.set_from_index(lexind)
-        dc.set_from_lex( library.dclex )
-        diversity_sum += dc.log_diversity()
-        print final_codon_string( i, dc, library )
-    print "Max log diversity: ", math.log( diversity_cap ), "Theorical diversity", diversity_sum
+    for i in range(library.n_positions) :
+        log_diversity, n_dcs = library.divmin_for_error[ i ][ error_sequence[ i ] ]
+        dcs = []
+        for dc_index in library.codons_for_error_for_n_dcs[ i ][ n_dcs ][ error_sequence[ i ] ] :
+            dc = DegenerateCodon()
+            dc.set_from_index( dc_index )
+            dcs.append( dc )
+        diversity_sum += log_diversity
+        print( final_codon_string( i, dcs, library, log_diversity ) )
+    print( "Max log diversity: ", math.log( diversity_cap ), "Theorical diversity", diversity_sum )
 
 def practice_code( library ) :
-    print library.max_per_position_error
-    print library.aa_counts
+    print( library.max_per_position_error )
+    print( library.aa_counts )
 
     dims = [ 2, 1, 1 ]
     lex = LexicographicalIterator( dims )
-    print lex.pos
+    print( lex.pos )
     lex.increment()
-    print lex.pos
+    print( lex.pos )
 
-    print "bigger lex"
+    print( "bigger lex" )
     dims = [ 4, 3, 5 ]
     lex = LexicographicalIterator( dims )
-    print lex.pos, lex.dimprods, lex.search_space_size
-    for i in xrange(50) : lex.increment()
-    print lex.pos
+    print( lex.pos, lex.dimprods, lex.search_space_size )
+    for i in range(50) : lex.increment()
+    print( lex.pos )
     index = lex.index()
     lex.reset()
-    print index, lex.pos
+    print( index, lex.pos )
     lex.set_from_index( index )
-    print lex.pos
+    print( lex.pos )
 
     ttg_degenerate = DegenerateCodon()
     ttg_degenerate.set_pos(0,3); ttg_degenerate.set_pos(1,3); ttg_degenerate.set_pos(2,2);
     aas_ttg = library.aas_for_degenerate_codon( ttg_degenerate )
-    for i in xrange( 21 ) :
+    for i in range( 21 ) :
         if aas_ttg[i] :
-            print aastr_for_integer( i )
+            print( aastr_for_integer( i ) )
 
     ttg_degenerate.set_pos(0,1)
     aas_ttg = library.aas_for_degenerate_codon( ttg_degenerate )
-    for i in xrange( 21 ) :
+    for i in range( 21 ) :
         if aas_ttg[i] :
-            print aastr_for_integer( i )
+            print( aastr_for_integer( i ) )
 
     #ttg_degenerate[1][0] = True; # now try C/T A/T G
     ttg_degenerate.set_pos(1,0)
     aas_ttg = library.aas_for_degenerate_codon( ttg_degenerate )
-    for i in xrange( 21 ) :
+    for i in range( 21 ) :
         if aas_ttg[i] :
-            print aastr_for_integer( i )
+            print( aastr_for_integer( i ) )
 
 
 if __name__ == "__main__" :
     with blargs.Parser( locals() ) as p :
         p.str( "input_csv" ).required()
-        p.float( "diversity_cap" ).required()
-
-    print "Loading library"
+        p.float( "diversity_cap" ).unless( p.flag( "print_frontier" ).or_( p.str( "frontier_file" ) ) )
+        p.flag( "keep_dominated_codons" )
+        p.flag( "exact_union_diversity" )
+        p.enum( "combination_engine", [ "auto" ] + sorted( combination_search.engines ) + [ "beam" ] ).default( "auto" )
+        p.float( "search_budget" )
+        p.enum( "over_budget", [ "refuse", "reduce_dcs", "heuristic" ] ).default( "refuse" )
+        p.int( "beam_width" ).default( combination_search.default_beam_width )
+        p.int( "heuristic_max_evaluations" )
+        p.float( "heuristic_time_limit" )
+        p.int( "n_processes" ).default( 1 )
+        p.flag( "parallel_dp" )
+        p.flag( "low_memory_dp" )
+        p.float( "approximation_epsilon" )
+        p.flag( "no_position_cache" )
+        p.float( "checkpoint_interval" ).default( 60 )
+        p.flag( "resume" ).requires( p.str( "checkpoint_file" ) )
+
+    print( "Loading library" )
     library = AALibrary()
+    library.prune_dominated = not keep_dominated_codons
+    library.combination_engine = combination_engine
+    library.search_budget = search_budget
+    library.over_budget = over_budget
+    library.beam_width = beam_width
+    library.heuristic_max_evaluations = heuristic_max_evaluations
+    library.heuristic_time_limit = heuristic_time_limit
+    library.exact_union_diversity = exact_union_diversity
+    library.n_processes = n_processes
+    library.parallel_dp = parallel_dp
+    library.low_memory_dp = low_memory_dp
+    library.approximation_epsilon = approximation_epsilon
+    library.use_position_cache = not no_position_cache
+    library.checkpoint_file = checkpoint_file
+    library.checkpoint_interval = checkpoint_interval
+    library.resume = resume
     library.load_library( input_csv )
 
-    print "Computing minimum diversity for each error level for each position"
+    print( "Computing minimum diversity for each error level for each position" )
     library.compute_smallest_diversity_for_all_errors()
 
-    print "Running dynamic programming to minimize error while coming under the diversity cap"
-    optimal = library.optimize_library( diversity_cap )
-
-    print_output_codons( library, optimal )
+    if print_frontier or frontier_file :
+        print( "Running dynamic programming to find the error-vs-diversity curve" )
+        library.optimize_library_frontier()
+        if print_frontier :
+            print_library_frontier( library )
+        if frontier_file :
+            write_frontier( library, frontier_file )
+        optimal = None
+        if diversity_cap is not None :
+            optimal = library.frontier_traceback_under_cap( diversity_cap )
+    else :
+        print( "Running dynamic programming to minimize error while coming under the diversity cap" )
+        optimal = library.optimize_library( diversity_cap )
+
+    if optimal is not None :
+        print_output_codons( library, optimal, diversity_cap )
@@ -14,7 +14,7 @@ class GeneticCodeMapper :
     def __init__( self ) :
         self.base_to_index = { "A" : 0, "C" : 1, "G" : 2, "T" : 3 }
         self.mapper = [0]*64
-        for codon, aastr in genetic_code.genetic_code_codons.iteritems() :
+        for codon, aastr in genetic_code.genetic_code_codons.items() :
             ci = self.codon_index( codon )
             aaind = 20
             if aastr != "STOP" :
@@ -25,7 +25,7 @@ class GeneticCodeMapper :
 
     def codon_index( self, codon ) :
         index = 0
-        for i in xrange( 3 ) :
+        for i in range( 3 ) :
             index = index*4 + self.base_to_index[ codon[i] ]
         return index
 
@@ -34,7 +34,7 @@ class LexicographicalIterator :
         self.size = len(dimsizes)
         self.dimsizes = list( dimsizes )
         self.dimprods = [1] * self.size
-        for i in xrange( self.size - 1, 0, -1 ) :
+        for i in range( self.size - 1, 0, -1 ) :
             self.dimprods[ i-1 ] = self.dimprods[ i ] * self.dimsizes[ i ]
         self.search_space_size = self.dimprods[ 0 ] * self.dimsizes[ 0 ]
         self.pos = [0] * self.size
@@ -53,19 +53,19 @@ class LexicographicalIterator :
         return False
 
     def upper_diagonal_increment( self ) :
-        for i in xrange( self.size - 1, -1, -1 ) :
+        for i in range( self.size - 1, -1, -1 ) :
             self.pos[ i ] += 1
             if ( self.pos[ i ] == self.dimsizes[ i ]  ) :
                 self.pos[ i ] = 0
             else :
                 beyond_end = False
-                for k in xrange(i+1,self.size) :
+                for k in range(i+1,self.size) :
                     self.pos[ k ] = self.pos[ i ] + k - i
                     if self.pos[k] >= self.dimsizes[k] :
                         beyond_end = True
                         break
                 if beyond_end and i == 0 :
-                    for k in xrange( self.size ) :
+                    for k in range( self.size ) :
                         self.pos[ k ] = 0
                     self.at_end = True
                     return False
@@ -76,17 +76,17 @@ class LexicographicalIterator :
 
 
     def reset( self ) :
-        for i in xrange( self.size ) : self.pos[ i ] = 0
+        for i in range( self.size ) : self.pos[ i ] = 0
         self.at_end = False
 
     def upper_diagonal_reset( self ) :
         beyond_end = False
-        for i in xrange( self.size ) :
+        for i in range( self.size ) :
             self.pos[ i ] = i
             if i >= self.dimsizes[i] :
                 beyond_end = True
         if beyond_end :
-            for i in xrange( self.size ) :
+            for i in range( self.size ) :
                 self.pos[ i ] = 0
             self.at_end = True
         else :
@@ -95,21 +95,21 @@ class LexicographicalIterator :
     def index( self ) :
         ''' return the integer index representing the state of the lex'''
         ind = 0
-        for i in xrange( self.size ) :
+        for i in range( self.size ) :
             ind += self.pos[ i ] * self.dimprods[ i ]
         return ind
     def set_from_index( self, ind ) :
         ''' set the state of the lex given a previously computed index'''
-        for i in xrange( self.size ):
-            self.pos[ i ] = ind / self.dimprods[i]
+        for i in range( self.size ):
+            self.pos[ i ] = ind // self.dimprods[i]
             ind = ind % self.dimprods[ i ]
 
 class DegenerateCodon :
     def __init__( self ) :
         self.pos = [ [] ] * 3
-        for i in xrange(3) : self.pos[i] = [ False ] * 4
+        for i in range(3) : self.pos[i] = [ False ] * 4
         self.which = [ [] ] * 3
-        for i in xrange(3) : self.which[i] = []
+        for i in range(3) : self.which[i] = []
         self.count_pos = [ 0 ] * 3
         self.degenerate_base_names = {
             (True, False,False,False) : "A",
@@ -133,7 +133,7 @@ class DegenerateCodon :
 
     def codon_string( self ) :
         output_codon_string = ""
-        for i in xrange(3) :
+        for i in range(3) :
             output_codon_string += self.degenerate_base_names[ ( self.pos[i][0], self.pos[i][1], self.pos[i][2], self.pos[i][3] ) ]
         return output_codon_string
 
@@ -145,27 +145,27 @@ class DegenerateCodon :
             self.pos[ codon_pos ][ base ] = True
             self.count_pos[ codon_pos ] += 1
     def reset( self ) :
-        for i in xrange(3) :
+        for i in range(3) :
             self.which[i][:] = []
             self.count_pos[i] = 0
-            for j in xrange(4) : self.pos[i][j] = False
+            for j in range(4) : self.pos[i][j] = False
     def diversity( self ) :
-        for i in xrange(3) :
+        for i in range(3) :
             if self.count_pos[i] == 0 :
                 return this.infinity
         div =  1
-        for i in xrange(3) :
+        for i in range(3) :
             div *= self.count_pos[i]
         return div
     def log_diversity( self ) :
-        for i in xrange(3) : assert( self.count_pos[i] != 0 )
+        for i in range(3) : assert( self.count_pos[i] != 0 )
         ld = 0.0
-        for i in xrange(3) : ld += math.log( self.count_pos[i] )
+        for i in range(3) : ld += math.log( self.count_pos[i] )
         return ld
     def index_from_lex( self, lex ) :
         """Get the index for a particular codon using a lex that's dimensioned from self.count_pos"""
         codon_index = 0
-        for i in xrange(3) :
+        for i in range(3) :
             codon_index = codon_index * 4 + self.which[i][lex.pos[i]]
         return codon_index
     def set_from_lex( self, lex ) :
@@ -174,14 +174,14 @@ class DegenerateCodon :
         Returns False if this is not a reasonable assignment; i.e. not all codon positions contain at least one base.
         """
         self.reset()
-        for i in xrange(3) :
+        for i in range(3) :
             posi = lex.pos[i]+1 # take "14" to mean "all degererate nucleotides" and "0" to mean "only A"
             sigdig = 8
-            for j in xrange(4) :
-                if posi / sigdig != 0 :
+            for j in range(4) :
+                if posi // sigdig != 0 :
                     self.set_pos( i, 3-j ) # so A = 0 and T = 3
                 posi = posi % sigdig
-                sigdig /= 2
+                sigdig //= 2
         return True
 
 
@@ -236,7 +236,7 @@ class AALibrary :
         self.forbidden = [ [] ] * self.n_positions
         self.stretch_reps = self.n_positions * [ 0 ]
         self.max_dcs_for_pos = self.n_positions * [ 1 ]
-        for i in xrange(self.n_positions) :
+        for i in range(self.n_positions) :
             self.aa_counts[ i ] = [ 0     ] * 21
             self.required[ i ]  = [ False ] * 21
             self.forbidden[ i ] = [ False ] * 21
@@ -252,7 +252,7 @@ class AALibrary :
         # the first position is always considered to be the start of a stretch
         self.n_stretches = 1
         self.stretch_reps[0] = 0
-        for i in xrange(1,self.n_positions) :
+        for i in range(1,self.n_positions) :
             if row2cols[i] == "|" :
                 last_rep = i
                 self.n_stretches += 1
@@ -269,7 +269,7 @@ class AALibrary :
         row3 = lines[2]
         row3cols = row3.split(",")[1:]
         self.max_dcs_per_pos = 1
-        for i in xrange( self.n_positions ) :
+        for i in range( self.n_positions ) :
             self.max_dcs_for_pos[ i ] = int( row3cols[i] )
             if self.max_dcs_for_pos[i] > self.max_dcs_per_pos :
                 self.max_dcs_per_pos = self.max_dcs_for_pos[i]
@@ -292,10 +292,10 @@ class AALibrary :
 
         self.max_per_position_error = 0
         obs = [ 0 ] * self.n_positions
-        for i in xrange(20) :
+        for i in range(20) :
             line = lines[ i + 3 ]
             vals = line.split(",")[1:]
-            for j in xrange(len(vals)):
+            for j in range(len(vals)):
                 if vals[j] == "!" :
                     self.forbidden[j][i] = True
                 elif vals[j] == "*" :
@@ -303,12 +303,12 @@ class AALibrary :
                 else :
                     self.aa_counts[j][i] = int(vals[j])
                 obs[ j ] += self.aa_counts[j][i]
-        for i in xrange( self.n_positions ) :
+        for i in range( self.n_positions ) :
             if obs[i] > self.max_per_position_error :
                 self.max_per_position_error = obs[i]
     def error_given_aas_for_pos( self, pos, aas ) :
         error = 0
-        for i in xrange(20) :
+        for i in range(20) :
             icount = self.aa_counts[ pos ][ i ]
             if not aas[ i ] :
                 if self.required[ pos ][ i ] :
@@ -324,7 +324,7 @@ class AALibrary :
 
     def error_given_aas_for_pos_ignore_req( self, pos, aas ) :
         error = 0
-        for i in xrange(20) :
+        for i in range(20) :
             icount = self.aa_counts[ pos ][ i ]
             if not aas[ i ] :
                 if icount > 0 :
@@ -338,7 +338,7 @@ class AALibrary :
 
     def useful_aaind_for_pos( self, aas, pos ) :
         aaind = 0
-        for i in xrange(21) :
+        for i in range(21) :
             iuseful = self.aa_counts[pos][i] != 0 or self.required[pos][i];
             aaind = 2*aaind + ( 1 if aas[i] and iuseful else 0 )
         return aaind
@@ -352,13 +352,13 @@ class AALibrary :
         # index 2: either 0 (for the codon's diveristy) or 1 (for the codon's index)
 
         div_for_codons = []
-        for i in xrange( self.n_positions ) :
+        for i in range( self.n_positions ) :
             self.useful_codons.append( [] )
             div_for_codons.append( {} )
-        for i in xrange( 3375 ) :
+        for i in range( 3375 ) :
             iaas = self.aas_for_dc[ i ]
             idiv = self.diversities_for_dc[ i ]
-            for j in xrange( self.n_positions ) :
+            for j in range( self.n_positions ) :
                 ijerror = self.error_given_aas_for_pos_ignore_req( j, iaas )
                 if ( ijerror == self.infinity ) : continue;
                 ij_aaind = self.useful_aaind_for_pos( iaas, j )
@@ -373,7 +373,7 @@ class AALibrary :
                     if ( ijerror not in div_for_codons[j] )  :
                         div_for_codons[j][ ijerror ] = {}
                     div_for_codons[j][ ijerror ][ ij_aaind ] = [ idiv, i ]; # JS->Py note: could be a tuple?
-        for i in xrange( self.n_positions ) :
+        for i in range( self.n_positions ) :
             for j in div_for_codons[ i ] :
                 if ( j not in div_for_codons[i] ) : continue # JS->PY note: maybe unnecessary?
                 jaainds = div_for_codons[i][j]
@@ -383,7 +383,7 @@ class AALibrary :
 
     def codon_inds_from_useful_codon_lex( self, position, useful_codon_lex ) :
         inds = []
-        for i in xrange( len( useful_codon_lex.pos ) ) :
+        for i in range( len( useful_codon_lex.pos ) ) :
             inds.append( self.useful_codons[ position ][ useful_codon_lex.pos[i] ] )
         return inds
 
@@ -395,35 +395,35 @@ class AALibrary :
         self.divmin_for_error_for_n_dcs = [ [] ] * self.n_positions
         self.codons_for_error_for_n_dcs = [ [] ] * self.n_positions
         self.errors_for_n_dcs_for_position = [ [] ] * self.n_positions
-        for i in xrange(self.n_positions) :
+        for i in range(self.n_positions) :
             #print "compute_smallest_diversity_for_all_errors", i, len( self.divmin_for_error_for_n_dcs ), len( self.max_dcs_for_pos )
             self.divmin_for_error_for_n_dcs[i] =    ( self.max_dcs_for_pos[i]+1 ) * [ [] ]
             self.codons_for_error_for_n_dcs[i] =    ( self.max_dcs_for_pos[i]+1 ) * [ [] ]
             self.errors_for_n_dcs_for_position[i] = ( self.max_dcs_for_pos[i]+1 ) * [ [] ]
-            for j in xrange(1, self.max_dcs_for_pos[i]+1) :
+            for j in range(1, self.max_dcs_for_pos[i]+1) :
                 self.divmin_for_error_for_n_dcs[i][j] = ( self.max_per_position_error+1 ) * [ self.infinity ]
                 self.codons_for_error_for_n_dcs[i][j] = ( self.max_per_position_error+1 ) * [ self.infinity ]
                 self.errors_for_n_dcs_for_position[i][j] = []
         aas_for_combo = 21 * [ False ]
-        for i in xrange( self.n_positions ) :
-            for j in xrange(1,self.max_dcs_for_pos[i]+1) :
+        for i in range( self.n_positions ) :
+            for j in range(1,self.max_dcs_for_pos[i]+1) :
                 dims = j*[ 0 ]
-                print "finding smallest diversity codons for errors", i, j, ":"
-                for k in xrange(j) :
+                print( "finding smallest diversity codons for errors", i, j, ":" )
+                for k in range(j) :
                     dims[k] = len( self.useful_codons[i] )
-                    print dims[k],
-                print
+                    print( dims[k], end=' ' )
+                print()
                 jlex = LexicographicalIterator( dims )
                 jlex.upper_diagonal_reset()
 
                 while not jlex.at_end :
-                    for k in xrange(21) : aas_for_combo[k] = False
+                    for k in range(21) : aas_for_combo[k] = False
                     diversity = 0
-                    for k in xrange(j) :
+                    for k in range(j) :
                         kcodon = self.useful_codons[i][ jlex.pos[k] ]
                         diversity += self.diversities_for_dc[kcodon]
                         kaas = self.aas_for_dc[ kcodon ]
-                        for l in xrange(21) :
+                        for l in range(21) :
                             aas_for_combo[l] = aas_for_combo[l] or kaas[l]
                     log_diversity = math.log( diversity )
                     error = self.error_given_aas_for_pos( i, aas_for_combo )
@@ -476,21 +476,21 @@ class AALibrary :
         #  pos1 = which error total ( from self.dp_divmin_for_error ) for the previous position
         self.dp_traceback = [[]] * self.n_positions
         self.error_span = self.max_per_position_error * self.n_positions
-        for i in xrange( self.n_positions ) :
+        for i in range( self.n_positions ) :
             self.dp_divmin_for_error[i] = [ self.infinity ] * self.error_span
             self.dp_traceback[i] = [ ( self.infinity, self.infinity ) ] * self.error_span
 
         # take care of position 0: copy self.divmin_for_error[0] into self.dp_divmin_for_eror
-        for i in xrange( self.max_per_position_error ) :
+        for i in range( self.max_per_position_error ) :
             self.dp_divmin_for_error[0][i] = self.divmin_for_error[0][i][0]
             self.dp_traceback[0][i] = ( i, 0 ) # traceback doesn't proceed beyond position 0
 
-        for i in xrange( 1, self.n_positions )  :
+        for i in range( 1, self.n_positions )  :
             # solve the dynamic programming problem for residues 0..i
-            for j in xrange( self.error_span ) :
+            for j in range( self.error_span ) :
                 j_divmin = self.infinity
                 j_traceback = None
-                for k in xrange( min( j, self.max_per_position_error ) ) :
+                for k in range( min( j, self.max_per_position_error ) ) :
                     if self.dp_divmin_for_error[i-1][j-k] == self.infinity : continue
                     if self.divmin_for_error[i][k][0] == self.infinity : continue
                     divsum = self.divmin_for_error[i][k][0] + self.dp_divmin_for_error[i-1][j-k]
@@ -511,22 +511,22 @@ class AALibrary :
         #    if self.dp_divmin_for_error[-1][i] != self.infinity :
         #        print "Error of",i,"requires diversity of %5.3f" % self.dp_divmin_for_error[-1][i]
 
-        for i in xrange( self.error_span ) :
+        for i in range( self.error_span ) :
             if self.dp_divmin_for_error[-1][i] != self.infinity and self.dp_divmin_for_error[-1][i] < log_diversity_cap :
                 best = i
-                print "Minimum error of", i, "with log(diversity) of",self.dp_divmin_for_error[-1][i]
+                print( "Minimum error of", i, "with log(diversity) of",self.dp_divmin_for_error[-1][i] )
                 break
         return self.traceback_from_error_level( best, optimal_error_traceback )
 
     def traceback_from_error_level( self, error_level, error_traceback ) :
         position_error = [0] * self.n_positions
-        for i in xrange( self.n_positions - 1, -1, -1 ) :
+        for i in range( self.n_positions - 1, -1, -1 ) :
             tb = self.dp_traceback[ i ][ error_level ];
             error_traceback[ i ] = tb[0]
             error_level = tb[1]
             position_error[i] = tb[0]
-        for i in xrange( self.n_positions ) :
-            print "Traceback position", i, "minimum error=", position_error[i]
+        for i in range( self.n_positions ) :
+            print( "Traceback position", i, "minimum error=", position_error[i] )
 
         return error_traceback
 
@@ -542,18 +542,18 @@ def final_codon_string( position, degenerate_codon, library ) :
     orig_pos_string = "Position %4s" % library.orig_pos[ position ]
 
     codon_string = ""
-    for i in xrange(3) :
+    for i in range(3) :
         idcpos = degenerate_codon.pos[i]
         base_tuple = ( idcpos[0], idcpos[1], idcpos[2], idcpos[3] )
         codon_string += degenerate_codon.degenerate_base_names[ base_tuple ]
 
     present_string = ""
-    for i in xrange(len(aas_present)) :
+    for i in range(len(aas_present)) :
         if aas_present[i] :
             present_string += " " + aastr_for_integer( i )
             if i != 20 : present_string += "(" + str(orig_obs[i]) + ")"
     absent_string = "Absent"
-    for i in xrange(len(orig_obs)) :
+    for i in range(len(orig_obs)) :
         if orig_obs[i] != 0 and not aas_present[i]:
             absent_string += " " + aastr_for_integer( i ) + "(" + str(orig_obs[i]) + ")"
     log_diversity_string = "log(diversity)= %5.3f" % ( degenerate_codon.log_diversity() )
@@ -563,55 +563,55 @@ def final_codon_string( position, degenerate_codon, library ) :
 def print_output_codons( library, error_sequence ) :
     dc = DegenerateCodon()
     diversity_sum = 0
-    for i in xrange(library.n_positions) :
+    for i in range(library.n_positions) :
         lexind = library.divmin_for_error[ i ][ error_sequence[ i ] ][ 1 ]
         library.dclex.set_from_index(lexind)
         dc.set_from_lex( library.dclex )
         diversity_sum += dc.log_diversity()
-        print final_codon_string( i, dc, library )
-    print "Max log diversity: ", math.log( diversity_cap ), "Theorical diversity", diversity_sum
+        print( final_codon_string( i, dc, library ) )
+    print( "Max log diversity: ", math.log( diversity_cap ), "Theorical diversity", diversity_sum )
 
 def practice_code( library ) :
-    print library.max_per_position_error
-    print library.aa_counts
+    print( library.max_per_position_error )
+    print( library.aa_counts )
 
     dims = [ 2, 1, 1 ]
     lex = LexicographicalIterator( dims )
-    print lex.pos
+    print( lex.pos )
     lex.increment()
-    print lex.pos
+    print( lex.pos )
 
-    print "bigger lex"
+    print( "bigger lex" )
     dims = [ 4, 3, 5 ]
     lex = LexicographicalIterator( dims )
-    print lex.pos, lex.dimprods, lex.search_space_size
-    for i in xrange(50) : lex.increment()
-    print lex.pos
+    print( lex.pos, lex.dimprods, lex.search_space_size )
+    for i in range(50) : lex.increment()
+    print( lex.pos )
     index = lex.index()
     lex.reset()
-    print index, lex.pos
+    print( index, lex.pos )
     lex.set_from_index( index )
-    print lex.pos
+    print( lex.pos )
 
     ttg_degenerate = DegenerateCodon()
     ttg_degenerate.set_pos(0,3); ttg_degenerate.set_pos(1,3); ttg_degenerate.set_pos(2,2);
     aas_ttg = library.aas_for_degenerate_codon( ttg_degenerate )
-    for i in xrange( 21 ) :
+    for i in range( 21 ) :
         if aas_ttg[i] :
-            print aastr_for_integer( i )
+            print( aastr_for_integer( i ) )
 
     ttg_degenerate.set_pos(0,1)
     aas_ttg = library.aas_for_degenerate_codon( ttg_degenerate )
-    for i in xrange( 21 ) :
+    for i in range( 21 ) :
         if aas_ttg[i] :
-            print aastr_for_integer( i )
+            print( aastr_for_integer( i ) )
 
     #ttg_degenerate[1][0] = True; # now try C/T A/T G
     ttg_degenerate.set_pos(1,0)
     aas_ttg = library.aas_for_degenerate_codon( ttg_degenerate )
-    for i in xrange( 21 ) :
+    for i in range( 21 ) :
         if aas_ttg[i] :
-            print aastr_for_integer( i )
+            print( aastr_for_integer( i ) )
 
 
 if __name__ == "__main__" :
@@ -619,14 +619,14 @@ if __name__ == "__main__" :
         p.str( "input_csv" ).required()
         p.float( "diversity_cap" ).required()
 
-    print "Loading library"
+    print( "Loading library" )
     library = AALibrary()
     library.load_library( input_csv )
 
-    print "Computing minimum diversity for each error level for each position"
+    print( "Computing minimum diversity for each error level for each position" )
     library.compute_smallest_diversity_for_all_errors()
 
-    print "Running dynamic programming to minimize error while coming under the diversity cap"
+    print( "Running dynamic programming to minimize error while coming under the diversity cap" )
     optimal = library.optimize_library( diversity_cap )
 
     print_output_codons( library, optimal )
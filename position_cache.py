@@ -0,0 +1,105 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2014 Andrew Leaver-Fay, Tim Jacobs, Hayretin Yumerefendi, Brian Kuhlman.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+#     in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+# Content-addressed on-disk cache of the per-position results of
+# AALibrary.compute_smallest_diversity_for_all_errors.  Each entry is a small JSON
+# file named by the SHA1 of everything the results depend on (the position's
+# column, its limits, the options that change the search, the genetic code, the
+# combination engine and its version, and result_format_version), so a re-run
+# only recomputes the positions that changed.
+# An entry holds a list indexed by n_dcs of [ best_diversity, best_dcs ] pairs,
+# where best_dcs[ error ] is the list of degenerate-codon indices chosen for that
+# error level (or null); entry 0 is null.  The lists stop at the position's own
+# error ceiling, and are padded out to the library's on reading.
+#
+# Reading an entry updates its modification time, and evict() removes the least
+# recently used entries once the directory is over its size limit.
+
+import atomic_file
+import dc_table
+import hashlib
+import json
+import os
+
+# bump whenever a change to the search would change the results stored for a key
+result_format_version = 3
+
+default_max_bytes = 64 << 20
+
+def default_cache_dir() :
+    return os.path.join( dc_table.default_cache_dir(), "positions" )
+
+def position_key( *parts ) :
+    '''The hex SHA1 identifying an entry; parts must be JSON-serializable'''
+    description = json.dumps( [ result_format_version ] + list( parts ), sort_keys=True )
+    return hashlib.sha1( description.encode( "ascii" ) ).hexdigest()
+
+def entry_path( key, cache_dir ) :
+    return os.path.join( cache_dir, key + ".json" )
+
+def read_results( key, cache_dir ) :
+    '''The results stored for key, or None if there are none (or they can't be read)'''
+    fname = entry_path( key, cache_dir )
+    try :
+        with open( fname ) as f :
+            results = json.load( f )
+    except ( IOError, OSError, ValueError ) :
+        return None
+    try :
+        os.utime( fname, None )
+    except OSError :
+        pass
+    return results
+
+def write_results( key, results, cache_dir ) :
+    '''Store the results for key atomically; a cache directory that cannot be written is ignored'''
+    try :
+        if not os.path.isdir( cache_dir ) :
+            os.makedirs( cache_dir )
+        atomic_file.write_atomically( entry_path( key, cache_dir ), lambda f : json.dump( results, f ) )
+    except ( IOError, OSError ) :
+        pass
+
+def evict( cache_dir, max_bytes ) :
+    '''Remove the least recently used entries until the entries take no more than max_bytes'''
+    try :
+        fnames = os.listdir( cache_dir )
+    except OSError :
+        return
+    entries = []
+    for fname in fnames :
+        if not fname.endswith( ".json" ) : continue
+        path = os.path.join( cache_dir, fname )
+        try :
+            st = os.stat( path )
+        except OSError :
+            continue
+        entries.append( ( st.st_mtime, st.st_size, path ) )
+    total = sum( [ size for mtime, size, path in entries ] )
+    entries.sort()
+    for mtime, size, path in entries :
+        if total <= max_bytes : break
+        try :
+            os.remove( path )
+        except OSError :
+            pass
+        total -= size
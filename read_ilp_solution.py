@@ -50,7 +50,7 @@ if __name__ == "__main__" :
                 # we found our active DC!
                 #print cols
                 dc = dcs[ last_dc ]
-                print "Active dc:", dc[ 0 ], "aas:", dc[1]
+                print( "Active dc:", dc[ 0 ], "aas:", dc[1] )
             found_dc = False
             last_dc = ""
         else :
@@ -58,5 +58,5 @@ if __name__ == "__main__" :
             if cols[1] == "1" :
                 # we found our active DC!
                 dc = dcs[ last_dc ]
-                print "Active dc:", dc[ 0 ], "aas:", dc[1]
+                print( "Active dc:", dc[ 0 ], "aas:", dc[1] )
             found_dc = False
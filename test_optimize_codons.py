@@ -0,0 +1,592 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2014 Andrew Leaver-Fay, Tim Jacobs, Hayretin Yumerefendi, Brian Kuhlman.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+#     in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+# Property checks on small random inputs: the combination engines against
+# exhaustive_search, the modes of the positional dynamic program against a brute-force
+# search over whole libraries, and the table, cache and checkpoint plumbing against
+# the straightforward code it replaced.  Run with python -m pytest.
+
+import combination_search
+import dc_table
+import itertools
+import jit_kernels
+import math
+import multiprocessing
+import numpy
+import optimize_codons
+import optimize_codons_2
+import pytest
+import random
+
+seeds = range( 8 )
+
+def random_position( rng, n_useful, union ) :
+    """A random evaluator and useful-codon tables: ( masks, diversities, evaluator, n_errors, codon_masks )"""
+    aa_counts = [ 0 ] * 21
+    for aa in rng.sample( range( 21 ), 8 ) :
+        aa_counts[ aa ] = rng.randint( 1, 9 )
+    aa_counts[ rng.choice( [ aa for aa in range( 21 ) if aa_counts[ aa ] == 0 ] ) ] = -3
+    required = [ False ] * 21
+    forbidden = [ False ] * 21
+    forbidden[ rng.choice( [ aa for aa in range( 21 ) if aa_counts[ aa ] == 0 ] ) ] = True
+    evaluator = optimize_codons.PositionErrorEvaluator( aa_counts, required, forbidden )
+    masks = [ sum( [ 1 << aa for aa in rng.sample( range( 21 ), rng.randint( 1, 4 ) ) ] ) for k in range( n_useful ) ]
+    codon_masks = [ sum( [ 1 << c for c in rng.sample( range( 64 ), rng.randint( 1, 6 ) ) ] ) for k in range( n_useful ) ]
+    if union :
+        diversities = [ combination_search.popcount( codon_mask ) for codon_mask in codon_masks ]
+    else :
+        diversities = [ rng.randint( 1, 12 ) for k in range( n_useful ) ]
+        codon_masks = None
+    n_errors = sum( [ abs( count ) for count in aa_counts ] ) + 1
+    return masks, diversities, evaluator, n_errors, codon_masks
+
+def combination_error_and_diversity( masks, diversities, evaluator, combo, codon_masks ) :
+    aa_mask = 0
+    union = 0
+    for k in combo :
+        aa_mask |= masks[ k ]
+        if codon_masks is not None :
+            union |= codon_masks[ k ]
+    diversity = combination_search.popcount( union ) if codon_masks is not None else sum( [ diversities[ k ] for k in combo ] )
+    return evaluator.low_errors[ aa_mask & 2047 ] + evaluator.high_errors[ aa_mask >> 11 ], diversity
+
+def naive_search( masks, diversities, evaluator, n_dcs, n_errors, codon_masks ) :
+    """exhaustive_search as a plain loop over itertools.combinations, scoring each combination from scratch"""
+    best_diversity = [ 0 ] * n_errors
+    best_combo = [ None ] * n_errors
+    for combo in itertools.combinations( range( len( masks ) ), n_dcs ) :
+        error, diversity = combination_error_and_diversity( masks, diversities, evaluator, combo, codon_masks )
+        if 0 <= error < n_errors and ( best_diversity[ error ] == 0 or diversity < best_diversity[ error ] ) :
+            best_diversity[ error ] = diversity
+            best_combo[ error ] = combo
+    return best_diversity, best_combo
+
+def check_engine_matches_exhaustive_search( engine_name, seed, union ) :
+    rng = random.Random( seed )
+    masks, diversities, evaluator, n_errors, codon_masks = random_position( rng, rng.randint( 6, 14 ), union )
+    for n_dcs in range( 1, 4 ) :
+        assert combination_search.engines[ engine_name ]( masks, diversities, evaluator, n_dcs, n_errors, codon_masks ) == \
+            combination_search.exhaustive_search( masks, diversities, evaluator, n_dcs, n_errors, codon_masks )
+
+@pytest.mark.parametrize( "union", [ False, True ] )
+@pytest.mark.parametrize( "seed", seeds )
+def test_branch_and_bound_matches_exhaustive_search( seed, union ) :
+    check_engine_matches_exhaustive_search( "branch_and_bound", seed, union )
+
+@pytest.mark.parametrize( "union", [ False, True ] )
+@pytest.mark.parametrize( "seed", seeds )
+def test_mask_dp_matches_exhaustive_search( seed, union ) :
+    check_engine_matches_exhaustive_search( "mask_dp", seed, union )
+    rng = random.Random( seed )
+    masks, diversities, evaluator, n_errors, codon_masks = random_position( rng, rng.randint( 6, 14 ), union )
+    results = combination_search.mask_dp_search_all_levels( masks, diversities, evaluator, 3, n_errors, codon_masks )
+    for n_dcs in range( 1, 4 ) :
+        assert results[ n_dcs ] == combination_search.exhaustive_search( masks, diversities, evaluator, n_dcs, n_errors, codon_masks )
+
+@pytest.mark.parametrize( "seed", seeds )
+def test_exhaustive_search_matches_a_naive_search( seed ) :
+    rng = random.Random( seed )
+    masks, diversities, evaluator, n_errors, codon_masks = random_position( rng, rng.randint( 6, 14 ), False )
+    for n_dcs in range( 1, 4 ) :
+        assert combination_search.exhaustive_search( masks, diversities, evaluator, n_dcs, n_errors ) == \
+            naive_search( masks, diversities, evaluator, n_dcs, n_errors, None )
+
+@pytest.mark.parametrize( "union", [ False, True ] )
+@pytest.mark.parametrize( "seed", seeds )
+def test_batched_search_matches_exhaustive_search( seed, union ) :
+    check_engine_matches_exhaustive_search( "batched", seed, union )
+
+@pytest.mark.parametrize( "seed", seeds )
+def test_union_diversity_matches_a_naive_search( seed ) :
+    rng = random.Random( seed )
+    masks, diversities, evaluator, n_errors, codon_masks = random_position( rng, rng.randint( 6, 14 ), True )
+    for n_dcs in range( 1, 4 ) :
+        assert combination_search.exhaustive_search( masks, diversities, evaluator, n_dcs, n_errors, codon_masks ) == \
+            naive_search( masks, diversities, evaluator, n_dcs, n_errors, codon_masks )
+
+@pytest.mark.parametrize( "seed", seeds )
+def test_rank_ranges_merge_to_exhaustive_search( seed ) :
+    rng = random.Random( seed )
+    masks, diversities, evaluator, n_errors, codon_masks = random_position( rng, 12, seed % 2 == 1 )
+    for n_dcs in range( 1, 4 ) :
+        n_ranks = combination_search.n_combinations( len( masks ), n_dcs )
+        ranked_results = [ combination_search.exhaustive_search_ranks( masks, diversities, evaluator, n_dcs, n_errors, begin, end, codon_masks )
+                           for begin, end in combination_search.rank_ranges( n_ranks, 7 ) ]
+        assert combination_search.merge_ranked_results( ranked_results, n_errors ) == \
+            combination_search.exhaustive_search( masks, diversities, evaluator, n_dcs, n_errors, codon_masks )
+
+@pytest.mark.parametrize( "union", [ False, True ] )
+@pytest.mark.parametrize( "seed", seeds )
+def test_jit_kernels_match_the_python_loops( seed, union, monkeypatch ) :
+    # without numba the kernels are plain Python functions, run here in place of the compiled ones
+    monkeypatch.setattr( jit_kernels, "enabled", True )
+    check_engine_matches_exhaustive_search( "jit", seed, union )
+    rng = random.Random( seed )
+    previous = numpy.array( [ rng.choice( [ numpy.inf, rng.randint( 0, 9 ) ] ) for j in range( 30 ) ] )
+    position = numpy.array( [ rng.choice( [ numpy.inf, rng.randint( 0, 9 ) ] ) for k in range( 8 ) ] )
+    current, traceback_k = numpy.empty( 30 ), numpy.empty( 30, dtype=numpy.int32 )
+    jit_kernels.dp_layer_kernel( previous, position, current, traceback_k )
+    expected, expected_k = numpy.full( 30, numpy.inf ), numpy.full( 30, -1, dtype=numpy.int32 )
+    optimize_codons.min_plus_convolve( previous, position, expected, expected_k )
+    assert current.tolist() == expected.tolist()
+    assert traceback_k.tolist() == expected_k.tolist()
+
+@pytest.mark.parametrize( "union", [ False, True ] )
+@pytest.mark.parametrize( "seed", seeds )
+def test_beam_search_never_beats_the_exact_tables( seed, union ) :
+    rng = random.Random( seed )
+    masks, diversities, evaluator, n_errors, codon_masks = random_position( rng, 12, union )
+    results, n_evaluations, complete = combination_search.beam_search( masks, diversities, evaluator, 3, n_errors, codon_masks, 4 )
+    assert complete
+    assert results[1] == combination_search.exhaustive_search( masks, diversities, evaluator, 1, n_errors, codon_masks )
+    for n_dcs in range( 2, 4 ) :
+        exact_diversity, exact_combo = combination_search.exhaustive_search( masks, diversities, evaluator, n_dcs, n_errors, codon_masks )
+        best_diversity, best_combo = results[ n_dcs ]
+        for error in range( n_errors ) :
+            if best_diversity[ error ] == 0 : continue
+            assert len( set( best_combo[ error ] ) ) == n_dcs
+            assert combination_error_and_diversity( masks, diversities, evaluator, best_combo[ error ], codon_masks ) == ( error, best_diversity[ error ] )
+            assert best_diversity[ error ] >= exact_diversity[ error ] > 0
+
+def random_library( rng, n_positions, max_per_position_error, n_reachable ) :
+    """
+    An AALibrary holding only random divmin_for_error tables.  The log diversities are whole numbers,
+    so sums are exact in any order and precision and caps can be put between them.
+    """
+    library = optimize_codons.AALibrary()
+    library.n_positions = n_positions
+    library.max_per_position_error = max_per_position_error
+    library.divmin_for_error = []
+    for i in range( n_positions ) :
+        divmin = [ ( library.infinity, 0 ) ] * ( max_per_position_error + 1 )
+        for error in rng.sample( range( max_per_position_error + 1 ), n_reachable ) :
+            divmin[ error ] = ( float( rng.randint( 0, 9 ) ), 1 )
+        library.divmin_for_error.append( divmin )
+    return library
+
+def reachable( library, i ) :
+    return [ ( error, log_diversity ) for error, ( log_diversity, n_dcs ) in enumerate( library.divmin_for_error[i] ) if n_dcs != 0 ]
+
+def brute_force_smallest_error( library, diversity_cap ) :
+    """The smallest total error of any library under the cap, or None"""
+    best = None
+    for choice in itertools.product( *[ reachable( library, i ) for i in range( library.n_positions ) ] ) :
+        if sum( [ log_diversity for error, log_diversity in choice ] ) < math.log( diversity_cap ) :
+            error = sum( [ error for error, log_diversity in choice ] )
+            if best is None or error < best :
+                best = error
+    return best
+
+def brute_force_frontier( library ) :
+    """The ( error, smallest log diversity ) pairs no other library beats, in order of increasing error"""
+    smallest = {}
+    for choice in itertools.product( *[ reachable( library, i ) for i in range( library.n_positions ) ] ) :
+        error = sum( [ error for error, log_diversity in choice ] )
+        log_diversity = sum( [ log_diversity for error, log_diversity in choice ] )
+        smallest[ error ] = min( smallest.get( error, log_diversity ), log_diversity )
+    frontier = []
+    for error in sorted( smallest ) :
+        if not frontier or smallest[ error ] < frontier[-1][1] :
+            frontier.append( ( error, smallest[ error ] ) )
+    return frontier
+
+def library_log_diversity( library, error_traceback ) :
+    return sum( [ library.divmin_for_error[i][ error_traceback[i] ][0] for i in range( library.n_positions ) ] )
+
+def check_optimal( library, error_traceback, diversity_cap ) :
+    expected = brute_force_smallest_error( library, diversity_cap )
+    if expected is None :
+        assert error_traceback is None
+        return
+    assert sum( error_traceback ) == expected
+    assert library_log_diversity( library, error_traceback ) < math.log( diversity_cap )
+
+dp_modes = {
+    "dense" : {},
+    "low_memory" : { "low_memory_dp" : True },
+    "tree" : { "parallel_dp" : True, "n_processes" : 2 },
+    }
+
+@pytest.mark.parametrize( "mode", sorted( dp_modes ) )
+@pytest.mark.parametrize( "seed", seeds )
+def test_dp_modes_match_brute_force( seed, mode ) :
+    rng = random.Random( seed )
+    library = random_library( rng, rng.randint( 1, 5 ), 6, 3 )
+    for name, value in dp_modes[ mode ].items() :
+        setattr( library, name, value )
+    for cap_exponent in range( 0, 9 * library.n_positions + 2, 3 ) :
+        diversity_cap = math.exp( cap_exponent + 0.5 )
+        check_optimal( library, library.optimize_library( diversity_cap ), diversity_cap )
+
+@pytest.mark.parametrize( "seed", seeds )
+def test_frontier_matches_brute_force( seed ) :
+    rng = random.Random( seed )
+    library = random_library( rng, rng.randint( 1, 5 ), 6, 3 )
+    errors, log_diversities = library.optimize_library_frontier()
+    assert list( zip( errors.tolist(), log_diversities.tolist() ) ) == brute_force_frontier( library )
+    for point in range( len( errors ) ) :
+        error_traceback = library.frontier_traceback( point )
+        assert sum( error_traceback ) == errors[ point ]
+        assert library_log_diversity( library, error_traceback ) == log_diversities[ point ]
+    for cap_exponent in range( 0, 9 * library.n_positions + 2, 3 ) :
+        diversity_cap = math.exp( cap_exponent + 0.5 )
+        check_optimal( library, library.frontier_traceback_under_cap( diversity_cap ), diversity_cap )
+
+@pytest.mark.parametrize( "seed", seeds )
+def test_low_memory_dp_respects_the_cap_in_float64( seed ) :
+    # log diversities that float32 cannot hold exactly, and caps right at a library's float64 log diversity
+    rng = random.Random( seed )
+    for trial in range( 20 ) :
+        library = random_library( rng, rng.randint( 2, 6 ), 6, 3 )
+        for divmin in library.divmin_for_error :
+            for error in range( len( divmin ) ) :
+                if divmin[ error ][1] != 0 :
+                    divmin[ error ] = ( math.log( rng.randint( 1, 40 ) ) + rng.random() * 1e-7, 1 )
+        library.low_memory_dp = True
+        diversity_cap = math.exp( library_log_diversity( library, library.optimize_library( 1e300 ) ) )
+        for diversity_cap in ( diversity_cap, math.nextafter( diversity_cap, 0 ), math.nextafter( diversity_cap, math.inf ) ) :
+            error_traceback = library.optimize_library( diversity_cap )
+            if error_traceback is not None :
+                assert library_log_diversity( library, error_traceback ) < math.log( diversity_cap )
+
+@pytest.mark.parametrize( "epsilon", [ 0.01, 0.05, 0.1, 0.3, 0.5, 1.0 ] )
+@pytest.mark.parametrize( "seed", seeds )
+def test_approximate_dp_is_within_its_bound( seed, epsilon ) :
+    rng = random.Random( seed )
+    library = random_library( rng, rng.randint( 2, 5 ), 400, 5 )
+    for cap_exponent in range( 0, 9 * library.n_positions + 2, 4 ) :
+        diversity_cap = math.exp( cap_exponent + 0.5 )
+        library.approximation_epsilon = None
+        exact = library.optimize_library( diversity_cap )
+        library.approximation_epsilon = epsilon
+        approximate = library.optimize_library( diversity_cap )
+        if exact is None :
+            assert approximate is None
+            continue
+        assert library_log_diversity( library, approximate ) < math.log( diversity_cap )
+        assert sum( approximate ) <= library.approximation_bound * sum( exact ) + 1e-9
+        assert library.approximation_bound <= 1 + epsilon + 1e-12
+
+def test_approximate_dp_stops_after_two_passes() :
+    # a library whose second pass met its bound only up to a rounding error, which once made the pass repeat forever
+    rng = random.Random( 6 )
+    library = random_library( rng, rng.randint( 2, 6 ), rng.choice( [ 50, 100, 400, 1000 ] ), rng.randint( 2, 6 ) )
+    diversity_cap = math.exp( 16.5 )
+    exact = library.optimize_library( diversity_cap )
+    bucket_widths = []
+    bucketed_dp = library.bucketed_dp
+    def counted_bucketed_dp( positions, bucket_width, diversity_cap ) :
+        bucket_widths.append( bucket_width )
+        assert len( bucket_widths ) <= 2
+        return bucketed_dp( positions, bucket_width, diversity_cap )
+    library.bucketed_dp = counted_bucketed_dp
+    library.approximation_epsilon = 0.7
+    approximate = library.optimize_library( diversity_cap )
+    assert len( bucket_widths ) == 2
+    assert library_log_diversity( library, approximate ) < math.log( diversity_cap )
+    assert sum( approximate ) <= 1.7 * sum( exact )
+
+def test_dc_table_round_trips_through_its_file( tmp_path ) :
+    library = optimize_codons.AALibrary()
+    table = library.build_degenerate_codon_table()
+    digest = dc_table.genetic_code_digest( library.gcmapper.mapper )
+    fname = dc_table.table_path( digest, str( tmp_path ) )
+    dc_table.write_table( fname, digest, table )
+    read = dc_table.read_table( fname, digest )
+    assert list( read.aa_masks ) == table.aa_masks
+    assert list( read.codon_masks ) == table.codon_masks
+    assert list( read.diversities ) == table.diversities
+    assert dc_table.read_table( fname, dc_table.genetic_code_digest( list( reversed( library.gcmapper.mapper ) ) ) ) is None
+    with open( fname, "ab" ) as f :
+        f.write( b"\0" )
+    assert dc_table.read_table( fname, digest ) is None
+    assert dc_table.read_table( str( tmp_path / "missing.bin" ), digest ) is None
+
+def test_degenerate_codon_matches_the_list_based_one() :
+    lex = optimize_codons.LexicographicalIterator( [ 15, 15, 15 ] )
+    dc = optimize_codons.DegenerateCodon()
+    old_dc = optimize_codons_2.DegenerateCodon()
+    index = 0
+    while not lex.at_end :
+        dc.set_from_lex( lex )
+        old_dc.set_from_lex( lex )
+        assert dc.pos == old_dc.pos
+        assert dc.which == [ sorted( which ) for which in old_dc.which ]
+        assert dc.count_pos == old_dc.count_pos
+        assert dc.codon_string() == old_dc.codon_string()
+        assert dc.diversity() == old_dc.diversity()
+        assert dc.log_diversity() == pytest.approx( old_dc.log_diversity() )
+        codon_lex = optimize_codons_2.LexicographicalIterator( old_dc.count_pos )
+        old_codons = []
+        while not codon_lex.at_end :
+            old_codons.append( old_dc.index_from_lex( codon_lex ) )
+            codon_lex.increment()
+        assert sorted( dc.codons() ) == sorted( old_codons )
+        assert dc.index() == index
+        dc.set_from_index( index )
+        assert dc.codon_string() == old_dc.codon_string()
+        index += 1
+        lex.increment()
+    assert index == 3375
+
+aa_names = [ optimize_codons.aastr_for_integer( i ) for i in range( 21 ) ]
+
+def write_library( fname, max_dcs, columns ) :
+    """Write a library file; columns[ j ] maps amino-acid names to position j's cells ( a count, "*" or "!" )"""
+    n_positions = len( columns )
+    lines = [ "pos," + ",".join( [ str( j + 1 ) for j in range( n_positions ) ] ),
+              "stretch," + ",".join( [ "|" ] + [ "" ] * ( n_positions - 1 ) ),
+              "maxdcs," + ",".join( [ str( n ) for n in max_dcs ] ) ]
+    for name in aa_names :
+        lines.append( name + "," + ",".join( [ str( column.get( name, 0 ) ) for column in columns ] ) )
+    with open( fname, "w" ) as f :
+        f.write( "\n".join( lines ) + "\n" )
+
+def loaded_library( tmp_path, max_dcs, columns, **options ) :
+    """An AALibrary for the columns, with options set and its degenerate-codon tables built"""
+    fname = str( tmp_path / "library.csv" )
+    write_library( fname, max_dcs, columns )
+    library = optimize_codons.AALibrary()
+    library.use_position_cache = False
+    for name, value in options.items() :
+        setattr( library, name, value )
+    library.load_library( fname )
+    library.enumerate_aas_for_all_degenerate_codons()
+    return library
+
+def searched_library( tmp_path, max_dcs, columns, **options ) :
+    """loaded_library with its per-position tables computed"""
+    library = loaded_library( tmp_path, max_dcs, columns, **options )
+    library.compute_smallest_diversity_for_all_errors()
+    return library
+
+def random_columns( rng, n_positions ) :
+    """Random positions with positive and negative counts and a few required and forbidden amino acids"""
+    columns = []
+    for j in range( n_positions ) :
+        column = {}
+        for name in rng.sample( aa_names, rng.randint( 2, 6 ) ) :
+            column[ name ] = rng.choice( [ rng.randint( -6, -1 ), rng.randint( 1, 12 ), rng.randint( 1, 12 ) ] )
+        for name in rng.sample( [ name for name in aa_names if name not in column ], 2 ) :
+            column[ name ] = rng.choice( [ "*", "!", "!" ] )
+        columns.append( column )
+    return columns
+
+def smallest_errors( library, caps ) :
+    smallest = []
+    for diversity_cap in caps :
+        error_traceback = library.optimize_library( diversity_cap )
+        smallest.append( None if error_traceback is None else sum( error_traceback ) )
+    return smallest
+
+@pytest.mark.parametrize( "seed", seeds )
+def test_pruning_keeps_the_optimum( seed, tmp_path ) :
+    rng = random.Random( seed )
+    if seed == 0 :
+        max_dcs, columns = [ 2 ], [ { "G" : -2, "I" : 9, "R" : 5 } ]
+    else :
+        max_dcs, columns = [ rng.randint( 1, 3 ) for j in range( 2 ) ], random_columns( rng, 2 )
+    caps = [ math.exp( exponent ) for exponent in range( 1, 14 ) ]
+    pruned = searched_library( tmp_path, max_dcs, columns )
+    kept = searched_library( tmp_path, max_dcs, columns, prune_dominated=False )
+    assert smallest_errors( pruned, caps ) == smallest_errors( kept, caps )
+
+@pytest.mark.parametrize( "seed", seeds )
+def test_useful_codons_match_a_scalar_loop( seed, tmp_path ) :
+    rng = random.Random( seed )
+    library = loaded_library( tmp_path, [ 1, 1, 1 ], random_columns( rng, 3 ) )
+    library.find_useful_codons()
+    for pos in range( library.n_positions ) :
+        # the lowest-diversity, then earliest, codon for every ( error, useful-aa signature ) pair
+        best = {}
+        for dc in range( 3375 ) :
+            aas = library.aas_for_dc[ dc ]
+            error = library.error_given_aas_for_pos_ignore_req( pos, aas )
+            if error == library.infinity : continue
+            key = ( error, library.useful_aaind_for_pos( aas, pos ) )
+            if key not in best or library.diversities_for_dc[ dc ] < best[ key ][0] :
+                best[ key ] = ( library.diversities_for_dc[ dc ], dc )
+        assert library.useful_codons[ pos ] == sorted( [ dc for diversity, dc in best.values() ] )
+
+@pytest.mark.parametrize( "seed", seeds )
+def test_evaluator_matches_error_given_aas_for_pos( seed, tmp_path ) :
+    rng = random.Random( seed )
+    library = loaded_library( tmp_path, [ 1, 1, 1 ], random_columns( rng, 3 ) )
+    for pos in range( library.n_positions ) :
+        for k in range( 2000 ) :
+            aa_mask = rng.getrandbits( 21 )
+            aas = [ ( aa_mask >> i ) & 1 == 1 for i in range( 21 ) ]
+            assert library.error_given_aa_mask_for_pos( pos, aa_mask ) == library.error_given_aas_for_pos( pos, aas )
+
+def test_aa_mask_classes_match_a_dictionary_grouping() :
+    library = optimize_codons.AALibrary()
+    library.enumerate_aas_for_all_degenerate_codons()
+    library.group_degenerate_codons_by_aa_mask()
+    dcs_for_mask = {}
+    for dc in range( 3375 ) :
+        dcs_for_mask.setdefault( library.aa_masks_for_dc[ dc ], [] ).append( dc )
+    assert library.distinct_aa_masks.tolist() == sorted( dcs_for_mask )
+    for aa_class, mask in enumerate( sorted( dcs_for_mask ) ) :
+        dcs = dcs_for_mask[ mask ]
+        min_diversity = min( [ library.diversities_for_dc[ dc ] for dc in dcs ] )
+        ties = [ dc for dc in dcs if library.diversities_for_dc[ dc ] == min_diversity ]
+        assert library.min_diversity_for_aa_mask_class[ aa_class ] == min_diversity
+        assert library.representative_dc_for_aa_mask_class[ aa_class ] == ties[0]
+        for dc in dcs :
+            assert library.aa_mask_class_for_dc[ dc ] == aa_class
+            assert library.tied_codons_for_dc( dc ) == ties
+            assert library.aas_for_dc[ dc ] is library.aas_for_dc[ dcs[0] ]
+
+def searched_positions( library ) :
+    """Run compute_smallest_diversity_for_all_errors, returning the positions it searched rather than read back"""
+    searched = []
+    search_in_order = library.smallest_diversity_combinations_in_order
+    def recorded_search_in_order( positions, in_progress=None ) :
+        searched.extend( positions )
+        return search_in_order( positions, in_progress )
+    library.smallest_diversity_combinations_in_order = recorded_search_in_order
+    library.compute_smallest_diversity_for_all_errors()
+    return sorted( searched )
+
+def tables( library ) :
+    return library.divmin_for_error_for_n_dcs, library.codons_for_error_for_n_dcs, library.errors_for_n_dcs_for_position
+
+def test_position_cache_reads_back_unchanged_positions( tmp_path ) :
+    rng = random.Random( 1 )
+    max_dcs, columns = [ 2, 1, 2 ], random_columns( rng, 3 )
+    cache_options = { "use_position_cache" : True, "position_cache_dir" : str( tmp_path / "positions" ) }
+    assert searched_positions( loaded_library( tmp_path, max_dcs, columns, **cache_options ) ) == [ 0, 1, 2 ]
+    library = loaded_library( tmp_path, max_dcs, columns, **cache_options )
+    assert searched_positions( library ) == []
+    assert tables( library ) == tables( searched_library( tmp_path, max_dcs, columns ) )
+
+    # raising one position's counts past every other position's error ceiling leaves the others cached
+    columns[0][ "W" ] = 100
+    library = loaded_library( tmp_path, max_dcs, columns, **cache_options )
+    assert searched_positions( library ) == [ 0 ]
+    assert tables( library ) == tables( searched_library( tmp_path, max_dcs, columns ) )
+
+def test_identical_positions_are_searched_once( tmp_path ) :
+    rng = random.Random( 2 )
+    a, b = random_columns( rng, 2 )
+    library = loaded_library( tmp_path, [ 2, 2, 2, 1 ], [ a, b, a, a ] )
+    assert searched_positions( library ) == [ 0, 1, 3 ]
+    assert library.divmin_for_error_for_n_dcs[2] is library.divmin_for_error_for_n_dcs[0]
+    assert library.useful_codons[2] is library.useful_codons[0]
+    distinct = searched_library( tmp_path, [ 2, 2, 1 ], [ a, b, a ] )
+    for pos, distinct_pos in ( ( 0, 0 ), ( 1, 1 ), ( 2, 0 ), ( 3, 2 ) ) :
+        assert library.useful_codons[ pos ] == distinct.useful_codons[ distinct_pos ]
+        assert library.divmin_for_error[ pos ] == distinct.divmin_for_error[ distinct_pos ]
+
+def test_planner_refuses_or_reduces_dcs_over_the_budget( tmp_path ) :
+    rng = random.Random( 3 )
+    columns = random_columns( rng, 3 )
+    single = loaded_library( tmp_path, [ 1, 1, 1 ], columns )
+    searched_positions( single )
+    budget = sum( single.predicted_work_for_position.values() ) + 1
+    with pytest.raises( optimize_codons.SearchBudgetExceeded ) :
+        searched_library( tmp_path, [ 3, 3, 3 ], columns, search_budget=budget )
+    library = searched_library( tmp_path, [ 3, 3, 3 ], columns, search_budget=budget, over_budget="reduce_dcs" )
+    assert sum( library.predicted_work_for_position.values() ) <= budget
+    assert library.max_dcs_for_pos != [ 3, 3, 3 ]
+
+def test_exhaustive_work_is_split_over_the_pool( tmp_path, monkeypatch ) :
+    monkeypatch.setattr( optimize_codons, "combinations_per_shard", 4 )
+    rng = random.Random( 4 )
+    max_dcs, columns = [ 3, 2 ], random_columns( rng, 2 )
+    alone = searched_library( tmp_path, max_dcs, columns, combination_engine="exhaustive" )
+    pooled = searched_library( tmp_path, max_dcs, columns, combination_engine="exhaustive", n_processes=3 )
+    assert tables( pooled ) == tables( alone )
+    for pos in range( 2 ) :
+        n_useful = len( alone.useful_codons[ pos ] )
+        n_ranks = [ combination_search.n_combinations( n_useful, j ) for j in range( max_dcs[ pos ] + 1 ) ]
+        n_ranges = [ max( 1, min( 3, ( n + 3 ) // 4 ) ) for n in n_ranks ]
+        assert alone.predicted_work_for_position[ pos ] == sum( n_ranks[1:] )
+        assert pooled.predicted_work_for_position[ pos ] == sum( [ n_ranks[j] / n_ranges[j] for j in range( 1, max_dcs[ pos ] + 1 ) ] )
+
+class Interrupted( Exception ) :
+    pass
+
+def searched_ranks( library, n_shards=None ) :
+    """
+    Run compute_smallest_diversity_for_all_errors, returning the ranges of combination ranks it searched;
+    with n_shards, it is interrupted by raising Interrupted once that many have been searched
+    """
+    searched = []
+    search_ranks = library.smallest_diversity_combinations_for_ranks
+    def recorded_search_ranks( pos, n_dcs, begin, end ) :
+        if len( searched ) == n_shards :
+            raise Interrupted()
+        searched.append( ( pos, n_dcs, begin, end ) )
+        return search_ranks( pos, n_dcs, begin, end )
+    library.smallest_diversity_combinations_for_ranks = recorded_search_ranks
+    library.compute_smallest_diversity_for_all_errors()
+    return searched
+
+def test_checkpointed_search_resumes_to_the_same_tables( tmp_path, monkeypatch ) :
+    rng = random.Random( 5 )
+    max_dcs, columns = [ 3, 2, 1 ], random_columns( rng, 3 )
+    expected = searched_library( tmp_path, max_dcs, columns )
+    options = { "checkpoint_file" : str( tmp_path / "checkpoint.json" ), "checkpoint_interval" : 0.0 }
+
+    # positions that fit in a shard keep the engine they would have had without checkpoints
+    library = searched_library( tmp_path, max_dcs, columns, **options )
+    assert library.engine_for_position == expected.engine_for_position
+    assert tables( library ) == tables( expected )
+
+    # with small shards, the resumed run picks up from the shard after the last one searched
+    monkeypatch.setattr( optimize_codons, "combinations_per_shard", 4 )
+    all_ranks = searched_ranks( loaded_library( tmp_path, max_dcs, columns, **options ) )
+    for n_shards in ( 1, 5, 20, len( all_ranks ) - 1 ) :
+        library = loaded_library( tmp_path, max_dcs, columns, **options )
+        with pytest.raises( Interrupted ) :
+            searched_ranks( library, n_shards )
+        assert library.engine_for_position[0] == "exhaustive"
+        resumed = loaded_library( tmp_path, max_dcs, columns, resume=True, **options )
+        assert searched_ranks( resumed ) == all_ranks[ n_shards: ]
+        assert tables( resumed ) == tables( expected )
+
+def test_heuristic_fallback_fits_the_budget( tmp_path ) :
+    rng = random.Random( 6 )
+    max_dcs, columns = [ 3, 3, 2 ], random_columns( rng, 3 )
+    exact = searched_library( tmp_path, max_dcs, columns )
+    n_useful = max( [ len( useful ) for useful in exact.useful_codons ] )
+    budget = 3 * combination_search.relative_costs[ "beam" ] * ( n_useful + 10 )
+    library = searched_library( tmp_path, max_dcs, columns, search_budget=budget, over_budget="heuristic" )
+    assert set( library.engine_for_position.values() ) == set( [ "beam" ] )
+    assert library.heuristic_max_evaluations == 10
+    assert sum( library.predicted_work_for_position.values() ) <= budget
+    for pos in range( 3 ) :
+        assert library.divmin_for_error_for_n_dcs[ pos ][1] == exact.divmin_for_error_for_n_dcs[ pos ][1]
+    with pytest.raises( optimize_codons.SearchBudgetExceeded ) :
+        searched_library( tmp_path, max_dcs, columns, search_budget=budget / ( n_useful + 10 ), over_budget="heuristic" )
+
+@pytest.mark.parametrize( "start_method", multiprocessing.get_all_start_methods() )
+def test_pool_workers_see_the_library_under_any_start_method( start_method, tmp_path, monkeypatch ) :
+    monkeypatch.setattr( multiprocessing, "get_start_method", lambda allow_none=False : start_method )
+    monkeypatch.setattr( multiprocessing, "Pool", multiprocessing.get_context( start_method ).Pool )
+    rng = random.Random( 7 )
+    max_dcs, columns = [ 2, 2, 1 ], random_columns( rng, 3 )
+    alone = searched_library( tmp_path, max_dcs, columns )
+    pooled = searched_library( tmp_path, max_dcs, columns, n_processes=2 )
+    assert tables( pooled ) == tables( alone )
+    assert optimize_codons.pool_library is None